@@ -1,9 +1,21 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
-import re
+import os
+import sys
 import urllib.parse
 
+# backend 配下の共通モジュールを利用する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from common.circuit_breaker import CircuitOpenError
+from common.http_client import get_client
+from common.isbn import canonical_isbn
+from common.openbd import openbd_book
+from common.upstream import UpstreamError
+
+# 接続プールはインスタンスが温まっている間、リクエストをまたいで使い回す
+openbd_client = get_client('openbd')
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # URLパースしてISBNを取得
@@ -16,7 +28,8 @@ class handler(BaseHTTPRequestHandler):
             self.send_error_response(400, 'ISBNパラメータが必要です')
             return
         
-        if len(isbn) < 10:
+        # チェックディジットが合わなければ OpenBD に問い合わせない
+        if canonical_isbn(isbn) is None:
             self.send_error_response(400, 'ISBNが無効です')
             return
         
@@ -28,76 +41,38 @@ class handler(BaseHTTPRequestHandler):
             else:
                 self.send_error_response(404, '書籍が見つかりません')
                 
+        except CircuitOpenError as e:
+            # 上流の障害中は待たずに断る
+            self.send_error_response(
+                503, '書籍情報の取得を一時的に停止しています',
+                headers={'Retry-After': str(int(e.retry_after) + 1)}
+            )
+        except UpstreamError as e:
+            # 「見つからない」とは区別して返す（404 としてキャッシュされないように）
+            print(f"Upstream error: {e}")
+            self.send_error_response(502, '書籍情報の取得に失敗しました')
         except Exception as e:
             self.send_error_response(500, f'サーバーエラー: {str(e)}')
     
     def get_book_by_isbn(self, isbn):
-        """OpenBD APIから書籍情報を取得"""
+        """OpenBD APIから書籍情報を取得（通信・応答のエラーは UpstreamError）"""
+        # ISBN-13 にそろえる
+        cleaned_isbn = canonical_isbn(isbn)
+        
+        # OpenBD APIを呼び出し
+        response = openbd_client.get(f"https://api.openbd.jp/v1/get?isbn={cleaned_isbn}")
+        
         try:
-            # ISBNをクリーニング
-            cleaned_isbn = re.sub(r'[^0-9X]', '', isbn.upper())
-            
-            # OpenBD APIを呼び出し
-            response = requests.get(f"https://api.openbd.jp/v1/get?isbn={cleaned_isbn}", timeout=10)
-            response.raise_for_status()
-            
             data = response.json()
-            
-            if data and len(data) > 0 and data[0] is not None:
-                book_info = data[0]
-                summary = book_info.get('summary', {})
-                onix = book_info.get('onix', {})
-                
-                # タイトル取得
-                title = summary.get('title', '')
-                if not title and onix:
-                    try:
-                        title_detail = onix.get('DescriptiveDetail', {}).get('TitleDetail', {})
-                        title_element = title_detail.get('TitleElement', {})
-                        title_text = title_element.get('TitleText', {})
-                        title = title_text.get('content', '')
-                    except:
-                        pass
-                
-                # 著者取得
-                author = summary.get('author', '')
-                if not author and onix:
-                    try:
-                        contributors = onix.get('DescriptiveDetail', {}).get('Contributor', [])
-                        if isinstance(contributors, list) and len(contributors) > 0:
-                            person_name = contributors[0].get('PersonName', {})
-                            if isinstance(person_name, dict):
-                                author = person_name.get('content', '')
-                            elif isinstance(person_name, str):
-                                author = person_name
-                    except:
-                        pass
-                
-                # ページ数取得
-                pages = 0
-                extent = summary.get('extent', '')
-                if extent:
-                    page_match = re.search(r'(\d+)[pページ頁]', extent)
-                    if page_match:
-                        pages = int(page_match.group(1))
-                
-                return {
-                    'isbn': isbn,
-                    'title': title,
-                    'author': author,
-                    'publisher': summary.get('publisher', ''),
-                    'pubdate': summary.get('pubdate', ''),
-                    'totalPages': pages,
-                    'coverImage': summary.get('cover', ''),
-                    'currentPage': 0,
-                    'readingTime': 0
-                }
-            
-            return None
-            
-        except Exception as e:
+        except ValueError as e:
             print(f"Error fetching book data: {e}")
-            return None
+            raise UpstreamError('openbd', e)
+        
+        if data and len(data) > 0 and data[0] is not None:
+            # summary を優先し、空の項目は ONIX から補う（common/openbd.py）
+            return openbd_book(cleaned_isbn, data[0])
+        
+        return None
     
     def send_json_response(self, data):
         self.send_response(200)
@@ -106,10 +81,12 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
     
-    def send_error_response(self, status_code, message):
+    def send_error_response(self, status_code, message, headers=None):
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         error_data = {'error': message}
         self.wfile.write(json.dumps(error_data, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
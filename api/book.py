@@ -1,12 +1,24 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import os
+import sys
 import json
-import requests
 import xml.etree.ElementTree as ET
 from urllib.parse import quote
-import re
+import time
 from datetime import datetime
 
+# backend 配下の共通モジュールを利用する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from common.circuit_breaker import CircuitOpenError
+from common.http_client import get_client
+from common.isbn import canonical_isbn, parse_isbn
+from common.openbd import openbd_book
+from common.singleflight import SingleFlight
+from common.upstream import UpstreamError
+from storage import create_catalogue, create_metadata_cache, create_negative_cache
+
 app = Flask(__name__)
 CORS(app)
 
@@ -14,23 +26,61 @@ CORS(app)
 class OpenBDApi:
     def __init__(self):
         self.base_url = "https://api.openbd.jp/v1/get"
+        # サーバーレスでは /tmp に置き、同じインスタンスのコールドスタート後も再利用する
+        self.cache = create_metadata_cache(os.getenv('BOOK_CACHE_FILE', '/tmp/isbn_cache.db'))
+        self.negative_cache = create_negative_cache(os.getenv('BOOK_CACHE_FILE', '/tmp/isbn_cache.db'))
+        # デプロイに同梱したローカルの書誌索引（BOOK_CATALOGUE_FILE を指定したときだけ使う）
+        self.catalogue = create_catalogue(os.getenv('BOOK_CATALOGUE_FILE', ''))
+        self.client = get_client('openbd')
+        # 同じ ISBN の検索が同時に来たら、OpenBD への問い合わせは1回だけにする
+        self.singleflight = SingleFlight()
     
     def get_book_by_isbn(self, isbn):
         cleaned_isbn = self.clean_isbn(isbn)
         print(f"Searching for ISBN: {cleaned_isbn}")
         
-        book_data = self.get_from_openbd(cleaned_isbn)
+        cached = self.cache.get(cleaned_isbn)
+        if cached is not None:
+            return dict(cached)
+        local = self.catalogue.get(cleaned_isbn)
+        if local is not None:
+            return local
+        if self.negative_cache.get(cleaned_isbn) is not None:
+            print("Known missing ISBN (negative cache)")
+            return None
+        
+        book_data = self.singleflight.do(cleaned_isbn, self.fetch_book, cleaned_isbn)
+        return dict(book_data) if book_data else book_data
+    
+    def fetch_book(self, cleaned_isbn):
+        try:
+            book_data = self.get_from_openbd(cleaned_isbn)
+        except UpstreamError as e:
+            # OpenBD が応答しない間は、期限切れでもキャッシュに残っている情報を返す
+            stale = self.cache.get_stale(cleaned_isbn)
+            if stale is None:
+                # 通信エラーは呼び出し元に伝え、キャッシュしない
+                raise
+            print(f"Serving stale metadata: {e}")
+            return stale
+        if book_data:
+            self.cache.set(cleaned_isbn, book_data)
+        else:
+            self.negative_cache.set(cleaned_isbn, {
+                'sources': ['openbd'],
+                'checkedAt': time.time()
+            })
         return book_data
     
     def clean_isbn(self, isbn):
-        cleaned = re.sub(r'[^0-9X]', '', isbn.upper())
+        # ISBN-13 にそろえる（チェックディジットが合わなければ InvalidISBNError）
+        cleaned = parse_isbn(isbn)
         print(f"Cleaned ISBN: {cleaned}")
         return cleaned
     
     def get_from_openbd(self, isbn):
         try:
-            response = requests.get(f"{self.base_url}?isbn={isbn}", timeout=10)
-            response.raise_for_status()
+            response = self.client.get(f"{self.base_url}?isbn={isbn}")
             
             data = response.json()
             print(f"OpenBD API response length: {len(data) if data else 0}")
@@ -38,106 +88,15 @@ class OpenBDApi:
             if data and len(data) > 0 and data[0] is not None:
                 book_info = data[0]
                 
-                summary = book_info.get('summary', {})
-                onix = book_info.get('onix', {})
-                
-                title = self.extract_title(onix, summary)
-                author = self.extract_author(onix, summary)
-                publisher = self.extract_publisher(onix, summary)
-                total_pages = self.extract_pages(onix, summary)
-                pubdate = self.extract_pubdate(onix, summary)
-                cover_image = self.extract_cover_image(onix, summary)
-                
-                result = {
-                    'isbn': isbn,
-                    'title': title,
-                    'author': author,
-                    'publisher': publisher,
-                    'pubdate': pubdate,
-                    'totalPages': total_pages,
-                    'coverImage': cover_image,
-                    'currentPage': 0,
-                    'readingTime': 0
-                }
-                
-                print(f"Final result: {result}")
-                return result
+                # summary を優先し、空の項目は ONIX から補う（common/openbd.py）
+                return openbd_book(isbn, book_info)
             else:
                 print("No book data found in OpenBD response")
                 return None
                 
-        except Exception as e:
+        except ValueError as e:
             print(f"OpenBD API error: {e}")
-            return None
-    
-    def extract_title(self, onix, summary):
-        title = summary.get('title', '')
-        if title:
-            return title
-        
-        try:
-            title_detail = onix.get('DescriptiveDetail', {}).get('TitleDetail', {})
-            if isinstance(title_detail, dict):
-                title_element = title_detail.get('TitleElement', {})
-                if isinstance(title_element, dict):
-                    title_text = title_element.get('TitleText', {})
-                    if isinstance(title_text, dict):
-                        return title_text.get('content', '')
-        except Exception as e:
-            print(f"Error extracting title: {e}")
-        
-        return ''
-    
-    def extract_author(self, onix, summary):
-        author = summary.get('author', '')
-        if author:
-            return author
-        
-        try:
-            contributors = onix.get('DescriptiveDetail', {}).get('Contributor', [])
-            if isinstance(contributors, list) and len(contributors) > 0:
-                for contributor in contributors:
-                    person_name = contributor.get('PersonName', {})
-                    if isinstance(person_name, dict):
-                        return person_name.get('content', '')
-                    elif isinstance(person_name, str):
-                        return person_name
-        except Exception as e:
-            print(f"Error extracting author: {e}")
-        
-        return ''
-    
-    def extract_publisher(self, onix, summary):
-        return summary.get('publisher', '')
-    
-    def extract_pages(self, onix, summary):
-        extent = summary.get('extent', '')
-        if extent:
-            return self.parse_pages_from_text(extent)
-        return 0
-    
-    def extract_pubdate(self, onix, summary):
-        return summary.get('pubdate', '')
-    
-    def extract_cover_image(self, onix, summary):
-        return summary.get('cover', '')
-    
-    def parse_pages_from_text(self, text):
-        if not text:
-            return 0
-        
-        patterns = [r'(\d+)p\b', r'(\d+)ページ', r'(\d+)頁']
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return int(match.group(1))
-        
-        numbers = re.findall(r'\d+', text)
-        if numbers:
-            return int(numbers[0])
-        
-        return 0
+            raise UpstreamError('openbd', e)
 
 # API インスタンス
 openbd_api = OpenBDApi()
@@ -147,8 +106,9 @@ def get_book_by_isbn(isbn):
     try:
         print(f"=== Book API request for ISBN: {isbn} ===")
         
-        if not isbn or len(isbn) < 10:
-            return jsonify({'error': 'ISBNが無効です'}), 400
+        # チェックディジットが合わなければ OpenBD に問い合わせない
+        if canonical_isbn(isbn) is None:
+            return jsonify({'error': 'ISBNが無効です', 'isbn': isbn}), 400
         
         book_data = openbd_api.get_book_by_isbn(isbn)
         
@@ -162,6 +122,22 @@ def get_book_by_isbn(isbn):
                 'isbn': isbn
             }), 404
             
+    except CircuitOpenError as e:
+        # 上流の障害中は待たずに断る
+        response = jsonify({
+            'error': '書籍情報の取得を一時的に停止しています',
+            'isbn': isbn,
+            'source': e.source
+        })
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response, 503
+    except UpstreamError as e:
+        print(f"=== Upstream error: {e} ===")
+        return jsonify({
+            'error': '書籍情報の取得に失敗しました',
+            'isbn': isbn,
+            'source': e.source
+        }), 502
     except Exception as e:
         print(f"=== Error: {e} ===")
         return jsonify({
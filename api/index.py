@@ -1,319 +1,193 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, redirect, request, stream_with_context
 from flask_cors import CORS
 import sys
 import os
 import json
-import requests
 import xml.etree.ElementTree as ET
 from urllib.parse import quote
-import re
-from datetime import datetime
+import time
+
+# backend 配下の共通モジュールを利用する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from api.book_service import BookService
+from common.async_lookup import AsyncLookup
+from common.book_query import QueryError, library_etag, parse_fields, project
+from common.circuit_breaker import CircuitOpenError, breaker_stats
+from common.covers import CoverService
+from common.http_client import get_client, upstream_stats
+from common.isbn import canonical_isbn, parse_isbn
+from common.library_stats import DEFAULT_TOP, MAX_TOP
+from common.ndjson import export_ndjson, import_ndjson
+from common.openbd import openbd_book
+from common.singleflight import SingleFlight
+from common.upstream import UpstreamError, lookup_report, partition_isbns, stale_or_error
+from models.book_model import BookModel, InvalidBookError
+from models.session_model import SessionModel
+from storage import (
+    DuplicateBookError, create_catalogue, create_cover_cache, create_metadata_cache, create_negative_cache,
+    create_session_log, create_store
+)
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag'])
 
 # OpenBD API クラスを直接定義
 class OpenBDApi:
     def __init__(self):
         self.base_url = "https://api.openbd.jp/v1/get"
+        # サーバーレスでは /tmp に置き、同じインスタンスのコールドスタート後も再利用する
+        self.cache = create_metadata_cache(os.getenv('BOOK_CACHE_FILE', '/tmp/isbn_cache.db'))
+        self.negative_cache = create_negative_cache(os.getenv('BOOK_CACHE_FILE', '/tmp/isbn_cache.db'))
+        # デプロイに同梱したローカルの書誌索引（BOOK_CATALOGUE_FILE を指定したときだけ使う）
+        self.catalogue = create_catalogue(os.getenv('BOOK_CATALOGUE_FILE', ''))
+        # 一括検索で1回の問い合わせに含める ISBN の数
+        self.batch_size = int(os.getenv('OPENBD_BATCH_SIZE', '1000'))
+        # ウォームなインスタンスでは接続を使い回す（タイムアウト・再試行つき）
+        self.client = get_client('openbd')
+        # 同じ ISBN の検索が同時に来たら、OpenBD への問い合わせは1回だけにする
+        self.singleflight = SingleFlight()
     
     def get_book_by_isbn(self, isbn):
         cleaned_isbn = self.clean_isbn(isbn)
         print(f"Searching for ISBN: {cleaned_isbn}")
         
-        book_data = self.get_from_openbd(cleaned_isbn)
+        cached = self.cache.get(cleaned_isbn)
+        if cached is not None:
+            return dict(cached)
+        local = self.catalogue.get(cleaned_isbn)
+        if local is not None:
+            return local
+        if self.negative_cache.get(cleaned_isbn) is not None:
+            print("Known missing ISBN (negative cache)")
+            return None
+        
+        book_data = self.singleflight.do(cleaned_isbn, self.fetch_book, cleaned_isbn)
+        return dict(book_data) if book_data else book_data
+    
+    def fetch_book(self, cleaned_isbn):
+        try:
+            book_data = self.get_from_openbd(cleaned_isbn)
+        except UpstreamError as e:
+            # OpenBD が応答しない間は、期限切れでもキャッシュに残っている情報を返す
+            stale = self.cache.get_stale(cleaned_isbn)
+            if stale is None:
+                # 通信エラーは呼び出し元に伝え、キャッシュしない
+                raise
+            print(f"Serving stale metadata: {e}")
+            return stale
+        if book_data:
+            self.cache.set(cleaned_isbn, book_data)
+        else:
+            self.negative_cache.set(cleaned_isbn, {
+                'sources': ['openbd'],
+                'checkedAt': time.time()
+            })
         return book_data
     
     def clean_isbn(self, isbn):
-        # ISBNから数字とXのみを抽出
-        cleaned = re.sub(r'[^0-9X]', '', isbn.upper())
+        # ISBN-13 にそろえる（チェックディジットが合わなければ InvalidISBNError）
+        cleaned = parse_isbn(isbn)
         print(f"Cleaned ISBN: {cleaned}")
         return cleaned
     
+    def get_books_by_isbns(self, isbns):
+        """複数の ISBN をまとめて検索し、正規化 ISBN → (状態, 書籍) を入力順で返す"""
+        results, pending = partition_isbns(isbns, self.cache, self.negative_cache, self.catalogue)
+        
+        # キャッシュにないものだけを batch_size 件ずつまとめて問い合わせる
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            try:
+                books = self.get_many_from_openbd(chunk)
+            except UpstreamError:
+                for isbn in chunk:
+                    results[isbn] = stale_or_error(self.cache, isbn)
+                continue
+            
+            for isbn, book_data in zip(chunk, books):
+                if book_data:
+                    self.cache.set(isbn, book_data)
+                    results[isbn] = ('found', book_data)
+                else:
+                    self.negative_cache.set(isbn, {
+                        'sources': ['openbd'],
+                        'checkedAt': time.time()
+                    })
+                    results[isbn] = ('not_found', None)
+        
+        return results
+    
     def get_from_openbd(self, isbn):
+        return self.get_many_from_openbd([isbn])[0]
+    
+    def get_many_from_openbd(self, isbns):
         try:
-            # OpenBD APIに複数のISBNを送信可能（カンマ区切り）
-            response = requests.get(f"{self.base_url}?isbn={isbn}", timeout=10)
-            response.raise_for_status()
+            if len(isbns) == 1:
+                response = self.client.get(f"{self.base_url}?isbn={isbns[0]}")
+            else:
+                # OpenBD APIに複数のISBNを送信可能（カンマ区切り）。件数が多いので POST で送る
+                response = self.client.post(
+                    self.base_url, data={'isbn': ','.join(isbns)}, idempotent=True
+                )
             
             data = response.json()
             print(f"OpenBD API response length: {len(data) if data else 0}")
-            
-            if data and len(data) > 0 and data[0] is not None:
-                book_info = data[0]
-                print(f"Book info keys: {list(book_info.keys())}")
-                
-                # summaryオブジェクトから基本情報を取得
-                summary = book_info.get('summary', {})
-                print(f"Summary: {summary}")
-                
-                # onixオブジェクトから詳細情報を取得
-                onix = book_info.get('onix', {})
-                print(f"Onix keys: {list(onix.keys()) if onix else 'None'}")
-                
-                # タイトルの取得（複数の方法を試行）
-                title = self.extract_title(onix, summary)
-                
-                # 著者情報の取得
-                author = self.extract_author(onix, summary)
-                
-                # 出版社の取得
-                publisher = self.extract_publisher(onix, summary)
-                
-                # ページ数の取得
-                total_pages = self.extract_pages(onix, summary)
-                
-                # 出版日の取得
-                pubdate = self.extract_pubdate(onix, summary)
-                
-                # 表紙画像の取得
-                cover_image = self.extract_cover_image(onix, summary)
-                
-                result = {
-                    'isbn': isbn,
-                    'title': title,
-                    'author': author,
-                    'publisher': publisher,
-                    'pubdate': pubdate,
-                    'totalPages': total_pages,
-                    'coverImage': cover_image,
-                    'currentPage': 0,
-                    'readingTime': 0
-                }
-                
-                print(f"Final result: {result}")
-                return result
-            else:
-                print("No book data found in OpenBD response")
-                return None
-                
-        except requests.RequestException as e:
+        except ValueError as e:
             print(f"OpenBD API request error: {e}")
-            return None
-        except Exception as e:
-            print(f"OpenBD API error: {e}")
-            return None
-    
-    def extract_title(self, onix, summary):
-        # summaryから取得
-        title = summary.get('title', '')
-        if title:
-            return title
-        
-        # onixから取得
-        try:
-            title_detail = onix.get('DescriptiveDetail', {}).get('TitleDetail', {})
-            if isinstance(title_detail, dict):
-                title_element = title_detail.get('TitleElement', {})
-                if isinstance(title_element, dict):
-                    title_text = title_element.get('TitleText', {})
-                    if isinstance(title_text, dict):
-                        return title_text.get('content', '')
-        except Exception as e:
-            print(f"Error extracting title: {e}")
-        
-        return ''
-    
-    def extract_publisher(self, onix, summary):
-        # summaryから取得
-        publisher = summary.get('publisher', '')
-        if publisher:
-            return publisher
+            raise UpstreamError('openbd', e)
         
-        # onixから取得
-        try:
-            publishing_detail = onix.get('PublishingDetail', {})
-            if isinstance(publishing_detail, dict):
-                publishers = publishing_detail.get('Publisher', [])
-                if isinstance(publishers, list) and len(publishers) > 0:
-                    publisher_name = publishers[0].get('PublisherName', '')
-                    if publisher_name:
-                        return publisher_name
-        except Exception as e:
-            print(f"Error extracting publisher: {e}")
-        
-        return ''
-    
-    def extract_author(self, onix, summary):
-        # summaryから著者情報を取得
-        author = summary.get('author', '')
-        if author:
-            return author
-        
-        # onixから著者情報を取得
-        try:
-            contributors = onix.get('DescriptiveDetail', {}).get('Contributor', [])
-            if isinstance(contributors, list) and len(contributors) > 0:
-                for contributor in contributors:
-                    # ContributorRoleが配列の場合とstrの場合を考慮
-                    contributor_roles = contributor.get('ContributorRole', [])
-                    if isinstance(contributor_roles, list):
-                        if 'A01' in contributor_roles:  # 著者
-                            person_name = contributor.get('PersonName', {})
-                            if isinstance(person_name, dict):
-                                return person_name.get('content', '')
-                            elif isinstance(person_name, str):
-                                return person_name
-                    elif contributor_roles == 'A01':
-                        person_name = contributor.get('PersonName', {})
-                        if isinstance(person_name, dict):
-                            return person_name.get('content', '')
-                        elif isinstance(person_name, str):
-                            return person_name
-                
-                # 最初の著者を取得（役割が不明な場合）
-                if len(contributors) > 0:
-                    person_name = contributors[0].get('PersonName', {})
-                    if isinstance(person_name, dict):
-                        return person_name.get('content', '')
-                    elif isinstance(person_name, str):
-                        return person_name
-                        
-        except Exception as e:
-            print(f"Error extracting author: {e}")
-        
-        return ''
-    
-    def extract_pages(self, onix, summary):
-        # summaryから取得を試行
-        extent = summary.get('extent', '')
-        if extent:
-            pages = self.parse_pages_from_text(extent)
-            if pages > 0:
-                return pages
+        # 応答は問い合わせた ISBN と同じ順の配列（見つからないものは null）
+        if not isinstance(data, list) or len(data) != len(isbns):
+            raise UpstreamError('openbd', 'ISBN の件数と応答の件数が一致しません')
         
-        # onixから取得を試行
-        try:
-            extents = onix.get('DescriptiveDetail', {}).get('Extent', [])
-            if isinstance(extents, list):
-                for extent in extents:
-                    if extent.get('ExtentType') == '00':  # ページ数
-                        extent_value = extent.get('ExtentValue', '')
-                        if extent_value and extent_value.isdigit():
-                            return int(extent_value)
-        except Exception as e:
-            print(f"Error extracting pages: {e}")
-        
-        return 0
-    
-    def extract_pubdate(self, onix, summary):
-        # summaryから取得
-        pubdate = summary.get('pubdate', '')
-        if pubdate:
-            return pubdate
-        
-        # onixから取得
-        try:
-            pub_dates = onix.get('PublishingDetail', {}).get('PublishingDate', [])
-            if isinstance(pub_dates, list):
-                for pub_date in pub_dates:
-                    if pub_date.get('PublishingDateRole') == '01':  # 出版日
-                        date_format = pub_date.get('DateFormat', '')
-                        date_value = pub_date.get('Date', '')
-                        if date_value:
-                            return date_value
-        except Exception as e:
-            print(f"Error extracting pubdate: {e}")
-        
-        return ''
-    
-    def extract_cover_image(self, onix, summary):
-        # summaryから取得
-        cover = summary.get('cover', '')
-        if cover:
-            return cover
-        
-        # onixから取得
-        try:
-            collateral_detail = onix.get('CollateralDetail', {})
-            supporting_resources = collateral_detail.get('SupportingResource', [])
-            if isinstance(supporting_resources, list):
-                for resource in supporting_resources:
-                    if resource.get('ResourceContentType') == '01':  # 表紙画像
-                        versions = resource.get('ResourceVersion', [])
-                        if isinstance(versions, list):
-                            for version in versions:
-                                links = version.get('ResourceLink', [])
-                                if isinstance(links, list) and len(links) > 0:
-                                    return links[0]
-        except Exception as e:
-            print(f"Error extracting cover image: {e}")
-        
-        return ''
+        results = []
+        for isbn, book_info in zip(isbns, data):
+            if book_info is None:
+                print(f"No book data found in OpenBD response: {isbn}")
+                results.append(None)
+            else:
+                results.append(self.build_book(isbn, book_info))
+        return results
     
-    def parse_pages_from_text(self, text):
-        if not text:
-            return 0
-        
-        # 「123p」「123ページ」「123頁」などの形式を検索
-        patterns = [
-            r'(\d+)p\b',
-            r'(\d+)ページ',
-            r'(\d+)頁',
-            r'(\d+)\s*p\b',
-            r'(\d+)\s*pages?',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return int(match.group(1))
-        
-        # 数字のみの場合
-        numbers = re.findall(r'\d+', text)
-        if numbers:
-            return int(numbers[0])
-        
-        return 0
+    def build_book(self, isbn, book_info):
+        # summary を優先し、空の項目は ONIX から補う（common/openbd.py）
+        return openbd_book(isbn, book_info)
     
 
-# BookService クラスを直接定義
-class BookService:
-    def __init__(self):
-        self.books = []
-    
-    def get_all_books(self):
-        return self.books
-    
-    def save_book(self, book_data):
-        if 'id' not in book_data:
-            book_data['id'] = self.generate_id()
-        
-        book_data['created_at'] = datetime.now().isoformat()
-        book_data['updated_at'] = datetime.now().isoformat()
-        
-        self.books.append(book_data)
-        return book_data
-    
-    def update_book(self, book_id, book_data):
-        for i, book in enumerate(self.books):
-            if book.get('id') == book_id:
-                book_data['updated_at'] = datetime.now().isoformat()
-                self.books[i] = {**book, **book_data}
-                return self.books[i]
-        return None
-    
-    def delete_book(self, book_id):
-        original_length = len(self.books)
-        self.books = [book for book in self.books if book.get('id') != book_id]
-        return len(self.books) < original_length
-    
-    def generate_id(self):
-        import time
-        import random
-        return f"{int(time.time())}{random.randint(1000, 9999)}"
+# 一括検索で1リクエストに受け付ける ISBN の上限
+MAX_LOOKUP_ISBNS = 10000
 
 openbd_api = OpenBDApi()
-book_service = BookService()
+# 一括検索は OpenBD へのまとめ問い合わせを asyncio で並行に送る
+async_lookup = AsyncLookup(
+    openbd_api.cache, openbd_api.negative_cache, openbd_api.base_url, openbd_api.build_book,
+    batch_size=openbd_api.batch_size, catalogue=openbd_api.catalogue
+)
+# 書籍・セッションの処理はバックエンドと共通。既定はプロセス内保持で、
+# BOOK_STORAGE=sqlite と BOOK_SQLITE_FILE（例: /tmp/books.db）で永続化する
+book_service = BookService(
+    store=create_store(os.getenv('BOOK_STORAGE', 'memory'), db_file=os.getenv('BOOK_SQLITE_FILE', '/tmp/books.db')),
+    sessions=create_session_log(
+        os.getenv('BOOK_SESSION_FILE', '/tmp/sessions.log'), backend=os.getenv('BOOK_STORAGE', 'memory')
+    ),
+)
+# カバー画像は /tmp にキャッシュし、ウォームなインスタンスでは取得・縮小をやり直さない
+cover_service = CoverService(
+    create_cover_cache(os.getenv('COVER_CACHE_DIR', '/tmp/covers')),
+    workers=int(os.getenv('COVER_WORKERS', '2')),
+    wait=float(os.getenv('COVER_WAIT', '5'))
+)
+COVER_MAX_AGE = int(os.getenv('COVER_MAX_AGE', str(30 * 24 * 3600)))
 
 @app.route('/api/book/<isbn>', methods=['GET'])
 def get_book_by_isbn(isbn):
     try:
         print(f"=== Received ISBN request: {isbn} ===")
         
-        # ISBNのバリデーション
-        if not isbn or len(isbn) < 10:
-            return jsonify({'error': 'ISBNが無効です'}), 400
+        # ISBNのバリデーション（チェックディジットが合わなければ OpenBD に問い合わせない）
+        if canonical_isbn(isbn) is None:
+            return jsonify({'error': 'ISBNが無効です', 'isbn': isbn}), 400
         
         # 書籍データを取得
         book_data = openbd_api.get_book_by_isbn(isbn)
@@ -329,6 +203,24 @@ def get_book_by_isbn(isbn):
                 'message': 'OpenBD APIでこのISBNの書籍情報を見つけることができませんでした'
             }), 404
             
+    except CircuitOpenError as e:
+        # 上流の障害中は待たずに断る
+        response = jsonify({
+            'error': '書籍情報の取得を一時的に停止しています',
+            'isbn': isbn,
+            'source': e.source,
+            'message': 'OpenBD APIが不安定なため、しばらくしてから再度お試しください'
+        })
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response, 503
+    except UpstreamError as e:
+        print(f"=== Upstream error: {e} ===")
+        return jsonify({
+            'error': '書籍情報の取得に失敗しました',
+            'isbn': isbn,
+            'source': e.source,
+            'message': 'OpenBD APIに接続できませんでした。しばらくしてから再度お試しください'
+        }), 502
     except Exception as e:
         print(f"=== Error in get_book_by_isbn: {e} ===")
         import traceback
@@ -339,11 +231,140 @@ def get_book_by_isbn(isbn):
             'message': 'サーバーエラーが発生しました'
         }), 500
 
+@app.route('/api/cover/<isbn>', methods=['GET'])
+def get_cover(isbn):
+    try:
+        key = canonical_isbn(isbn)
+        if key is None:
+            return jsonify({'error': 'ISBNが無効です', 'isbn': isbn}), 400
+        
+        cover, complete, fallback_url = cover_service.lookup(
+            key, request.args.get('size', 'original'),
+            lambda: (openbd_api.get_book_by_isbn(key) or {}).get('coverImage', '')
+        )
+        if fallback_url:
+            # 取得が間に合わなければ元の URL に任せる（取得は続け、次からはキャッシュから返す）
+            response = redirect(fallback_url)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        if cover is None:
+            return jsonify({'error': 'カバー画像が見つかりません', 'isbn': isbn}), 404
+        
+        response = app.response_class(cover.data, mimetype=cover.content_type)
+        response.set_etag(cover.digest)
+        # 縮小版ができるまでは原寸を短い期限で返し、できてから取り直させる
+        response.headers['Cache-Control'] = f"public, max-age={COVER_MAX_AGE if complete else 60}"
+        return response.make_conditional(request)
+    except QueryError as e:
+        return jsonify({'error': str(e), 'isbn': isbn}), 400
+    except CircuitOpenError as e:
+        response = jsonify({'error': 'カバー画像の取得を一時的に停止しています', 'isbn': isbn, 'source': e.source})
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response, 503
+    except UpstreamError as e:
+        print(f"=== Cover upstream error: {e} ===")
+        return jsonify({'error': 'カバー画像の取得に失敗しました', 'isbn': isbn, 'source': e.source}), 502
+    except Exception as e:
+        print(f"=== Error in get_cover: {e} ===")
+        return jsonify({'error': str(e), 'isbn': isbn}), 500
+
+@app.route('/api/books/lookup', methods=['POST'])
+def lookup_books():
+    try:
+        data = request.get_json(silent=True) or {}
+        isbns = data.get('isbns')
+        if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+            return jsonify({'error': 'isbns は文字列の配列で指定してください'}), 400
+        if len(isbns) > MAX_LOOKUP_ISBNS:
+            return jsonify({'error': f'isbns は {MAX_LOOKUP_ISBNS} 件以内で指定してください'}), 400
+        
+        results = async_lookup.lookup_many_sync(isbns)
+        return jsonify(lookup_report(results))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/books', methods=['GET'])
 def get_all_books():
     try:
-        books = book_service.get_all_books()
-        return jsonify(books)
+        # ライブラリに変更がなければ本文を組み立てずに 304 を返す
+        etag = library_etag(book_service.get_version(), request.query_string)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        fields = parse_fields(request.args.get('fields'))
+        
+        if any(name in request.args for name in ('limit', 'cursor', 'sort', 'order', 'status')):
+            books, next_cursor = book_service.query_books(
+                sort=request.args.get('sort', 'created_at'),
+                order=request.args.get('order', 'asc'),
+                status=request.args.get('status'),
+                limit=request.args.get('limit', 50, type=int),
+                cursor=request.args.get('cursor'),
+                fields=fields
+            )
+            response = jsonify({'books': books, 'nextCursor': next_cursor})
+        else:
+            books = book_service.get_all_books()
+            response = jsonify([project(book, fields) for book in books])
+        
+        response.set_etag(etag)
+        return response
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/search', methods=['GET'])
+def search_books():
+    try:
+        etag = library_etag(book_service.get_version(), request.query_string)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        books, total, next_cursor = book_service.search_books(
+            request.args.get('q', ''),
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+            fields=parse_fields(request.args.get('fields'))
+        )
+        response = jsonify({'books': books, 'total': total, 'nextCursor': next_cursor})
+        response.set_etag(etag)
+        return response
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/changes', methods=['GET'])
+def get_book_changes():
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', 500, type=int)
+        if since < 0 or limit < 1:
+            return jsonify({'error': 'since または limit が不正です'}), 400
+        
+        return jsonify(book_service.get_changes(since, min(limit, 5000)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/export', methods=['GET'])
+def export_books():
+    # ジェネレータで少しずつ返すため、蔵書の量にかかわらずメモリ使用量は一定
+    return Response(
+        stream_with_context(export_ndjson(book_service.iter_books())),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=books.ndjson'}
+    )
+
+@app.route('/api/books/import', methods=['POST'])
+def import_books():
+    try:
+        report = import_ndjson(request.stream, book_service.import_books, BookModel.validate)
+        return jsonify(report)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -353,6 +374,10 @@ def save_book():
         book_data = request.get_json()
         saved_book = book_service.save_book(book_data)
         return jsonify(saved_book), 201
+    except InvalidBookError as e:
+        return jsonify({'error': str(e)}), 400
+    except DuplicateBookError as e:
+        return jsonify({'error': 'この書籍は既に登録されています', 'book': e.book}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -365,6 +390,8 @@ def update_book(book_id):
             return jsonify(updated_book)
         else:
             return jsonify({'error': '書籍が見つかりません'}), 404
+    except InvalidBookError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -379,6 +406,81 @@ def delete_book(book_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/books/<book_id>/sessions', methods=['POST'])
+def add_session(book_id):
+    try:
+        session_data = request.get_json()
+        error = SessionModel.validate(session_data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        session = book_service.add_session(book_id, session_data)
+        if session:
+            return jsonify(session), 201
+        else:
+            return jsonify({'error': '書籍が見つかりません'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<book_id>/sessions', methods=['GET'])
+def get_sessions(book_id):
+    try:
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit が不正です'}), 400
+        return jsonify(book_service.get_sessions(book_id, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def get_library_stats():
+    try:
+        top = request.args.get('top', DEFAULT_TOP, type=int)
+        if top < 1 or top > MAX_TOP:
+            return jsonify({'error': f'top は 1〜{MAX_TOP} の範囲で指定してください'}), 400
+        return jsonify(book_service.get_library_stats(top))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/daily', methods=['GET'])
+def get_daily_stats():
+    try:
+        # from / to は YYYY-MM-DD（集計済みの日別データを範囲で切り出すだけ）
+        return jsonify({
+            'days': book_service.get_daily_stats(request.args.get('from'), request.args.get('to'))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/weekly', methods=['GET'])
+def get_weekly_stats():
+    try:
+        # from / to は YYYY-Www
+        return jsonify({
+            'weeks': book_service.get_weekly_stats(request.args.get('from'), request.args.get('to'))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    stats = openbd_api.cache.stats()
+    stats['negative'] = openbd_api.negative_cache.stats()
+    stats['catalogue'] = openbd_api.catalogue.stats()
+    stats['covers'] = cover_service.stats()
+    return jsonify(stats)
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def get_upstream_stats():
+    stats = upstream_stats()
+    stats['async'] = async_lookup.stats()
+    stats['singleflight'] = openbd_api.singleflight.stats()
+    return jsonify(stats)
+
+@app.route('/api/upstream/breakers', methods=['GET'])
+def get_upstream_breakers():
+    return jsonify(breaker_stats())
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'})
@@ -1,79 +1,174 @@
-import json
-import os
 from datetime import datetime
 
+from common.book_query import LibraryQuery
+from common.isbn import normalize_isbn
+from common.library_search import LibrarySearch
+from common.library_stats import LibraryStats
+from models.book_model import BookModel, InvalidBookError, as_count
+from models.session_model import SessionModel
+from storage import DuplicateBookError, create_session_log, create_store
+
 class BookService:
-    def __init__(self, data_file='../data/books.json'):
-        self.data_file = data_file
-        self.ensure_data_file()
-    
-    def ensure_data_file(self):
-        if not os.path.exists(self.data_file):
-            os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+    def __init__(self, data_file=None, store=None, sessions=None):
+        # BOOK_STORAGE で journal / sqlite / memory を切り替える
+        if store is None:
+            store = create_store(data_file=data_file)
+        self.store = store
+        self.query = LibraryQuery(store)
+        self.stats = LibraryStats(store)
+        # タイトル・著者・出版社の全文検索。登録・更新・削除は次の検索の前に差分を取り込む
+        self.search = LibrarySearch(store)
+        self.sessions = sessions if sessions is not None else create_session_log()
     
     def get_all_books(self):
-        try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return self.store.all()
     
-    def save_book(self, book_data):
-        books = self.get_all_books()
+    def query_books(self, **params):
+        return self.query.page(**params)
+    
+    def search_books(self, q, limit=20, cursor=None, fields=None):
+        return self.search.search(q, limit=limit, cursor=cursor, fields=fields)
+    
+    def get_library_stats(self, top=20):
+        return self.stats.summary(top)
+    
+    def get_version(self):
+        return self.store.version
+    
+    def get_changes(self, since, limit=500):
+        # 先に version を読むことで、返した差分以降の変更を取りこぼさない
+        version = self.store.version
+        entries = self.store.changes_since(since)
+        if entries is None:
+            # 古い削除履歴を破棄済みのため、全件を取り直してもらう
+            return {'reset': True, 'version': version}
+        
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        if has_more:
+            next_since = entries[-1][0]
+        else:
+            next_since = max([version, since] + [entry[0] for entry in entries[-1:]])
         
+        return {
+            'reset': False,
+            'version': version,
+            'since': since,
+            'nextSince': next_since,
+            'hasMore': has_more,
+            'upserts': [book for _, _, book in entries if book is not None],
+            'deleted': [
+                {'id': book_id, 'revision': revision}
+                for revision, book_id, book in entries if book is None
+            ]
+        }
+    
+    def save_book(self, book_data):
+        error = BookModel.validate(book_data)
+        if error:
+            raise InvalidBookError(error)
+        # revision はストレージが採番する
+        book_data.pop('revision', None)
         if 'id' not in book_data:
             book_data['id'] = self.generate_id()
         
+        # 同じ ISBN の書籍が別 id で登録済みなら重複として扱う
+        existing = self.store.find_by_isbn(book_data.get('isbn'))
+        if existing is not None and existing['id'] != book_data['id']:
+            raise DuplicateBookError(existing)
+        
         book_data['created_at'] = datetime.now().isoformat()
         book_data['updated_at'] = datetime.now().isoformat()
         
-        books.append(book_data)
-        
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(books, f, ensure_ascii=False, indent=2)
-        
-        return book_data
+        return self.store.put(book_data)
     
     def update_book(self, book_id, book_data):
-        books = self.get_all_books()
+        book = self.store.get(book_id)
+        if book is None:
+            return None
         
-        for i, book in enumerate(books):
-            if book.get('id') == book_id:
-                book_data['updated_at'] = datetime.now().isoformat()
-                books[i] = {**book, **book_data}
-                
-                with open(self.data_file, 'w', encoding='utf-8') as f:
-                    json.dump(books, f, ensure_ascii=False, indent=2)
-                
-                return books[i]
+        if not isinstance(book_data, dict):
+            raise InvalidBookError(BookModel.validate(book_data))
+        # 変更する項目だけを確かめる（検証の導入前に保存された値があっても更新できるように）
+        error = BookModel.validate({'title': book.get('title'), 'isbn': book.get('isbn'), **book_data})
+        if error:
+            raise InvalidBookError(error)
         
-        return None
+        book_data.pop('revision', None)
+        book_data['updated_at'] = datetime.now().isoformat()
+        return self.store.put({**book, **book_data, 'id': book_id})
     
     def delete_book(self, book_id):
-        books = self.get_all_books()
-        original_length = len(books)
-        
-        books = [book for book in books if book.get('id') != book_id]
+        return self.store.delete(book_id)
+    
+    def add_session(self, book_id, session_data):
+        """読書セッションを記録し、書籍の読書時間と現在ページにも反映する"""
+        book = self.store.get(book_id)
+        if book is None:
+            return None
         
-        if len(books) < original_length:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(books, f, ensure_ascii=False, indent=2)
-            return True
+        session = self.sessions.append(book_id, **SessionModel.to_record(session_data))
         
-        return False
+        # readingTime はセッションの合計として積み上げる（履歴はログに残る）
+        updates = {'readingTime': as_count(book.get('readingTime')) + session['seconds']}
+        if session['endPage'] is not None:
+            updates['currentPage'] = session['endPage']
+        self.update_book(book_id, updates)
+        return session
+    
+    def get_sessions(self, book_id, limit=None):
+        summary, sessions = self.sessions.sessions_for(book_id, limit)
+        return {'bookId': book_id, 'summary': summary, 'sessions': sessions}
+    
+    def get_daily_stats(self, start=None, end=None):
+        return self.sessions.daily_stats(start, end)
+    
+    def get_weekly_stats(self, start=None, end=None):
+        return self.sessions.weekly_stats(start, end)
     
     def get_book_by_id(self, book_id):
-        books = self.get_all_books()
+        return self.store.get(book_id)
+    
+    def get_book_by_isbn(self, isbn):
+        return self.store.find_by_isbn(isbn)
+    
+    def iter_books(self):
+        return self.store.iter_all()
+    
+    def import_books(self, books):
+        """まとめて保存する。保存できなかった書籍は (位置, エラー) で返す"""
+        now = datetime.now().isoformat()
+        to_save = []
+        errors = []
+        batch_ids = set()
+        batch_isbns = {}
         
-        for book in books:
-            if book.get('id') == book_id:
-                return book
+        for position, book_data in enumerate(books):
+            book_data.pop('revision', None)
+            if 'id' not in book_data:
+                book_data['id'] = self.generate_id()
+                while book_data['id'] in batch_ids or self.store.get(book_data['id']) is not None:
+                    book_data['id'] = self.generate_id()
+            
+            isbn = normalize_isbn(book_data.get('isbn'))
+            if isbn:
+                existing = self.store.find_by_isbn(isbn)
+                owner = batch_isbns.get(isbn, existing['id'] if existing else None)
+                if owner is not None and owner != book_data['id']:
+                    errors.append((position, f'ISBN {isbn} は既に登録されています'))
+                    continue
+                batch_isbns[isbn] = book_data['id']
+            
+            book_data.setdefault('created_at', now)
+            book_data['updated_at'] = now
+            batch_ids.add(book_data['id'])
+            to_save.append(book_data)
         
-        return None
+        if to_save:
+            self.store.put_many(to_save)
+        return errors
     
     def generate_id(self):
         import time
         import random
-        return f"{int(time.time())}{random.randint(1000, 9999)}"
\ No newline at end of file
+        return f"{int(time.time())}{random.randint(100000, 999999)}"
\ No newline at end of file
@@ -1,124 +1,315 @@
-import requests
 import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import quote
-import re
+import os
+import threading
+import time
+
+from common.http_client import get_client
+from common.isbn import normalize_isbn, parse_isbn
+from common.openbd import openbd_book
+from common.singleflight import SingleFlight
+from common.sru import SRUResponse, sru_book
+from common.upstream import UpstreamError, partition_isbns, stale_or_error
+from storage import create_catalogue, create_metadata_cache, create_negative_cache
+
+# SRU の1ページあたりのレコード数
+NDL_PAGE_SIZE = 50
+# 一括検索で1回の SRU 検索に OR でつなぐ ISBN の数
+NDL_OR_BATCH = 10
 
 class NDLApi:
-    def __init__(self):
+    def __init__(self, cache=None, negative_cache=None, catalogue=None):
         self.base_url = "https://iss.ndl.go.jp/api/sru"
         self.openbd_url = "https://api.openbd.jp/v1/get"
+        # OpenBD は1リクエストで複数の ISBN を受け付ける（POST ならカンマ区切りで最大 10000 件）
+        self.openbd_batch_size = int(os.getenv('OPENBD_BATCH_SIZE', '1000'))
+        # 上流ごとに接続プール・タイムアウト・再試行を共有するクライアント
+        self.openbd_client = get_client('openbd')
+        self.ndl_client = get_client('ndl')
+        # 同じ ISBN の再検索は上流に問い合わせずキャッシュから返す
+        self.cache = cache if cache is not None else create_metadata_cache()
+        # 見つからなかった ISBN（上流の障害は含めない）
+        self.negative_cache = negative_cache if negative_cache is not None else create_negative_cache()
+        # OpenBD の一括データなどから作ったローカルの索引。上流にはここにないものだけを問い合わせる
+        self.catalogue = catalogue if catalogue is not None else create_catalogue()
+        # 同じ ISBN の検索が同時に来たら、上流への問い合わせは1回だけにする
+        self.singleflight = SingleFlight()
+        
+        # sequential: OpenBD の結果を待ってから NDL / parallel: 両方を同時に送る /
+        # hedged: OpenBD が hedge_delay 以内に答えなければ NDL も送る
+        self.lookup_mode = os.getenv('LOOKUP_MODE', 'hedged').lower()
+        if self.lookup_mode not in ('sequential', 'parallel', 'hedged'):
+            raise ValueError(f"Unknown lookup mode: {self.lookup_mode}")
+        # 秒数、または p90 のような OpenBD の応答時間の分位点
+        self.hedge_delay = os.getenv('LOOKUP_HEDGE_DELAY', 'p90')
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('LOOKUP_WORKERS', '16')), thread_name_prefix='lookup'
+        )
+        self._counters_lock = threading.Lock()
+        self.lookup_counters = {'lookups': 0, 'hedged': 0, 'openbd_wins': 0, 'ndl_wins': 0}
     
     def get_book_by_isbn(self, isbn):
-        cleaned_isbn = self.clean_isbn(isbn)
+        # チェックディジットが合わないものは上流に問い合わせない（InvalidISBNError）
+        cleaned_isbn = parse_isbn(isbn)
+        
+        cached = self.cache.get(cleaned_isbn)
+        if cached is not None:
+            return dict(cached)
+        local = self.catalogue.get(cleaned_isbn)
+        if local is not None:
+            return local
+        if self.negative_cache.get(cleaned_isbn) is not None:
+            return None
+        
+        book_data = self.singleflight.do(cleaned_isbn, self._fetch_book, cleaned_isbn)
+        # 同時に待っていた呼び出し元どうしで同じ dict を共有しないよう複製して返す
+        return dict(book_data) if book_data else book_data
+    
+    def _fetch_book(self, cleaned_isbn):
+        if self.lookup_mode == 'sequential':
+            book_data, errors = self._lookup_sequential(cleaned_isbn)
+        else:
+            book_data, errors = self._lookup_hedged(cleaned_isbn)
         
-        book_data = self.get_from_openbd(cleaned_isbn)
         if book_data:
+            self.cache.set(cleaned_isbn, book_data)
             return book_data
         
-        book_data = self.get_from_ndl(cleaned_isbn)
-        return book_data
+        if errors:
+            # 上流が応答しない間は、期限切れでもキャッシュに残っている情報を返す
+            stale = self.cache.get_stale(cleaned_isbn)
+            if stale is not None:
+                print(f"serving stale metadata for {cleaned_isbn}: {errors[-1]}")
+                return stale
+            # 一部の上流が応答しなかった場合は「見つからない」と断定しない
+            raise errors[-1]
+        
+        self.negative_cache.set(cleaned_isbn, {
+            'sources': ['openbd', 'ndl'],
+            'checkedAt': time.time()
+        })
+        return None
+    
+    def _lookup_sequential(self, isbn):
+        errors = []
+        for source, fetch in (('openbd', self.get_from_openbd), ('ndl', self.get_from_ndl)):
+            try:
+                book_data = fetch(isbn)
+            except UpstreamError as e:
+                print(f"{source} lookup failed: {e}")
+                errors.append(e)
+                continue
+            if book_data:
+                return book_data, errors
+        return None, errors
     
-    def clean_isbn(self, isbn):
-        return re.sub(r'[^0-9X]', '', isbn.upper())
+    def _hedge_delay(self):
+        if self.lookup_mode == 'parallel':
+            return 0
+        if self.hedge_delay.startswith('p'):
+            latency_ms = self.openbd_client.latency_percentile(float(self.hedge_delay[1:]))
+            # 計測値がまだなければ 0.3 秒待つ
+            return latency_ms / 1000 if latency_ms is not None else 0.3
+        return float(self.hedge_delay)
+    
+    def _lookup_hedged(self, isbn):
+        """OpenBD と NDL に並行して問い合わせ、OpenBD > NDL の優先順で結果を選ぶ
+
+        OpenBD が見つければ NDL の結果は待たない（未送信なら取り消し、送信済みなら
+        捨てる）。NDL が先に見つけた場合も、OpenBD の結果が出るまでは待つ。
+        """
+        self._count('lookups')
+        openbd = self._executor.submit(self.get_from_openbd, isbn)
+        wait([openbd], timeout=self._hedge_delay())
+        if openbd.done() and openbd.exception() is None and openbd.result():
+            self._count('openbd_wins')
+            return openbd.result(), []
+        
+        if not openbd.done():
+            self._count('hedged')
+        ndl = self._executor.submit(self.get_from_ndl, isbn)
+        
+        pending = {openbd, ndl}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if openbd in done and openbd.exception() is None and openbd.result():
+                ndl.cancel()
+                self._count('openbd_wins')
+                return openbd.result(), []
+            if openbd.done() and ndl.done():
+                break
+        
+        errors = []
+        for source, future in (('openbd', openbd), ('ndl', ndl)):
+            error = future.exception()
+            if error is not None:
+                # パーサの例外など UpstreamError 以外もそのまま呼び出し元に伝える
+                print(f"{getattr(error, 'source', source)} lookup failed: {error!r}")
+                errors.append(error)
+        if ndl.exception() is None and ndl.result():
+            self._count('ndl_wins')
+            return ndl.result(), errors
+        return None, errors
+    
+    def _count(self, name):
+        with self._counters_lock:
+            self.lookup_counters[name] += 1
+    
+    def lookup_stats(self):
+        with self._counters_lock:
+            stats = dict(self.lookup_counters)
+        stats['mode'] = self.lookup_mode
+        stats['hedge_delay_ms'] = self._hedge_delay() * 1000
+        stats['singleflight'] = self.singleflight.stats()
+        return stats
+    
+    def get_books_by_isbns(self, isbns):
+        """複数の ISBN をまとめて検索し、正規化 ISBN → (状態, 書籍) を入力順で返す
+
+        状態は found / not_found / error / invalid。キャッシュにないものは OpenBD に
+        openbd_batch_size 件ずつまとめて問い合わせ、見つからなかったものだけ NDL に
+        OR 検索でまとめて聞く。
+        """
+        results, pending = partition_isbns(isbns, self.cache, self.negative_cache, self.catalogue)
+        
+        misses = []
+        for start in range(0, len(pending), self.openbd_batch_size):
+            chunk = pending[start:start + self.openbd_batch_size]
+            try:
+                books = self.get_many_from_openbd(chunk)
+            except UpstreamError as e:
+                print(f"openbd batch lookup failed: {e}")
+                # OpenBD が応答しなくても NDL で見つかる可能性はある
+                misses.extend((isbn, True) for isbn in chunk)
+                continue
+            for isbn, book_data in zip(chunk, books):
+                if book_data:
+                    self.cache.set(isbn, book_data)
+                    results[isbn] = ('found', book_data)
+                else:
+                    misses.append((isbn, False))
+        
+        # OpenBD になかったものは NDL_OR_BATCH 件ずつ OR 検索でまとめて問い合わせる
+        for start in range(0, len(misses), NDL_OR_BATCH):
+            chunk = misses[start:start + NDL_OR_BATCH]
+            try:
+                books = self.get_many_from_ndl([isbn for isbn, _ in chunk])
+            except UpstreamError as e:
+                print(f"ndl lookup failed: {e}")
+                for isbn, _ in chunk:
+                    results[isbn] = stale_or_error(self.cache, isbn)
+                continue
+            for (isbn, openbd_failed), book_data in zip(chunk, books):
+                if book_data:
+                    self.cache.set(isbn, book_data)
+                    results[isbn] = ('found', book_data)
+                elif openbd_failed:
+                    results[isbn] = stale_or_error(self.cache, isbn)
+                else:
+                    self.negative_cache.set(isbn, {
+                        'sources': ['openbd', 'ndl'],
+                        'checkedAt': time.time()
+                    })
+                    results[isbn] = ('not_found', None)
+        
+        return results
     
     def get_from_openbd(self, isbn):
+        return self.get_many_from_openbd([isbn])[0]
+    
+    def get_many_from_openbd(self, isbns):
+        """OpenBD に複数の ISBN を1回で問い合わせ、入力と同じ順の書籍（なければ None）を返す"""
         try:
-            response = requests.get(f"{self.openbd_url}?isbn={isbn}")
-            response.raise_for_status()
-            
+            if len(isbns) == 1:
+                response = self.openbd_client.get(f"{self.openbd_url}?isbn={isbns[0]}")
+            else:
+                # 件数が多いと URL が長くなりすぎるため POST で送る（検索なので再試行してよい）
+                response = self.openbd_client.post(
+                    self.openbd_url, data={'isbn': ','.join(isbns)}, idempotent=True
+                )
             data = response.json()
-            if data and data[0]:
-                book_info = data[0]
-                summary = book_info.get('summary', {})
-                
-                return {
-                    'isbn': isbn,
-                    'title': summary.get('title', ''),
-                    'author': summary.get('author', ''),
-                    'publisher': summary.get('publisher', ''),
-                    'pubdate': summary.get('pubdate', ''),
-                    'totalPages': self.extract_pages(summary.get('extent', '')),
-                    'coverImage': summary.get('cover', ''),
-                    'currentPage': 0,
-                    'readingTime': 0
-                }
-        except Exception as e:
-            print(f"OpenBD API error: {e}")
-            return None
+        except ValueError as e:
+            raise UpstreamError('openbd', e)
+        
+        if not isinstance(data, list) or len(data) != len(isbns):
+            raise UpstreamError('openbd', f'unexpected response length: {len(data) if isinstance(data, list) else data!r}')
+        
+        return [
+            self.parse_openbd(isbn, book_info) if book_info else None
+            for isbn, book_info in zip(isbns, data)
+        ]
+    
+    def parse_openbd(self, isbn, book_info):
+        # summary を優先し、空の項目は ONIX から補う（common/openbd.py）
+        return openbd_book(isbn, book_info)
     
     def get_from_ndl(self, isbn):
+        response = self.ndl_client.get(self.base_url, params=self.ndl_params(isbn), stream=True)
+        return self.parse_ndl(isbn, self.ndl_client.stream(response))
+    
+    def ndl_params(self, isbn):
+        return self.sru_params(f'isbn="{isbn}"')
+    
+    def sru_params(self, query, maximum_records=1, start_record=1):
+        return {
+            'operation': 'searchRetrieve',
+            'version': '1.2',
+            'query': query,
+            'recordSchema': 'dcndl',
+            # レコードを文字列にエスケープせず XML のまま埋め込ませる
+            'recordPacking': 'xml',
+            'maximumRecords': str(maximum_records),
+            'startRecord': str(start_record)
+        }
+    
+    def parse_ndl(self, isbn, content):
+        """SRU の応答（バイト列または断片の iterable）の最初のレコードを書籍に変換する。なければ None"""
+        book_data = None
+        sru = SRUResponse(content)
         try:
-            query = f'isbn="{isbn}"'
-            params = {
-                'operation': 'searchRetrieve',
-                'version': '1.2',
-                'query': query,
-                'recordSchema': 'dcndl',
-                'maximumRecords': '1'
-            }
-            
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            
-            ns = {
-                'srw': 'http://www.loc.gov/zing/srw/',
-                'dc': 'http://purl.org/dc/elements/1.1/',
-                'dcndl': 'http://ndl.go.jp/dcndl/terms/',
-                'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-                'rdfs': 'http://www.w3.org/2000/01/rdf-schema#'
-            }
-            
-            records = root.findall('.//srw:record', ns)
-            if not records:
-                return None
-            
-            record = records[0]
-            
-            title_elem = record.find('.//dc:title', ns)
-            title = title_elem.text if title_elem is not None else ''
-            
-            author_elem = record.find('.//dc:creator', ns)
-            author = author_elem.text if author_elem is not None else ''
-            
-            publisher_elem = record.find('.//dc:publisher', ns)
-            publisher = publisher_elem.text if publisher_elem is not None else ''
-            
-            date_elem = record.find('.//dc:date', ns)
-            pubdate = date_elem.text if date_elem is not None else ''
-            
-            extent_elem = record.find('.//dcndl:extent', ns)
-            extent = extent_elem.text if extent_elem is not None else ''
-            
-            return {
-                'isbn': isbn,
-                'title': title,
-                'author': author,
-                'publisher': publisher,
-                'pubdate': pubdate,
-                'totalPages': self.extract_pages(extent),
-                'coverImage': '',
-                'currentPage': 0,
-                'readingTime': 0
-            }
-            
-        except Exception as e:
-            print(f"NDL API error: {e}")
-            return None
+            # 応答は最後まで読み、接続をプールに戻す
+            for record in sru:
+                if book_data is None:
+                    book_data = sru_book(isbn, record)
+        except ET.ParseError as e:
+            raise UpstreamError('ndl', e)
+        if sru.diagnostics:
+            raise UpstreamError('ndl', sru.diagnostics[0])
+        return book_data
     
-    def extract_pages(self, extent_text):
-        if not extent_text:
-            return 0
-        
-        page_pattern = r'(\d+)p'
-        match = re.search(page_pattern, extent_text)
-        if match:
-            return int(match.group(1))
-        
-        number_pattern = r'(\d+)'
-        match = re.search(number_pattern, extent_text)
-        if match:
-            return int(match.group(1))
-        
-        return 0
\ No newline at end of file
+    def search_ndl(self, query, page_size=NDL_PAGE_SIZE, limit=None):
+        """SRU の検索結果を、nextRecordPosition に従ってページをたどりながら1件ずつ返す"""
+        start_record = 1
+        returned = 0
+        while True:
+            response = self.ndl_client.get(
+                self.base_url, params=self.sru_params(query, page_size, start_record), stream=True
+            )
+            sru = SRUResponse(self.ndl_client.stream(response))
+            try:
+                for record in sru:
+                    if limit is None or returned < limit:
+                        returned += 1
+                        yield record
+            except ET.ParseError as e:
+                raise UpstreamError('ndl', e)
+            if sru.diagnostics:
+                raise UpstreamError('ndl', sru.diagnostics[0])
+            if sru.next_record_position is None or (limit is not None and returned >= limit):
+                return
+            start_record = sru.next_record_position
+    
+    def get_many_from_ndl(self, isbns):
+        """複数の ISBN を OR でつないだ1つの検索で問い合わせ、入力と同じ順の書籍（なければ None）を返す
+
+        同じ ISBN に複数のレコード（版違いなど）があれば最初のものを使う。
+        """
+        books = dict.fromkeys(isbns)
+        query = ' OR '.join(f'isbn="{isbn}"' for isbn in isbns)
+        for record in self.search_ndl(query):
+            for identifier in record['isbns']:
+                isbn = normalize_isbn(identifier)
+                if isbn in books and books[isbn] is None:
+                    books[isbn] = sru_book(isbn, record)
+        return [books[isbn] for isbn in isbns]
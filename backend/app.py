@@ -1,18 +1,48 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, redirect, request, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 
 from api.ndl_api import NDLApi
 from api.book_service import BookService
+from common.async_lookup import AsyncLookup
+from common.book_query import QueryError, library_etag, parse_fields, project
+from common.circuit_breaker import CircuitOpenError, breaker_stats
+from common.covers import CoverService
+from common.http_client import upstream_stats
+from common.isbn import InvalidISBNError, canonical_isbn
+from common.library_stats import DEFAULT_TOP, MAX_TOP
+from common.ndjson import export_ndjson, import_ndjson
+from common.upstream import UpstreamError, lookup_report
+from models.book_model import BookModel, InvalidBookError
+from models.session_model import SessionModel
+from storage import DuplicateBookError, create_cover_cache
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag'])
+
+# 一括検索で1リクエストに受け付ける ISBN の上限
+MAX_LOOKUP_ISBNS = 10000
 
 ndl_api = NDLApi()
+# 一括検索は OpenBD・NDL への問い合わせを asyncio で並行に送る
+async_lookup = AsyncLookup(
+    ndl_api.cache, ndl_api.negative_cache, ndl_api.openbd_url, ndl_api.parse_openbd,
+    batch_size=ndl_api.openbd_batch_size,
+    ndl_url=ndl_api.base_url, ndl_params=ndl_api.ndl_params, parse_ndl=ndl_api.parse_ndl,
+    catalogue=ndl_api.catalogue
+)
 book_service = BookService()
+# カバー画像はワーカースレッドで1回だけ取得・縮小し、ディスクにキャッシュして返す
+cover_service = CoverService(
+    create_cover_cache(),
+    workers=int(os.getenv('COVER_WORKERS', '4')),
+    wait=float(os.getenv('COVER_WAIT', '5'))
+)
+# キャッシュ済みのカバー画像をブラウザに保持させる秒数
+COVER_MAX_AGE = int(os.getenv('COVER_MAX_AGE', str(30 * 24 * 3600)))
 
 @app.route('/api/book/<isbn>', methods=['GET'])
 def get_book_by_isbn(isbn):
@@ -22,14 +52,151 @@ def get_book_by_isbn(isbn):
             return jsonify(book_data)
         else:
             return jsonify({'error': '書籍が見つかりません'}), 404
+    except InvalidISBNError as e:
+        # チェックディジットまで確かめ、上流には問い合わせない
+        return jsonify({'error': str(e), 'isbn': e.isbn}), 400
+    except CircuitOpenError as e:
+        # 上流の障害中は待たずに断る
+        response = jsonify({'error': '書籍情報の取得を一時的に停止しています', 'source': e.source})
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response, 503
+    except UpstreamError as e:
+        return jsonify({'error': '書籍情報の取得に失敗しました', 'source': e.source}), 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cover/<isbn>', methods=['GET'])
+def get_cover(isbn):
+    try:
+        key = canonical_isbn(isbn)
+        if key is None:
+            return jsonify({'error': 'ISBNが無効です', 'isbn': isbn}), 400
+        
+        cover, complete, fallback_url = cover_service.lookup(
+            key, request.args.get('size', 'original'),
+            lambda: (ndl_api.get_book_by_isbn(key) or {}).get('coverImage', '')
+        )
+        if fallback_url:
+            # 取得が間に合わなければ元の URL に任せる（取得は続け、次からはキャッシュから返す）
+            response = redirect(fallback_url)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        if cover is None:
+            return jsonify({'error': 'カバー画像が見つかりません', 'isbn': isbn}), 404
+        
+        response = app.response_class(cover.data, mimetype=cover.content_type)
+        response.set_etag(cover.digest)
+        # 縮小版ができるまでは原寸を短い期限で返し、できてから取り直させる
+        response.headers['Cache-Control'] = f"public, max-age={COVER_MAX_AGE if complete else 60}"
+        return response.make_conditional(request)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except CircuitOpenError as e:
+        response = jsonify({'error': 'カバー画像の取得を一時的に停止しています', 'source': e.source})
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response, 503
+    except UpstreamError as e:
+        return jsonify({'error': 'カバー画像の取得に失敗しました', 'source': e.source}), 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/lookup', methods=['POST'])
+def lookup_books():
+    try:
+        data = request.get_json(silent=True) or {}
+        isbns = data.get('isbns')
+        if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+            return jsonify({'error': 'isbns は文字列の配列で指定してください'}), 400
+        if len(isbns) > MAX_LOOKUP_ISBNS:
+            return jsonify({'error': f'isbns は {MAX_LOOKUP_ISBNS} 件以内で指定してください'}), 400
+        
+        results = async_lookup.lookup_many_sync(isbns)
+        return jsonify(lookup_report(results))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/books', methods=['GET'])
 def get_all_books():
     try:
-        books = book_service.get_all_books()
-        return jsonify(books)
+        # ライブラリに変更がなければ本文を組み立てずに 304 を返す
+        etag = library_etag(book_service.get_version(), request.query_string)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        fields = parse_fields(request.args.get('fields'))
+        
+        if any(name in request.args for name in ('limit', 'cursor', 'sort', 'order', 'status')):
+            books, next_cursor = book_service.query_books(
+                sort=request.args.get('sort', 'created_at'),
+                order=request.args.get('order', 'asc'),
+                status=request.args.get('status'),
+                limit=request.args.get('limit', 50, type=int),
+                cursor=request.args.get('cursor'),
+                fields=fields
+            )
+            response = jsonify({'books': books, 'nextCursor': next_cursor})
+        else:
+            books = book_service.get_all_books()
+            response = jsonify([project(book, fields) for book in books])
+        
+        response.set_etag(etag)
+        return response
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/search', methods=['GET'])
+def search_books():
+    try:
+        etag = library_etag(book_service.get_version(), request.query_string)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        books, total, next_cursor = book_service.search_books(
+            request.args.get('q', ''),
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+            fields=parse_fields(request.args.get('fields'))
+        )
+        response = jsonify({'books': books, 'total': total, 'nextCursor': next_cursor})
+        response.set_etag(etag)
+        return response
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/changes', methods=['GET'])
+def get_book_changes():
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', 500, type=int)
+        if since < 0 or limit < 1:
+            return jsonify({'error': 'since または limit が不正です'}), 400
+        
+        return jsonify(book_service.get_changes(since, min(limit, 5000)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/export', methods=['GET'])
+def export_books():
+    # ジェネレータで少しずつ返すため、蔵書の量にかかわらずメモリ使用量は一定
+    return Response(
+        stream_with_context(export_ndjson(book_service.iter_books())),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=books.ndjson'}
+    )
+
+@app.route('/api/books/import', methods=['POST'])
+def import_books():
+    try:
+        report = import_ndjson(request.stream, book_service.import_books, BookModel.validate)
+        return jsonify(report)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -39,6 +206,10 @@ def save_book():
         book_data = request.get_json()
         saved_book = book_service.save_book(book_data)
         return jsonify(saved_book), 201
+    except InvalidBookError as e:
+        return jsonify({'error': str(e)}), 400
+    except DuplicateBookError as e:
+        return jsonify({'error': 'この書籍は既に登録されています', 'book': e.book}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -51,6 +222,8 @@ def update_book(book_id):
             return jsonify(updated_book)
         else:
             return jsonify({'error': '書籍が見つかりません'}), 404
+    except InvalidBookError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -65,6 +238,85 @@ def delete_book(book_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/books/<book_id>/sessions', methods=['POST'])
+def add_session(book_id):
+    try:
+        session_data = request.get_json()
+        error = SessionModel.validate(session_data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        session = book_service.add_session(book_id, session_data)
+        if session:
+            return jsonify(session), 201
+        else:
+            return jsonify({'error': '書籍が見つかりません'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<book_id>/sessions', methods=['GET'])
+def get_sessions(book_id):
+    try:
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit が不正です'}), 400
+        return jsonify(book_service.get_sessions(book_id, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def get_library_stats():
+    try:
+        top = request.args.get('top', DEFAULT_TOP, type=int)
+        if top < 1 or top > MAX_TOP:
+            return jsonify({'error': f'top は 1〜{MAX_TOP} の範囲で指定してください'}), 400
+        return jsonify(book_service.get_library_stats(top))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/daily', methods=['GET'])
+def get_daily_stats():
+    try:
+        # from / to は YYYY-MM-DD（集計済みの日別データを範囲で切り出すだけ）
+        return jsonify({
+            'days': book_service.get_daily_stats(request.args.get('from'), request.args.get('to'))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/weekly', methods=['GET'])
+def get_weekly_stats():
+    try:
+        # from / to は YYYY-Www
+        return jsonify({
+            'weeks': book_service.get_weekly_stats(request.args.get('from'), request.args.get('to'))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    stats = ndl_api.cache.stats()
+    stats['negative'] = ndl_api.negative_cache.stats()
+    stats['catalogue'] = ndl_api.catalogue.stats()
+    stats['covers'] = cover_service.stats()
+    return jsonify(stats)
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def get_upstream_stats():
+    stats = upstream_stats()
+    stats['lookup'] = ndl_api.lookup_stats()
+    stats['async'] = async_lookup.stats()
+    return jsonify(stats)
+
+@app.route('/api/upstream/breakers', methods=['GET'])
+def get_upstream_breakers():
+    return jsonify(breaker_stats())
+
+@app.route('/api/storage/stats', methods=['GET'])
+def get_storage_stats():
+    return jsonify(book_service.store.stats())
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'})
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import random
+import ssl
+import time
+from urllib.parse import urlencode, urlsplit
+
+from common.circuit_breaker import get_breaker
+from common.http_client import RETRY_STATUSES
+from common.upstream import UpstreamError
+
+
+class AsyncResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHTTPClient:
+    """標準ライブラリ（asyncio のストリーム）だけで動く HTTP/1.1 クライアント
+
+    UpstreamClient の非同期版。ホストごとに keep-alive の接続を limit_per_host 本まで
+    使い回し、タイムアウト・再試行（ジッター付き指数バックオフ）・サーキットブレーカーも
+    同じ方針で行う（ブレーカーは同じ名前の UpstreamClient と共有する）。
+    接続はイベントループに属するため、別のループから使われたらプールを作り直す。
+    """
+
+    def __init__(self, name, limit_per_host=8, connect_timeout=3.05, read_timeout=10.0,
+                 retries=2, backoff=0.2):
+        self.name = name
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self._loop = None
+        self._idle = {}
+        self._limits = {}
+        self.counters = {'requests': 0, 'failures': 0, 'retries': 0, 'timeouts': 0, 'connections': 0}
+        self.breaker = get_breaker(name)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._idle = {}
+            self._limits = {}
+
+    async def get(self, url, params=None):
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        return await self.request('GET', url)
+
+    async def post(self, url, data=None, idempotent=False):
+        return await self.request('POST', url, data=data, idempotent=idempotent)
+
+    async def request(self, method, url, data=None, idempotent=None):
+        """リクエストを送り、2xx の応答を返す（それ以外は UpstreamError）"""
+        self._bind_loop()
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        body = urlencode(data).encode('ascii') if data is not None else None
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                response = await self._send(method, url, body)
+            except asyncio.TimeoutError:
+                self.breaker.record(False)
+                self.counters['timeouts'] += 1
+                error = 'timeout'
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                self.breaker.record(False)
+                error = e
+            except BaseException:
+                # キャンセルなど。半開状態の試行枠を空けるため結果は記録する
+                self.breaker.record(False)
+                raise
+            else:
+                self.counters['requests'] += 1
+                self.breaker.record(
+                    response.status_code < 500 and response.status_code not in RETRY_STATUSES,
+                    time.perf_counter() - started
+                )
+                if response.status_code < 400:
+                    return response
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+
+            if attempt + 1 < attempts:
+                self.counters['retries'] += 1
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+        self.counters['failures'] += 1
+        raise UpstreamError(self.name, error)
+
+    async def _send(self, method, url, body):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.limit_per_host)
+
+        async with limit:
+            while True:
+                conn = await self._acquire(key)
+                try:
+                    response, keep_alive = await self._exchange(conn, method, parts, body)
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    conn.close()
+                    # 待機中にサーバー側で閉じられた接続なら、新しい接続でやり直す
+                    if conn.reused and not isinstance(e, asyncio.TimeoutError):
+                        continue
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+                if keep_alive:
+                    conn.reused = True
+                    self._idle.setdefault(key, []).append(conn)
+                else:
+                    conn.close()
+                return response
+
+    async def _acquire(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context), self.connect_timeout
+        )
+        self.counters['connections'] += 1
+        return _Connection(reader, writer)
+
+    async def _exchange(self, conn, method, parts, body):
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {parts.netloc}",
+            "Accept-Encoding: identity",
+            "Connection: keep-alive",
+        ]
+        if body is not None:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+            lines.append(f"Content-Length: {len(body)}")
+        conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await conn.writer.drain()
+        return await asyncio.wait_for(self._read_response(conn.reader), self.read_timeout)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n') + ' ').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b''.join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return AsyncResponse(int(status), headers, content), keep_alive
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['idle_connections'] = sum(len(idle) for idle in self._idle.values())
+        return stats
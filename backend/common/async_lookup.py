@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from common.async_http import AsyncHTTPClient
+from common.upstream import UpstreamError, partition_isbns, stale_or_error
+
+
+class AsyncLookup:
+    """NDLApi / OpenBDApi の一括検索（get_books_by_isbns）の asyncio 版
+
+    キャッシュ・ネガティブキャッシュと OpenBD・NDL の応答の解析は既存の API クラスのものを
+    そのまま使い、上流への問い合わせだけを並行にする。OpenBD へのまとめ問い合わせと、
+    OpenBD になかった ISBN の NDL への問い合わせを、全体で concurrency 件、
+    ホストごとに limit_per_host 接続までに抑えて同時に送る。concurrency は同時に来た
+    一括検索どうしでも共有する上限で、1回の一括検索は deadline 秒で打ち切る（間に合わなかった
+    ISBN は期限切れのキャッシュがあればそれを、なければ error を返す）。
+    parse_ndl を渡さなければ NDL には問い合わせない（サーバーレス版）。
+
+    Flask のルートからは lookup_many_sync を使う。専用のスレッドでイベントループを
+    動かし続けるので、リクエストをまたいで keep-alive の接続が使い回される。
+    """
+
+    def __init__(self, cache, negative_cache, openbd_url, parse_openbd, batch_size=1000,
+                 ndl_url=None, ndl_params=None, parse_ndl=None, concurrency=None, limit_per_host=None,
+                 catalogue=None, deadline=None):
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.catalogue = catalogue
+        self.openbd_url = openbd_url
+        self.parse_openbd = parse_openbd
+        self.batch_size = batch_size
+        self.ndl_url = ndl_url
+        self.ndl_params = ndl_params
+        self.parse_ndl = parse_ndl
+        self.concurrency = concurrency or int(os.getenv('LOOKUP_CONCURRENCY', '64'))
+        limit_per_host = limit_per_host or int(os.getenv('LOOKUP_PER_HOST', '8'))
+        self.deadline = deadline or float(os.getenv('LOOKUP_DEADLINE', '30'))
+
+        timeouts = {
+            'connect_timeout': float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05')),
+            'read_timeout': float(os.getenv('UPSTREAM_READ_TIMEOUT', '10')),
+            'retries': int(os.getenv('UPSTREAM_RETRIES', '2')),
+        }
+        self.openbd_client = AsyncHTTPClient('openbd', limit_per_host, **timeouts)
+        self.ndl_client = AsyncHTTPClient('ndl', limit_per_host, **timeouts) if parse_ndl else None
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        # asyncio.Semaphore はイベントループに結び付くため、ループごとに1つ作って使い回す
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.counters = {'batches': 0, 'deadline_exceeded': 0}
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    async def _gather_until(self, coros, expires, source):
+        """coros を並行に実行し、結果（または例外）を順に返す
+
+        ループの時刻で expires を過ぎても終わらないものは取り消し、UpstreamError を結果とする。
+        """
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        if not tasks:
+            return []
+        loop = asyncio.get_running_loop()
+        _, pending = await asyncio.wait(tasks, timeout=max(0.0, expires - loop.time()))
+        if pending:
+            self.counters['deadline_exceeded'] += 1
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return [
+            UpstreamError(source, 'lookup deadline exceeded') if task in pending
+            else task.exception() or task.result()
+            for task in tasks
+        ]
+
+    async def lookup_many(self, isbns):
+        """複数の ISBN を並行して検索し、正規化 ISBN → (状態, 書籍) を入力順で返す"""
+        results, pending = partition_isbns(isbns, self.cache, self.negative_cache, self.catalogue)
+        self.counters['batches'] += 1
+        expires = asyncio.get_running_loop().time() + self.deadline
+
+        semaphore = self._semaphore()
+        chunks = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        books = await self._gather_until((self._openbd(chunk, semaphore) for chunk in chunks), expires, 'openbd')
+
+        misses = []
+        for chunk, chunk_books in zip(chunks, books):
+            if isinstance(chunk_books, BaseException):
+                if not isinstance(chunk_books, UpstreamError):
+                    raise chunk_books
+                print(f"openbd batch lookup failed: {chunk_books}")
+                chunk_books = None
+            if chunk_books is None:
+                # OpenBD が応答しなくても NDL で見つかる可能性はある
+                misses.extend((isbn, True) for isbn in chunk)
+                continue
+            for isbn, book_data in zip(chunk, chunk_books):
+                if book_data:
+                    self.cache.set(isbn, book_data)
+                    results[isbn] = ('found', book_data)
+                else:
+                    misses.append((isbn, False))
+
+        ndl_books = await self._gather_until((self._ndl(isbn, semaphore) for isbn, _ in misses), expires, 'ndl')
+        for (isbn, openbd_failed), book_data in zip(misses, ndl_books):
+            if isinstance(book_data, BaseException):
+                if not isinstance(book_data, UpstreamError):
+                    raise book_data
+                print(f"ndl lookup failed: {book_data}")
+                results[isbn] = stale_or_error(self.cache, isbn)
+            elif book_data:
+                self.cache.set(isbn, book_data)
+                results[isbn] = ('found', book_data)
+            elif openbd_failed:
+                results[isbn] = stale_or_error(self.cache, isbn)
+            else:
+                self.negative_cache.set(isbn, {
+                    'sources': ['openbd', 'ndl'] if self.parse_ndl else ['openbd'],
+                    'checkedAt': time.time()
+                })
+                results[isbn] = ('not_found', None)
+
+        return results
+
+    async def _openbd(self, chunk, semaphore):
+        async with semaphore:
+            try:
+                if len(chunk) == 1:
+                    response = await self.openbd_client.get(self.openbd_url, params={'isbn': chunk[0]})
+                else:
+                    response = await self.openbd_client.post(
+                        self.openbd_url, data={'isbn': ','.join(chunk)}, idempotent=True
+                    )
+                data = response.json()
+            except (UpstreamError, ValueError) as e:
+                print(f"openbd batch lookup failed: {e}")
+                return None
+
+        if not isinstance(data, list) or len(data) != len(chunk):
+            print("openbd batch lookup failed: unexpected response length")
+            return None
+        return [
+            self.parse_openbd(isbn, book_info) if book_info else None
+            for isbn, book_info in zip(chunk, data)
+        ]
+
+    async def _ndl(self, isbn, semaphore):
+        if self.parse_ndl is None:
+            return None
+        async with semaphore:
+            response = await self.ndl_client.get(self.ndl_url, params=self.ndl_params(isbn))
+        return self.parse_ndl(isbn, response.content)
+
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name='async-lookup', daemon=True
+                ).start()
+            return self._loop
+
+    def lookup_many_sync(self, isbns):
+        """同期コード（Flask のルート）から lookup_many を呼ぶ"""
+        future = asyncio.run_coroutine_threadsafe(self.lookup_many(isbns), self._event_loop())
+        return future.result()
+
+    def stats(self):
+        stats = dict(self.counters, concurrency=self.concurrency, deadline=self.deadline)
+        stats['openbd'] = self.openbd_client.stats()
+        if self.ndl_client is not None:
+            stats['ndl'] = self.ndl_client.stats()
+        return stats
@@ -0,0 +1,144 @@
+import base64
+import bisect
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from models.book_model import as_count
+
+SORT_FIELDS = ('created_at', 'updated_at', 'title', 'currentPage', 'readingTime')
+STATUSES = ('completed', 'reading', 'unread')
+MAX_LIMIT = 500
+
+
+class QueryError(ValueError):
+    """クエリパラメータが不正（400 を返す）"""
+
+
+def book_status(book):
+    total_pages = as_count(book.get('totalPages'))
+    current_page = as_count(book.get('currentPage'))
+    if total_pages > 0 and current_page >= total_pages:
+        return 'completed'
+    if current_page > 0:
+        return 'reading'
+    return 'unread'
+
+
+def parse_fields(fields):
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    # id はカーソルや更新に必要なので常に含める
+    return ['id'] + [name for name in names if name != 'id']
+
+
+def project(book, fields):
+    if fields is None:
+        return book
+    return {name: book[name] for name in fields if name in book}
+
+
+def _sort_key(book, sort):
+    value = book.get(sort)
+    # 検証なしで保存された古いデータの型が混ざっていても並べられるようにそろえる
+    if sort in ('currentPage', 'readingTime'):
+        return (as_count(value), book['id'])
+    if not isinstance(value, str):
+        value = '' if value is None else str(value)
+    return (value, book['id'])
+
+
+def library_etag(version, query_string=b''):
+    """ライブラリの version とクエリ文字列から強い ETag の値を作る"""
+    return f"v{version}-{zlib.crc32(query_string):08x}"
+
+
+def encode_cursor(key):
+    raw = json.dumps(key, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise QueryError('cursor が不正です')
+    if not isinstance(key, list) or len(key) != 2:
+        raise QueryError('cursor が不正です')
+    return tuple(key)
+
+
+class LibraryQuery:
+    """書籍一覧のページング・絞り込み・並び替え
+
+    並び替え済みの一覧はライブラリの version ごとにキャッシュするため、同じ
+    version の間はページ取得が O(log N + limit) で済む。
+    """
+
+    def __init__(self, store, cache_size=8):
+        self.store = store
+        self.cache_size = cache_size
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _view(self, sort, status):
+        version = self.store.version
+        cache_key = (version, sort, status)
+
+        with self._lock:
+            view = self._views.get(cache_key)
+            if view is not None:
+                self._views.move_to_end(cache_key)
+                return view
+
+        books = self.store.all()
+        if status is not None:
+            books = [book for book in books if book_status(book) == status]
+        books.sort(key=lambda book: _sort_key(book, sort))
+        keys = [_sort_key(book, sort) for book in books]
+        view = (keys, books)
+
+        with self._lock:
+            # 古い version のビューは不要になるので捨てる
+            for stale in [key for key in self._views if key[0] != version]:
+                del self._views[stale]
+            self._views[cache_key] = view
+            while len(self._views) > self.cache_size:
+                self._views.popitem(last=False)
+
+        return view
+
+    def page(self, sort='created_at', order='asc', status=None, limit=50, cursor=None, fields=None):
+        if sort not in SORT_FIELDS:
+            raise QueryError(f"sort は {', '.join(SORT_FIELDS)} のいずれかを指定してください")
+        if order not in ('asc', 'desc'):
+            raise QueryError('order は asc または desc を指定してください')
+        if status is not None and status not in STATUSES:
+            raise QueryError(f"status は {', '.join(STATUSES)} のいずれかを指定してください")
+        if limit < 1 or limit > MAX_LIMIT:
+            raise QueryError(f'limit は 1〜{MAX_LIMIT} の範囲で指定してください')
+
+        keys, books = self._view(sort, status)
+        cursor_key = decode_cursor(cursor) if cursor else None
+
+        try:
+            if order == 'asc':
+                start = bisect.bisect_right(keys, cursor_key) if cursor_key else 0
+                selected = books[start:start + limit]
+                has_more = start + limit < len(books)
+            else:
+                end = bisect.bisect_left(keys, cursor_key) if cursor_key else len(books)
+                selected = books[max(0, end - limit):end][::-1]
+                has_more = end - limit > 0
+        except TypeError:
+            # 別の sort 指定で発行されたカーソル
+            raise QueryError('cursor が sort の指定と一致しません')
+
+        next_cursor = None
+        if has_more and selected:
+            next_cursor = encode_cursor(_sort_key(selected[-1], sort))
+
+        return [project(book, fields) for book in selected], next_cursor
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import deque
+
+from common.upstream import UpstreamError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 状態遷移の履歴を何件まで残すか
+TRANSITION_HISTORY = 20
+
+
+class CircuitOpenError(UpstreamError):
+    """遮断中の上流への問い合わせを、送らずに失敗させた"""
+
+    def __init__(self, source, retry_after):
+        super().__init__(source, 'circuit open')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """上流ごとのサーキットブレーカー
+
+    closed: 直近 window 回の呼び出しのうち、失敗（タイムアウト・接続エラー・5xx/429）または
+            slow_call_seconds を超えた応答の割合が failure_rate 以上になったら open にする
+            （min_calls 回に満たないうちは判定しない）。
+    open:   open_seconds の間は問い合わせを送らず CircuitOpenError で即座に失敗させる。
+    half_open: open_seconds が過ぎたら probe_calls 回まで試しに通し、すべて成功すれば closed、
+            1回でも失敗すれば再び open に戻す。
+    """
+
+    def __init__(self, name, window=20, min_calls=10, failure_rate=0.5, slow_call_seconds=5.0,
+                 open_seconds=30.0, probe_calls=3):
+        self.name = name
+        self.window = window
+        self.min_calls = min(min_calls, window)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.probe_calls = probe_calls
+
+        self.state = CLOSED
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self.transitions = deque(maxlen=TRANSITION_HISTORY)
+        self.counters = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0}
+
+    def _transition(self, state, reason):
+        self.transitions.append({'from': self.state, 'to': state, 'at': time.time(), 'reason': reason})
+        print(f"circuit {self.name}: {self.state} -> {state} ({reason})")
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._probes = self._probe_successes = 0
+        else:
+            self._calls.clear()
+
+    def before_call(self):
+        """問い合わせを送ってよければ何もせず、遮断中なら CircuitOpenError を送出する
+
+        送った問い合わせの結果は必ず record で記録すること。
+        """
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.counters['rejected'] += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN, 'open timeout elapsed')
+            if self.state == HALF_OPEN:
+                if self._probes >= self.probe_calls:
+                    self.counters['rejected'] += 1
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._probes += 1
+
+    def record(self, success, seconds=0.0):
+        slow = success and seconds > self.slow_call_seconds
+        with self._lock:
+            self.counters['calls'] += 1
+            if not success:
+                self.counters['failures'] += 1
+            if slow:
+                self.counters['slow_calls'] += 1
+
+            if self.state == HALF_OPEN:
+                if not success or slow:
+                    self._transition(OPEN, 'probe failed' if not success else 'probe slow')
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probe_calls:
+                        self._transition(CLOSED, 'probes succeeded')
+                return
+            if self.state == OPEN:
+                # 遮断前に送っていた問い合わせの結果は判定に使わない
+                return
+
+            self._calls.append((success, slow))
+            if len(self._calls) >= self.min_calls:
+                failures = sum(1 for ok, _ in self._calls if not ok)
+                slow_calls = sum(1 for _, is_slow in self._calls if is_slow)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self._transition(OPEN, f'failure rate {failures}/{len(self._calls)}')
+                elif slow_calls / len(self._calls) >= self.failure_rate:
+                    self._transition(OPEN, f'slow call rate {slow_calls}/{len(self._calls)}')
+
+    def stats(self):
+        with self._lock:
+            calls = list(self._calls)
+            stats = dict(self.counters)
+            stats['state'] = self.state
+            if self.state == OPEN:
+                stats['retry_after'] = max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+            stats['transitions'] = list(self.transitions)
+        stats['window'] = {
+            'calls': len(calls),
+            'failure_rate': sum(1 for ok, _ in calls if not ok) / len(calls) if calls else 0.0,
+            'slow_call_rate': sum(1 for _, slow in calls if slow) / len(calls) if calls else 0.0,
+        }
+        return stats
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """上流ごとに1つのブレーカーを共有する（同期・非同期のクライアントで共通）
+
+    しきい値は BREAKER_FAILURE_RATE / BREAKER_SLOW_CALL_SECONDS / BREAKER_OPEN_SECONDS
+    （秒）/ BREAKER_WINDOW で設定する。
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=int(os.getenv('BREAKER_WINDOW', '20')),
+                failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+                slow_call_seconds=float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '5')),
+                open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', '30')),
+            )
+        return breaker
+
+
+def breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
@@ -0,0 +1,165 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from urllib.parse import urlsplit
+
+from common.book_query import QueryError
+from common.http_client import get_client
+from common.upstream import UpstreamError
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow がなければ縮小版は作らず原寸の画像を返す
+    Image = None
+
+ORIGINAL = 'original'
+# 縮小版の名前と幅（px）。一覧の表示枠（幅 120px）の等倍と 2 倍
+THUMBNAIL_SIZES = {'small': 120, 'medium': 240}
+SIZES = (ORIGINAL,) + tuple(THUMBNAIL_SIZES)
+# これより大きい画像は取得を打ち切る
+MAX_COVER_BYTES = 5 * 1024 * 1024
+# 画像のなかった ISBN を再取得しない秒数
+MISSING_TTL = 600
+
+
+class CoverService:
+    """/api/cover/<isbn> の画像の取得・縮小・キャッシュ
+
+    キャッシュにない画像はワーカースレッドで1回だけ取得し、原寸を保存したら縮小版の
+    作成を別の仕事として積む。リクエストは原寸の保存までを最大 wait 秒待ち、縮小版が
+    まだなければ原寸を短い有効期限で返す（縮小の完了は待たない）。wait 秒で取得が
+    終わらなければ元の URL へのリダイレクトを返し、取得はそのまま続ける。
+    同じ ISBN の取得・縮小が同時に求められても、仕事は1つだけ積む。
+    """
+
+    def __init__(self, cache, workers=4, wait=5.0):
+        self.cache = cache
+        self.wait = wait
+        self.client = get_client('cover')
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cover')
+        self._pending = {}
+        self._missing = {}
+        self._lock = threading.Lock()
+        self.counters = {'fetches': 0, 'thumbnails': 0, 'redirects': 0, 'missing': 0, 'failures': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def lookup(self, isbn, size, url_of):
+        """(Cover または None, 長くキャッシュしてよいか, リダイレクト先の URL または None) を返す
+
+        url_of はキャッシュにないときだけ呼ぶ、元画像の URL を返す関数（なければ空文字）。
+        """
+        if size not in SIZES:
+            raise QueryError(f"size は {', '.join(SIZES)} のいずれかを指定してください")
+
+        cover = self.cache.get(isbn, size)
+        if cover is not None:
+            return cover, True, None
+
+        original = self.cache.get(isbn, ORIGINAL) if size != ORIGINAL else None
+        if original is None:
+            with self._lock:
+                missing_at = self._missing.get(isbn)
+            if missing_at is not None and time.time() - missing_at < MISSING_TTL:
+                return None, False, None
+            url = url_of()
+            if not url or urlsplit(url).scheme not in ('http', 'https'):
+                return None, False, None
+            future = self._submit(('fetch', isbn), self._fetch, isbn, url)
+            try:
+                original = future.result(timeout=self.wait)
+            except TimeoutError:
+                self._count('redirects')
+                return None, False, url
+            if original is None:
+                return None, False, None
+            if size == ORIGINAL:
+                return original, True, None
+
+        if Image is None:
+            # 縮小版は作れないので、原寸をそのまま長くキャッシュさせる
+            return original, True, None
+        self._submit(('thumbnails', isbn), self._thumbnails, isbn, original)
+        return original, False, None
+
+    def _submit(self, key, fn, *args):
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self._pending[key] = self._executor.submit(fn, *args)
+        # 終わっていればその場で呼ばれるので、ロックの外で登録する
+        future.add_done_callback(lambda done: self._done(key, done))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _fetch(self, isbn, url):
+        self._count('fetches')
+        try:
+            response = self.client.get(url, stream=True)
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            chunks = []
+            total = 0
+            for chunk in self.client.stream(response):
+                total += len(chunk)
+                if total > MAX_COVER_BYTES:
+                    raise UpstreamError('cover', f'cover larger than {MAX_COVER_BYTES} bytes')
+                chunks.append(chunk)
+        except UpstreamError as e:
+            print(f"Cover fetch failed for {isbn}: {e}")
+            self._count('failures')
+            raise
+        if not content_type.startswith('image/') or not total:
+            self._count('missing')
+            now = time.time()
+            with self._lock:
+                if len(self._missing) >= 10000:
+                    self._missing = {key: at for key, at in self._missing.items() if now - at < MISSING_TTL}
+                self._missing[isbn] = now
+            return None
+
+        original = self.cache.put(isbn, ORIGINAL, b''.join(chunks), content_type)
+        if Image is not None:
+            self._submit(('thumbnails', isbn), self._thumbnails, isbn, original)
+        return original
+
+    def _thumbnails(self, isbn, original):
+        for size, width in THUMBNAIL_SIZES.items():
+            if self.cache.get(isbn, size) is not None:
+                continue
+            try:
+                data = make_thumbnail(original.data, width)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # 壊れた画像や未対応の形式は、原寸をその大きさの画像として扱う
+                print(f"Cover thumbnail failed for {isbn}: {e}")
+                self.cache.put(isbn, size, original.data, original.content_type)
+                continue
+            self.cache.put(isbn, size, data, 'image/jpeg')
+            self._count('thumbnails')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['pending'] = len(self._pending)
+        stats['thumbnails_enabled'] = Image is not None
+        stats['cache'] = self.cache.stats()
+        return stats
+
+
+def make_thumbnail(data, width):
+    """幅 width 以下（高さは幅の 2 倍まで）に縮めた JPEG を返す。元より大きくはしない"""
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG はデコードの段階で縮小して読み込む
+        image.draft('RGB', (width, width * 2))
+        image = image.convert('RGB')
+    image.thumbnail((width, width * 2))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
@@ -0,0 +1,195 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.circuit_breaker import get_breaker
+from common.upstream import UpstreamError
+
+# 一時的な障害とみなして再試行するステータス
+RETRY_STATUSES = (429, 502, 503, 504)
+# 直近何件のレイテンシから分位点を出すか
+LATENCY_WINDOW = 1000
+
+
+class UpstreamClient:
+    """上流 API 用の HTTP クライアント
+
+    ホストごとに keep-alive の Session（接続プール）を共有し、接続・読み取りの
+    タイムアウト、冪等なリクエストの再試行（ジッター付き指数バックオフ）、
+    リクエスト全体の期限（deadline）を設ける。失敗は UpstreamError として送出する。
+    上流ごとのサーキットブレーカーが遮断中なら、送らずに CircuitOpenError で失敗させる。
+    """
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff=0.2, deadline=15.0, pool_size=10):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.pool_size = pool_size
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {'requests': 0, 'failures': 0, 'retries': 0, 'timeouts': 0}
+        self.breaker = get_breaker(name)
+
+    def _session(self, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # 再試行は自前で行うため、アダプタ側では再試行しない
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+        return session
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, idempotent=False, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def request(self, method, url, idempotent=None, deadline=None, **kwargs):
+        """リクエストを送り、2xx の応答を返す（それ以外は UpstreamError）"""
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        session = self._session(url)
+        expires = time.monotonic() + (deadline or self.deadline)
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                self._record_failure()
+                raise UpstreamError(self.name, 'deadline exceeded')
+
+            self.breaker.before_call()
+            started = time.perf_counter()
+            error = None
+            try:
+                response = session.request(
+                    method, url,
+                    timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining)),
+                    **kwargs
+                )
+            except requests.Timeout as e:
+                self.breaker.record(False)
+                self._count('timeouts')
+                error = e
+            except requests.ConnectionError as e:
+                self.breaker.record(False)
+                error = e
+            except requests.RequestException as e:
+                # URL の誤りなど、再試行しても結果が変わらないもの
+                self.breaker.record(False)
+                self._record_failure()
+                raise UpstreamError(self.name, e)
+            else:
+                elapsed = time.perf_counter() - started
+                self._record_latency(elapsed)
+                # 404 などは上流が正常に応答したものとして扱う
+                self.breaker.record(response.status_code < 500 and response.status_code not in RETRY_STATUSES, elapsed)
+                if response.status_code < 400:
+                    return response
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    self._record_failure()
+                    raise UpstreamError(self.name, error)
+
+            if attempt + 1 < attempts:
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                if time.monotonic() + delay >= expires:
+                    break
+                self._count('retries')
+                time.sleep(delay)
+
+        self._record_failure()
+        raise UpstreamError(self.name, error)
+
+    def stream(self, response, chunk_size=64 * 1024):
+        """stream=True で受けた応答の本文を断片ごとに返す（途中の通信エラーも UpstreamError にする）"""
+        try:
+            yield from response.iter_content(chunk_size)
+        except requests.RequestException as e:
+            self._record_failure()
+            raise UpstreamError(self.name, e)
+        finally:
+            response.close()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self.counters['requests'] += 1
+            self._latencies.append(seconds * 1000)
+
+    def _record_failure(self):
+        self._count('failures')
+
+    def latency_percentile(self, percentile):
+        """直近の応答時間（ミリ秒）の分位点。記録がなければ None"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            samples = sorted(self._latencies)
+        if samples:
+            stats['latency_ms'] = {
+                'avg': sum(samples) / len(samples),
+                'p50': samples[len(samples) // 2],
+                'p90': samples[min(len(samples) - 1, int(len(samples) * 0.9))],
+                'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                'max': samples[-1],
+            }
+        else:
+            stats['latency_ms'] = None
+        return stats
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """上流ごとに1つのクライアントを共有する
+
+    タイムアウト等は UPSTREAM_CONNECT_TIMEOUT / UPSTREAM_READ_TIMEOUT /
+    UPSTREAM_RETRIES / UPSTREAM_DEADLINE（秒）で設定する。
+    """
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = UpstreamClient(
+                name,
+                connect_timeout=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05')),
+                read_timeout=float(os.getenv('UPSTREAM_READ_TIMEOUT', '10')),
+                retries=int(os.getenv('UPSTREAM_RETRIES', '2')),
+                deadline=float(os.getenv('UPSTREAM_DEADLINE', '15')),
+            )
+        return client
+
+
+def upstream_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
@@ -0,0 +1,87 @@
+import re
+from functools import lru_cache
+from operator import mul
+
+_NON_ISBN_CHARS = re.compile(r'[^0-9X]')
+_ISBN10 = re.compile(r'\d{9}[\dX]')
+_ISBN13 = re.compile(r'97[89]\d{10}')
+# 全角の数字・X もそのまま受け付ける
+_FULLWIDTH = str.maketrans('０１２３４５６７８９Ｘｘ', '0123456789XX')
+_ISBN10_WEIGHTS = range(10, 1, -1)
+
+
+class InvalidISBNError(ValueError):
+    """ISBN-10 / ISBN-13 として正しくない（桁数・接頭辞・チェックディジット）"""
+
+    def __init__(self, isbn):
+        super().__init__(f"ISBN が正しくありません: {isbn}")
+        self.isbn = isbn
+
+
+def _strip(isbn):
+    return _NON_ISBN_CHARS.sub('', str(isbn).translate(_FULLWIDTH).upper())
+
+
+def isbn10_check_digit(digits):
+    """先頭9桁から ISBN-10 のチェックディジットを求める"""
+    remainder = (11 - sum(map(mul, _ISBN10_WEIGHTS, map(int, digits))) % 11) % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+
+def isbn13_check_digit(digits):
+    """先頭12桁から ISBN-13 のチェックディジットを求める"""
+    total = sum(map(int, digits[0:12:2])) + 3 * sum(map(int, digits[1:12:2]))
+    return str((10 - total % 10) % 10)
+
+
+def is_isbn10(isbn):
+    return bool(_ISBN10.fullmatch(isbn)) and isbn10_check_digit(isbn[:9]) == isbn[9]
+
+
+def is_isbn13(isbn):
+    return bool(_ISBN13.fullmatch(isbn)) and isbn13_check_digit(isbn[:12]) == isbn[12]
+
+
+def isbn10_to_13(isbn):
+    core = '978' + isbn[:9]
+    return core + isbn13_check_digit(core)
+
+
+def isbn13_to_10(isbn):
+    """978 で始まる ISBN-13 を ISBN-10 にする。979 で始まるものには ISBN-10 がないので None"""
+    if not isbn.startswith('978'):
+        return None
+    core = isbn[3:12]
+    return core + isbn10_check_digit(core)
+
+
+# キャッシュ・索引の参照のたびに同じ ISBN を検証し直さない
+@lru_cache(maxsize=16384)
+def canonical_isbn(isbn):
+    """ISBN-10 / ISBN-13 を ISBN-13（数字のみ）にそろえる。正しくなければ None"""
+    if not isbn:
+        return None
+    cleaned = _strip(isbn)
+    if len(cleaned) == 13:
+        return cleaned if is_isbn13(cleaned) else None
+    if len(cleaned) == 10 and is_isbn10(cleaned):
+        return isbn10_to_13(cleaned)
+    return None
+
+
+def parse_isbn(isbn):
+    """canonical_isbn と同じだが、正しくなければ InvalidISBNError を送出する"""
+    canonical = canonical_isbn(isbn)
+    if canonical is None:
+        raise InvalidISBNError(isbn)
+    return canonical
+
+
+def normalize_isbn(isbn):
+    """キャッシュ・索引のキー。正しい ISBN なら ISBN-13 に、そうでなければ数字と X だけにする
+
+    同じ本の ISBN-10 と ISBN-13 は同じキーになる。
+    """
+    if not isbn:
+        return ''
+    return canonical_isbn(isbn) or _strip(isbn)
@@ -0,0 +1,311 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from array import array
+
+from common.book_query import QueryError, decode_cursor, encode_cursor, project
+
+# 検索する項目と、BM25F の重み（タイトルでの一致を著者・出版社より重く見る）
+FIELD_WEIGHTS = (('title', 3), ('author', 2), ('publisher', 1))
+K1 = 1.2
+B = 0.75
+MAX_LIMIT = 100
+MAX_QUERY_LENGTH = 200
+# 削除・更新で使われなくなった文書がこの割合を超えたら、次の検索の前に詰め直す
+COMPACT_RATIO = 0.25
+COMPACT_MIN_DEAD = 1000
+
+# カタカナ → ひらがな（「ココロ」でも「こころ」でも見つかるように）
+_KANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_text(text):
+    """全角・半角（NFKC）、大文字・小文字、カタカナ・ひらがなの違いをそろえる"""
+    return unicodedata.normalize('NFKC', text).casefold().translate(_KANA)
+
+
+def tokenize(text):
+    """正規化した文字列を、空白・記号で区切った語ごとに文字 bigram にする
+
+    1文字だけの語はその1文字を語とする。形態素解析を使わないので、日本語の
+    複合語でも部分一致（2文字以上）で見つかる。
+    """
+    tokens = []
+    for word in _SEPARATORS.split(normalize_text(text)):
+        if len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _contains(docs, doc):
+    position = bisect.bisect_left(docs, doc)
+    return position < len(docs) and docs[position] == doc
+
+
+class _Postings:
+    """1つの語を含む文書番号（昇順）と重み付きの出現回数"""
+
+    __slots__ = ('docs', 'tfs')
+
+    def __init__(self):
+        self.docs = array('I')
+        self.tfs = array('H')
+
+
+class LibrarySearch:
+    """蔵書のタイトル・著者・出版社に対する全文検索（文字 bigram の転置索引と BM25）
+
+    索引は最初の検索のときにストレージから作り、以降は検索の前にストアの version を比べ、
+    changes_since で登録・更新・削除の差分だけを取り込む（このワーカーの変更も他のワーカーの
+    変更も同じ）。索引を触るのは検索だけなので、保存は索引の作成・詰め直し・検索を待たない。
+    文書番号は追加順に振るので各語の文書番号の配列は常に昇順で、末尾に足すだけで済む。
+    更新・削除した文書は番号を欠番にしておき、欠番が増えたら検索の前にまとめて詰め直す。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._built = False
+        # 索引に反映済みのストアの version
+        self._version = 0
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}
+        # 1文字の検索語を、その文字を含む語に広げるための索引
+        self._chars = {}
+        self._doc_ids = []
+        self._lengths = array('I')
+        # 索引した文字列のハッシュ。読書時間の更新など、検索対象の変わらない更新は索引し直さない
+        self._hashes = array('q')
+        self._docs = {}
+        self._total_length = 0
+        self._dead = 0
+
+    def _sync(self):
+        """他のワーカーによる登録・更新・削除をストアの変更履歴から取り込む（self._lock を持って呼ぶ）"""
+        # 先に version を読むことで、取り込んだ後の変更を取りこぼさない
+        version = self.store.version
+        if self._built and version == self._version:
+            return
+        changes = self.store.changes_since(self._version) if self._built else None
+        if changes is None:
+            # 初回、または古い削除履歴が破棄されていて差分を作れないときは作り直す
+            self._reset()
+            for book in self.store.iter_all():
+                self._add(book)
+            self._built = True
+            self._version = version
+            return
+        for revision, book_id, book in changes:
+            if book is None:
+                self._remove(book_id)
+            else:
+                self._add(book)
+        self._version = max([version] + [revision for revision, _, _ in changes[-1:]])
+
+    def _add(self, book):
+        fields = [(book.get(name) or '', weight) for name, weight in FIELD_WEIGHTS]
+        text_hash = hash(tuple(text for text, _ in fields))
+        doc = self._docs.get(book['id'])
+        if doc is not None:
+            if self._hashes[doc] == text_hash:
+                return
+            self._remove(book['id'])
+
+        counts = {}
+        length = 0
+        for text, weight in fields:
+            if not isinstance(text, str):
+                text = str(text)
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + weight
+                length += weight
+
+        doc = len(self._doc_ids)
+        self._doc_ids.append(book['id'])
+        self._lengths.append(length)
+        self._hashes.append(text_hash)
+        self._docs[book['id']] = doc
+        self._total_length += length
+        for token, count in counts.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = _Postings()
+                for char in set(token):
+                    self._chars.setdefault(char, set()).add(token)
+            postings.docs.append(doc)
+            postings.tfs.append(min(count, 0xFFFF))
+
+    def _remove(self, book_id):
+        doc = self._docs.pop(book_id, None)
+        if doc is None:
+            return
+        self._doc_ids[doc] = None
+        self._total_length -= self._lengths[doc]
+        self._dead += 1
+
+    def _compact(self):
+        # 欠番を除いて文書番号を振り直す（順序は保つので各配列は昇順のまま）
+        remap = array('l', [-1]) * len(self._doc_ids)
+        doc_ids = []
+        lengths = array('I')
+        hashes = array('q')
+        for doc, book_id in enumerate(self._doc_ids):
+            if book_id is not None:
+                remap[doc] = len(doc_ids)
+                doc_ids.append(book_id)
+                lengths.append(self._lengths[doc])
+                hashes.append(self._hashes[doc])
+
+        for token in list(self._postings):
+            postings = self._postings[token]
+            compacted = _Postings()
+            for doc, tf in zip(postings.docs, postings.tfs):
+                new_doc = remap[doc]
+                if new_doc >= 0:
+                    compacted.docs.append(new_doc)
+                    compacted.tfs.append(tf)
+            if compacted.docs:
+                self._postings[token] = compacted
+            else:
+                del self._postings[token]
+                for char in set(token):
+                    self._chars[char].discard(token)
+
+        self._doc_ids = doc_ids
+        self._lengths = lengths
+        self._hashes = hashes
+        self._docs = {book_id: doc for doc, book_id in enumerate(doc_ids)}
+        self._dead = 0
+
+    def _term(self, token):
+        """検索語1つ分の (文書番号の列, 出現回数の列, 文書頻度)"""
+        if len(token) > 1:
+            postings = self._postings.get(token)
+            if postings is None:
+                return None
+            return postings.docs, postings.tfs, len(postings.docs)
+        # 1文字の検索語は、その文字を含むすべての語の和とする
+        merged = {}
+        for term in self._chars.get(token, ()):
+            postings = self._postings[term]
+            for doc, tf in zip(postings.docs, postings.tfs):
+                merged[doc] = merged.get(doc, 0) + tf
+        if not merged:
+            return None
+        return merged, merged, len(merged)
+
+    def _score(self, query):
+        """query のすべての語を含む文書を、文書番号 → BM25 のスコアで返す"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return {}
+        terms = []
+        for token in tokens:
+            term = self._term(token)
+            if term is None:
+                return {}
+            terms.append(term)
+        # 文書頻度の小さい語から絞り込む
+        terms.sort(key=lambda term: term[2])
+
+        # 積集合は set の演算（C 実装）で取る。候補が少なくなったら二分探索で確かめる
+        candidates = set(terms[0][0])
+        for docs, _, df in terms[1:]:
+            if isinstance(docs, dict):
+                # 1文字の語は文書番号 → 出現回数の dict
+                candidates = {doc for doc in candidates if doc in docs}
+            elif len(candidates) * 16 < df:
+                candidates = {doc for doc in candidates if _contains(docs, doc)}
+            else:
+                candidates.intersection_update(docs)
+            if not candidates:
+                return {}
+
+        total_docs = len(self._doc_ids)
+        live_docs = total_docs - self._dead
+        average_length = self._total_length / live_docs if live_docs else 1.0
+        doc_ids = self._doc_ids
+        lengths = self._lengths
+        norm_of = K1 * B / average_length
+        norms = {doc: K1 * (1 - B) + norm_of * lengths[doc] for doc in candidates if doc_ids[doc] is not None}
+        scores = dict.fromkeys(norms, 0.0)
+
+        for docs, tfs, df in terms:
+            # 欠番も数に含めた文書頻度で近似する（詰め直すまでのわずかな誤差）
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) * (K1 + 1)
+            if isinstance(docs, dict):
+                tf_of = docs.__getitem__
+            elif len(scores) * 16 < df:
+                tf_of = lambda doc, docs=docs, tfs=tfs: tfs[bisect.bisect_left(docs, doc)]
+            else:
+                tf_of = dict(zip(docs, tfs)).__getitem__
+            for doc in scores:
+                tf = tf_of(doc)
+                scores[doc] += idf * tf / (tf + norms[doc])
+        return scores
+
+    def _rank(self, scores, count, after):
+        """スコアの高い順（同点は id 順）に先頭 count 件の (-スコア, id) を返す"""
+        doc_ids = self._doc_ids
+        if after is not None:
+            try:
+                after_score, after_id = -float(after[0]), str(after[1])
+            except (TypeError, ValueError, IndexError):
+                raise QueryError('cursor が不正です')
+            scores = {
+                doc: score for doc, score in scores.items()
+                if score < after_score or (score == after_score and doc_ids[doc] > after_id)
+            }
+        if len(scores) > count:
+            # 先にスコアだけで count 件目の値を求め、それ以上の文書だけを並べ替える
+            threshold = heapq.nlargest(count, scores.values())[-1]
+            scores = {doc: score for doc, score in scores.items() if score >= threshold}
+        return sorted((-score, doc_ids[doc]) for doc, score in scores.items())[:count]
+
+    def search(self, query, limit=20, cursor=None, fields=None):
+        """(書籍のリスト, 一致した件数, 次のページのカーソル) を返す。スコアの高い順"""
+        query = (query or '').strip()
+        if not query:
+            raise QueryError('q を指定してください')
+        if len(query) > MAX_QUERY_LENGTH:
+            raise QueryError(f'q は {MAX_QUERY_LENGTH} 文字以内で指定してください')
+        if limit < 1 or limit > MAX_LIMIT:
+            raise QueryError(f'limit は 1〜{MAX_LIMIT} の範囲で指定してください')
+        # カーソルは直前のページの最後の (-スコア, id)
+        after = decode_cursor(cursor) if cursor else None
+
+        with self._lock:
+            self._sync()
+            if self._dead >= COMPACT_MIN_DEAD and self._dead > COMPACT_RATIO * len(self._doc_ids):
+                self._compact()
+            scores = self._score(query)
+            top = self._rank(scores, limit + 1, after)
+
+        has_more = len(top) > limit
+        top = top[:limit]
+        books = []
+        for _, book_id in top:
+            book = self.store.get(book_id)
+            if book is not None:
+                books.append(project(book, fields))
+        next_cursor = encode_cursor(list(top[-1])) if has_more else None
+        return books, len(scores), next_cursor
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built,
+                'version': self._version,
+                'documents': len(self._docs),
+                'deleted': self._dead,
+                'terms': len(self._postings),
+                'postings': sum(len(postings.docs) for postings in self._postings.values()),
+            }
@@ -0,0 +1,333 @@
+import heapq
+import math
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+from models.book_model import as_count
+
+try:
+    import numpy as np
+except ImportError:  # NumPy がなければ array モジュールと組み込み関数で計算する（大きな蔵書では遅い）
+    np = None
+    print("NumPy is not installed; library stats fall back to the slower array engine")
+
+# 出版社・著者別の内訳と完了予測は、件数の多い順・早い順にこの件数まで返す
+DEFAULT_TOP = 20
+MAX_TOP = 200
+# ページ数・読書時間の列に入る上限（32 ビット）
+MAX_COUNT = 2 ** 31 - 1
+
+
+class LibraryColumns:
+    """蔵書を列ごとの配列に並べ直したもの
+
+    BookModel.get_progress_percentage / is_completed を1冊ずつ呼ぶ代わりに、
+    ページ数・読書時間などを列単位でまとめて計算するために使う。
+    出版社・著者は名前の一覧とその番号の列（codes）として持つ。
+    put / remove で1冊ずつ更新でき、削除は最後の行を空いた行に移して詰める。
+    """
+
+    def __init__(self, books=()):
+        self.ids = []
+        self.titles = []
+        self.rows = {}
+        # 32 ビットにして集計で読むメモリを減らす（合計は NumPy・Python の側で 64 ビット以上になる）
+        self.total_pages = array('i')
+        self.current_page = array('i')
+        self.reading_time = array('i')
+        # 登録日時（UNIX 時刻。読めなければ NaN）。完了予測の経過日数に使う
+        self.created = array('d')
+        self.publishers, self.publisher_codes = [], array('q')
+        self.authors, self.author_codes = [], array('q')
+        self._publisher_ids, self._author_ids = {}, {}
+        for book in books:
+            self.put(book)
+
+    def _columns(self):
+        return (self.ids, self.titles, self.total_pages, self.current_page, self.reading_time,
+                self.created, self.publisher_codes, self.author_codes)
+
+    def put(self, book):
+        """書籍の行を追加する（同じ id があれば置き換える）"""
+        values = (
+            book['id'],
+            book.get('title') or '',
+            min(as_count(book.get('totalPages')), MAX_COUNT),
+            min(as_count(book.get('currentPage')), MAX_COUNT),
+            min(as_count(book.get('readingTime')), MAX_COUNT),
+            _timestamp(book.get('created_at')),
+            _code(book.get('publisher') or '', self._publisher_ids, self.publishers),
+            _code(book.get('author') or '', self._author_ids, self.authors),
+        )
+        row = self.rows.get(book['id'])
+        if row is None:
+            self.rows[book['id']] = len(self.ids)
+            for column, value in zip(self._columns(), values):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns(), values):
+                column[row] = value
+
+    def remove(self, book_id):
+        row = self.rows.pop(book_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        for column in self._columns():
+            value = column.pop()
+            if row != last:
+                column[row] = value
+        if row != last:
+            self.rows[self.ids[row]] = row
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _code(name, ids, names):
+    # 使われなくなった名前も番号は残す（内訳では冊数 0 のものを除く）
+    code = ids.get(name)
+    if code is None:
+        code = ids[name] = len(names)
+        names.append(name)
+    return code
+
+
+def _timestamp(created_at):
+    try:
+        return datetime.fromisoformat(created_at).timestamp()
+    except (TypeError, ValueError, OverflowError, OSError):
+        return math.nan
+
+
+def compute_stats(columns, top=DEFAULT_TOP, now=None):
+    """列配列から蔵書全体の統計をまとめて計算する
+
+    集計中に columns を更新しないこと（NumPy は列のバッファをそのまま参照する）。
+    """
+    now = now or datetime.now()
+    if np is not None:
+        stats = _compute_numpy(columns, top, now.timestamp())
+    else:
+        stats = _compute_array(columns, top, now.timestamp())
+
+    count = len(columns)
+    stats['books'] = count
+    stats['completionRatio'] = stats['completed'] / count if count else 0.0
+    stats['pagesPerHour'] = (
+        stats['pages']['timedRead'] * 3600 / stats['readingTime'] if stats['readingTime'] else 0.0
+    )
+    del stats['pages']['timedRead']
+    stats['projections'] = [
+        {
+            'id': columns.ids[i],
+            'title': columns.titles[i],
+            'pagesRemaining': remaining,
+            'pagesPerDay': round(per_day, 2),
+            'projectedFinish': (now + timedelta(days=days)).date().isoformat(),
+        }
+        for i, remaining, per_day, days in stats['projections']
+    ]
+    stats['engine'] = 'numpy' if np is not None else 'array'
+    return stats
+
+
+def _view(column, dtype):
+    # array のバッファをそのまま共有するのでコピーは発生しない
+    return np.frombuffer(column, dtype=dtype) if len(column) else np.zeros(0, dtype=dtype)
+
+
+def _compute_numpy(columns, top, now):
+    total = _view(columns.total_pages, np.int32)
+    current = _view(columns.current_page, np.int32)
+    reading_time = _view(columns.reading_time, np.int32)
+
+    has_total = total > 0
+    read = np.where(has_total, np.minimum(current, total), current)
+    # ページ数が 0 の本は 0 - current が負になるので、残りも 0 になる
+    remaining = np.maximum(total - current, 0)
+    completed = has_total & (current >= total)
+    reading = (current > 0) & ~completed
+    completed_count = int(np.count_nonzero(completed))
+    reading_count = int(np.count_nonzero(reading))
+
+    # 読書中の本は、登録以降のペースで読み進めた場合の完了日を予測する
+    # （登録からの経過日数は、1日未満と登録日時が読めないものを1日とする）
+    candidates = np.flatnonzero(reading & has_total)
+    elapsed_days = np.fmax((now - _view(columns.created, np.float64)[candidates]) / 86400, 1.0)
+    pages_per_day = read[candidates] / elapsed_days
+    days = remaining[candidates] / pages_per_day
+    if len(candidates) > top:
+        nearest = np.argpartition(days, top)[:top]
+    else:
+        nearest = np.arange(len(candidates))
+    nearest = nearest[np.argsort(days[nearest], kind='stable')]
+
+    return {
+        'completed': completed_count,
+        'reading': reading_count,
+        'unread': len(columns) - completed_count - reading_count,
+        'pages': {
+            'total': int(total.sum()),
+            'read': int(read.sum()),
+            'remaining': int(remaining.sum()),
+            'timedRead': int(read.sum(where=reading_time > 0)),
+        },
+        'readingTime': int(reading_time.sum()),
+        'projections': [
+            (int(candidates[i]), int(remaining[candidates[i]]), float(pages_per_day[i]), float(days[i]))
+            for i in nearest
+        ],
+        'publishers': _breakdown_numpy(
+            _view(columns.publisher_codes, np.int64), columns.publishers, completed, read, reading_time, top
+        ),
+        'authors': _breakdown_numpy(
+            _view(columns.author_codes, np.int64), columns.authors, completed, read, reading_time, top
+        ),
+    }
+
+
+def _breakdown_numpy(codes, names, completed, read, reading_time, top):
+    size = len(names)
+    counts = np.bincount(codes, minlength=size)
+    # 冊数の多い順（同数なら番号順）の上位を、全体を並べ替えずに選ぶ
+    key = (counts.max(initial=0) - counts) * size + np.arange(size)
+    top = min(top, int(np.count_nonzero(counts)))
+    order = np.argpartition(key, top)[:top] if top < size else np.arange(size)
+    order = order[np.argsort(key[order])]
+    # 完了数・ページ数・読書時間は上位の名前の行だけで集計する
+    rank = np.full(size, -1, dtype=np.int16)
+    rank[order] = np.arange(len(order))
+    ranks = rank[codes]
+    rows = np.flatnonzero(ranks >= 0)
+    ranks = ranks[rows]
+    done = np.bincount(ranks, weights=completed[rows], minlength=len(order))
+    pages = np.bincount(ranks, weights=read[rows], minlength=len(order))
+    seconds = np.bincount(ranks, weights=reading_time[rows], minlength=len(order))
+    return [
+        {
+            'name': names[i],
+            'books': int(counts[i]),
+            'completed': int(done[r]),
+            'pagesRead': int(pages[r]),
+            'readingTime': int(seconds[r]),
+        }
+        for r, i in enumerate(order)
+    ]
+
+
+def _compute_array(columns, top, now):
+    # NumPy がない場合は1回の走査ですべての列と内訳を集計する
+    publisher_groups = [[0, 0, 0, 0] for _ in columns.publishers]
+    author_groups = [[0, 0, 0, 0] for _ in columns.authors]
+    completed = reading = pages_total = pages_read = pages_remaining = timed_read = 0
+    candidates = []
+
+    for i, (total, current, seconds, created, publisher, author) in enumerate(zip(
+        columns.total_pages, columns.current_page, columns.reading_time,
+        columns.created, columns.publisher_codes, columns.author_codes
+    )):
+        if total > 0:
+            read = current if current < total else total
+            done = current >= total
+            left = total - read
+        else:
+            read, done, left = current, False, 0
+        if done:
+            completed += 1
+        elif current > 0:
+            reading += 1
+            if total > 0:
+                days = (now - created) / 86400
+                if not days >= 1.0:  # NaN も1日とする
+                    days = 1.0
+                candidates.append((left * days / read, i, left, read / days))
+
+        pages_total += total
+        pages_read += read
+        pages_remaining += left
+        if seconds > 0:
+            timed_read += read
+        for group in (publisher_groups[publisher], author_groups[author]):
+            group[0] += 1
+            group[1] += done
+            group[2] += read
+            group[3] += seconds
+
+    projections = heapq.nsmallest(top, candidates)
+    return {
+        'completed': completed,
+        'reading': reading,
+        'unread': len(columns) - completed - reading,
+        'pages': {
+            'total': pages_total,
+            'read': pages_read,
+            'remaining': pages_remaining,
+            'timedRead': timed_read,
+        },
+        'readingTime': sum(columns.reading_time),
+        'projections': [(i, left, per_day, days) for days, i, left, per_day in projections],
+        'publishers': _breakdown_array(publisher_groups, columns.publishers, top),
+        'authors': _breakdown_array(author_groups, columns.authors, top),
+    }
+
+
+def _breakdown_array(groups, names, top):
+    used = (i for i in range(len(names)) if groups[i][0])
+    order = heapq.nsmallest(top, used, key=lambda i: (-groups[i][0], i))
+    return [
+        {
+            'name': names[i],
+            'books': groups[i][0],
+            'completed': groups[i][1],
+            'pagesRead': groups[i][2],
+            'readingTime': groups[i][3],
+        }
+        for i in order
+    ]
+
+
+class LibraryStats:
+    """蔵書統計。列配列はストアの変更分（changes_since）だけ更新し、集計結果は version ごとにキャッシュする
+
+    保存のたびに全件から列配列を作り直すと大きな蔵書では秒単位かかるため、作り直すのは
+    初回と、変更履歴が古すぎて差分を取れない（changes_since が None を返す）ときだけにする。
+    完了予測の日付は当日を基準にするため、集計結果は日付が変わっても作り直す。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._columns = None
+        self._version = 0
+        self._results = {}
+        # 集計中は NumPy が列のバッファを参照しているので、更新と集計を同じロックで順に行う
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        # self._lock を持って呼ぶ
+        version = self.store.version
+        if self._columns is not None and version == self._version:
+            return
+        changes = self.store.changes_since(self._version) if self._columns is not None else None
+        if changes is None:
+            self._columns = LibraryColumns(self.store.iter_all())
+        else:
+            for _, book_id, book in changes:
+                if book is None:
+                    self._columns.remove(book_id)
+                else:
+                    self._columns.put(book)
+            version = max([version] + [revision for revision, _, _ in changes[-1:]])
+        self._version = version
+        self._results = {}
+
+    def summary(self, top=DEFAULT_TOP):
+        now = datetime.now()
+        with self._lock:
+            self._sync()
+            cache_key = (top, now.date())
+            stats = self._results.get(cache_key)
+            if stats is None:
+                stats = self._results[cache_key] = compute_stats(self._columns, top, now)
+        return stats
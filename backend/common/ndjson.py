@@ -0,0 +1,126 @@
+import io
+import json
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 1000
+# エラー一覧が巨大にならないよう、詳細を返す件数には上限を設ける
+MAX_REPORTED_ERRORS = 1000
+
+
+def export_ndjson(books, chunk_size=EXPORT_CHUNK_SIZE):
+    """書籍を1行1件の JSON として少しずつ出力するジェネレータ"""
+    lines = []
+    for book in books:
+        lines.append(json.dumps(book, ensure_ascii=False, separators=(',', ':')))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def buffered_lines(stream, buffer_size=64 * 1024):
+    # リクエストの生ストリームは readline が1バイトずつになるためバッファを挟む
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream, buffer_size)
+    return stream
+
+
+# iter_json_values で1件として読み込む大きさの上限（文字数）
+MAX_VALUE_SIZE = 16 * 1024 * 1024
+_DECODER = json.JSONDecoder()
+_SEPARATORS = ' \t\r\n,'
+
+
+def iter_json_values(stream, chunk_size=64 * 1024, max_value_size=MAX_VALUE_SIZE):
+    """JSON の配列（[{...}, {...}]）または1行1件の NDJSON を、全体を読み込まずに1件ずつ返す
+
+    stream はテキストのファイルオブジェクト。chunk_size 文字ずつ読み、最上位の
+    配列の要素（または並んだ値）を取り出すたびに捨てるので、メモリは最大の1件分で済む。
+    1件が max_value_size 文字を超えても解析できなければ（壊れたファイルなど）ValueError を送出する。
+    """
+    buffer = ''
+    position = 0
+    in_array = False
+    eof = False
+    while True:
+        # 区切り（空白・カンマ）と、最上位の配列の括弧を読み飛ばす
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == '[' and not in_array:
+                in_array = True
+                position += 1
+                continue
+            if buffer[position] == ']' and in_array:
+                in_array = False
+                position += 1
+                continue
+            try:
+                value, end = _DECODER.raw_decode(buffer, position)
+            except ValueError:
+                if eof or len(buffer) - position > max_value_size:
+                    raise
+            else:
+                # 数値は続きが次の断片にあるかもしれないので、末尾で切れていたら読み足す
+                if end < len(buffer) or eof or isinstance(value, (dict, list, str)):
+                    yield value
+                    position = end
+                    continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+
+
+def import_ndjson(stream, save_batch, validate, batch_size=IMPORT_BATCH_SIZE):
+    """NDJSON を1行ずつ読み、検証してから batch_size 件ごとに保存する
+
+    save_batch は書籍のリストを受け取り、保存できなかった書籍の
+    (リスト内の位置, エラーメッセージ) のリストを返す。
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    line_numbers = []
+
+    def fail(line_no, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_no, 'error': message})
+
+    def flush():
+        failures = save_batch(batch)
+        for position, message in failures:
+            fail(line_numbers[position], message)
+        report['imported'] += len(batch) - len(failures)
+        batch.clear()
+        line_numbers.clear()
+
+    for line_no, line in enumerate(buffered_lines(stream), 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            book = json.loads(line)
+        except ValueError as e:
+            fail(line_no, f'JSON として解析できません: {e}')
+            continue
+
+        error = validate(book)
+        if error:
+            fail(line_no, error)
+            continue
+
+        batch.append(book)
+        line_numbers.append(line_no)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    report['truncatedErrors'] = report['failed'] > len(report['errors'])
+    return report
@@ -0,0 +1,159 @@
+import re
+
+# 「123p」「123 p.」「123ページ」「123頁」「123 pages」など。なければ最初の数字
+_PAGES = re.compile(r'(\d+)\s*(?:p\b|pages?\b|ページ|頁)', re.IGNORECASE)
+_NUMBER = re.compile(r'\d+')
+
+
+def pages_from_text(text):
+    """形態（extent）の文字列からページ数を取り出す。なければ 0"""
+    if not isinstance(text, str):
+        text = _text(text)
+    if not text:
+        return 0
+    if text.isdigit():
+        # ONIX の ExtentValue は数字だけ
+        return int(text)
+    match = _PAGES.search(text)
+    if match:
+        return int(match.group(1))
+    match = _NUMBER.search(text)
+    return int(match.group(0)) if match else 0
+
+
+def _text(value):
+    # ONIX の文字列は {"content": ..., "collationkey": ...} の形のことも、文字列のこともある。
+    # 配列なら最初の空でないもの
+    if type(value) is str:
+        return value.strip()
+    if isinstance(value, dict):
+        return _text(value.get('content', ''))
+    if isinstance(value, list):
+        return next(filter(None, map(_text, value)), '')
+    return ''
+
+
+def _dig(value, *keys):
+    # オブジェクトのキーを順に引く。途中がオブジェクトでなければ（OpenBD の ONIX では
+    # 配列・オブジェクトの別は決まっている）その候補はないものとする
+    for key in keys:
+        if type(value) is not dict:
+            return None
+        value = value.get(key)
+    return value
+
+
+def _first(items, key, attr=None, expected=None, convert=_text):
+    """配列 items の要素の key を先頭から変換し、最初に空でない値を返す（なければ None）
+
+    attr を渡せば、属性 attr が expected と一致する（属性が配列なら expected を含む）要素だけを見る。
+    """
+    if type(items) is not list:
+        return None
+    for item in items:
+        if type(item) is not dict:
+            continue
+        if attr is not None:
+            actual = item.get(attr)
+            if actual != expected and not (type(actual) is list and expected in actual):
+                continue
+        value = convert(item.get(key))
+        if value:
+            return value
+    return None
+
+
+def _extent_pages(extents):
+    # ExtentType 00（本文のページ数）を優先し、なければ 11（総ページ数）。配列は1回だけたどる
+    if type(extents) is not list:
+        return 0
+    fallback = 0
+    for extent in extents:
+        if type(extent) is not dict:
+            continue
+        extent_type = extent.get('ExtentType')
+        if extent_type == '00':
+            pages = pages_from_text(extent.get('ExtentValue'))
+            if pages:
+                return pages
+        elif extent_type == '11' and not fallback:
+            fallback = pages_from_text(extent.get('ExtentValue'))
+    return fallback
+
+
+def _cover_link(collateral):
+    # SupportingResource のうち表紙（ResourceContentType 01）の ResourceVersion の ResourceLink
+    resources = _dig(collateral, 'SupportingResource')
+    if type(resources) is not list:
+        return None
+    for resource in resources:
+        if type(resource) is not dict:
+            continue
+        role = resource.get('ResourceContentType')
+        if role == '01' or type(role) is list and '01' in role:
+            link = _first(resource.get('ResourceVersion'), 'ResourceLink')
+            if link:
+                return link
+    return None
+
+
+def openbd_book(isbn, book_info):
+    """OpenBD の応答の1件（summary と onix）を書籍の dict に変換する
+
+    項目ごとに summary を先に見て、空（'' や 0）のときだけ ONIX の候補を順に試す。
+    """
+    summary = book_info.get('summary')
+    if type(summary) is not dict:
+        summary = {}
+    onix = book_info.get('onix')
+    if type(onix) is not dict:
+        onix = {}
+    descriptive = onix.get('DescriptiveDetail')
+    if type(descriptive) is not dict:
+        descriptive = {}
+    publishing = onix.get('PublishingDetail')
+
+    title = summary.get('title')
+    title = title.strip() if type(title) is str else _text(title)
+    if not title:
+        title = _text(_dig(descriptive, 'TitleDetail', 'TitleElement', 'TitleText'))
+
+    author = summary.get('author')
+    author = author.strip() if type(author) is str else _text(author)
+    if not author:
+        contributors = descriptive.get('Contributor')
+        author = (_first(contributors, 'PersonName', 'ContributorRole', 'A01')
+                  or _first(contributors, 'PersonName') or '')
+
+    publisher = summary.get('publisher')
+    publisher = publisher.strip() if type(publisher) is str else _text(publisher)
+    if not publisher:
+        publisher = (_text(_dig(publishing, 'Publisher', 'PublisherName'))
+                     or _text(_dig(publishing, 'Imprint', 'ImprintName')))
+
+    pubdate = summary.get('pubdate')
+    pubdate = pubdate.strip() if type(pubdate) is str else _text(pubdate)
+    if not pubdate:
+        pubdate = _first(_dig(publishing, 'PublishingDate'), 'Date', 'PublishingDateRole', '01') or ''
+
+    extent = summary.get('extent')
+    total_pages = pages_from_text(extent) if extent else 0
+    if not total_pages:
+        total_pages = _extent_pages(descriptive.get('Extent'))
+
+    cover = summary.get('cover')
+    cover = cover.strip() if type(cover) is str else _text(cover)
+    if not cover:
+        cover = _cover_link(onix.get('CollateralDetail')) or ''
+
+    return {
+        'isbn': isbn,
+        'title': title,
+        'author': author,
+        'publisher': publisher,
+        'pubdate': pubdate,
+        'totalPages': total_pages,
+        'coverImage': cover,
+        'currentPage': 0,
+        'readingTime': 0
+    }
@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら、もう一度実行せずにその結果を共有する
+
+    最初の呼び出し元だけが fn を実行し、実行中に同じキーで呼んだスレッドは同じ
+    Future を待って同じ結果（または例外）を受け取る。完了したキーはすぐに忘れるので、
+    結果を保持し続けることはない（それは MetadataCache の役割）。
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'executions': 0, 'shared': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self.counters['calls'] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters['executions'] += 1
+            else:
+                self.counters['shared'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,138 @@
+import xml.etree.ElementTree as ET
+
+from common.openbd import pages_from_text
+
+SRW = '{http://www.loc.gov/zing/srw/}'
+DC = '{http://purl.org/dc/elements/1.1/}'
+DCTERMS = '{http://purl.org/dc/terms/}'
+DCNDL = '{http://ndl.go.jp/dcndl/terms/}'
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+FOAF = '{http://xmlns.com/foaf/0.1/}'
+DIAG = '{http://www.loc.gov/zing/srw/diagnostic/}'
+
+RECORD = f'{SRW}record'
+IDENTIFIER = f'{DCTERMS}identifier'
+ISBN_DATATYPE = 'http://ndl.go.jp/dcndl/terms/ISBN'
+
+# 要素 → [(項目, 優先度, 親要素)]。同じ項目に複数の候補があれば優先度の小さいものを使う。
+# 親要素が指定されているものは、その要素の内側にあるときだけ使う
+FIELD_TABLE = {
+    f'{DCTERMS}title': [('title', 0, None)],
+    f'{DC}title': [('title', 1, None)],
+    f'{RDF}value': [('title', 2, f'{DC}title')],
+    f'{DC}creator': [('creator', 0, None)],
+    f'{FOAF}name': [('creator', 1, f'{DCTERMS}creator'), ('publisher', 1, f'{DCTERMS}publisher')],
+    f'{DC}publisher': [('publisher', 0, None)],
+    f'{DCTERMS}date': [('date', 0, None)],
+    f'{DC}date': [('date', 1, None)],
+    f'{DCTERMS}issued': [('date', 2, None)],
+    f'{DCTERMS}extent': [('extent', 0, None)],
+    f'{DCNDL}extent': [('extent', 1, None)],
+}
+# レコードの外側で拾う要素 → 属性名
+RESPONSE_FIELDS = {
+    f'{SRW}numberOfRecords': 'number_of_records',
+    f'{SRW}nextRecordPosition': 'next_record_position',
+}
+
+
+def _new_record():
+    return {'title': '', 'creator': '', 'publisher': '', 'date': '', 'extent': '', 'isbns': []}
+
+
+class _SRUTarget:
+    """XMLParser の target。要素の木は作らず、開いている要素の名前と文字列だけを追う"""
+
+    def __init__(self, response):
+        self.response = response
+        self.ready = []
+        self._open = []
+        self._text = []
+        # 文字データは毎回 Python の関数を経由させず、そのままリストに積む
+        self.data = self._text.append
+        self._record = None
+        self._ranks = {}
+        self._isbn = False
+
+    def start(self, tag, attrib):
+        self._open.append(tag)
+        self._text.clear()
+        if tag == RECORD:
+            self._record = _new_record()
+            self._ranks = {}
+        elif tag == IDENTIFIER:
+            self._isbn = attrib.get(f'{RDF}datatype') == ISBN_DATATYPE
+
+    def end(self, tag):
+        self._open.pop()
+        record = self._record
+        if record is not None:
+            fields = FIELD_TABLE.get(tag)
+            if fields is not None:
+                for name, rank, parent in fields:
+                    if parent is not None and parent not in self._open:
+                        continue
+                    if name not in self._ranks or rank < self._ranks[name]:
+                        text = ''.join(self._text).strip()
+                        if text:
+                            record[name] = text
+                            self._ranks[name] = rank
+            elif tag == IDENTIFIER:
+                if self._isbn:
+                    record['isbns'].append(''.join(self._text).strip())
+            elif tag == RECORD:
+                self.ready.append(record)
+                self._record = None
+        elif tag in RESPONSE_FIELDS:
+            setattr(self.response, RESPONSE_FIELDS[tag], int(''.join(self._text)))
+        elif tag == f'{DIAG}message':
+            self.response.diagnostics.append(''.join(self._text).strip())
+        self._text.clear()
+
+    def close(self):
+        return self.ready
+
+
+class SRUResponse:
+    """NDL サーチの SRU 応答（recordPacking=xml）をストリームのまま解析する
+
+    chunks は応答本文のバイト列、またはその断片の iterable。断片を受け取るたびに
+    XMLParser に渡し、閉じた srw:record から順に項目の dict を yield する。
+    要素の木は作らず（iterparse でも木は作られる）、1回の走査で FIELD_TABLE の項目だけを
+    拾うので、レコード数が多くてもメモリは増えない。
+    numberOfRecords / nextRecordPosition / diagnostics は走査し終えた後に参照できる。
+    """
+
+    def __init__(self, chunks):
+        self._chunks = [chunks] if isinstance(chunks, bytes) else chunks
+        self.number_of_records = None
+        self.next_record_position = None
+        self.diagnostics = []
+
+    def __iter__(self):
+        target = _SRUTarget(self)
+        parser = ET.XMLParser(target=target)
+        for chunk in self._chunks:
+            parser.feed(chunk)
+            if target.ready:
+                records, target.ready = target.ready, []
+                yield from records
+        yield from parser.close()
+
+    def records(self):
+        return list(self)
+
+
+def sru_book(isbn, record):
+    """SRUResponse のレコードを書籍の dict に変換する"""
+    return {
+        'isbn': isbn,
+        'title': record['title'],
+        'author': record['creator'],
+        'publisher': record['publisher'],
+        'pubdate': record['date'],
+        'totalPages': pages_from_text(record['extent']),
+        'coverImage': '',
+        'currentPage': 0,
+        'readingTime': 0
+    }
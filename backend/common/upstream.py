@@ -0,0 +1,62 @@
+from common.isbn import canonical_isbn, normalize_isbn
+
+
+class UpstreamError(Exception):
+    """上流 API（OpenBD・NDL）への問い合わせに失敗した
+
+    タイムアウト・接続エラー・5xx・応答の解析失敗など。「該当する書籍がない」
+    という正常な応答とは区別し、ネガティブキャッシュには記録しない。
+    """
+
+    def __init__(self, source, message):
+        super().__init__(f"{source}: {message}")
+        self.source = source
+
+
+def lookup_report(results):
+    """一括検索の結果（正規化 ISBN → (状態, 書籍)）をレスポンス用にまとめる"""
+    report = {'results': [], 'found': 0, 'notFound': 0, 'errors': 0, 'invalid': 0}
+    counter = {'found': 'found', 'not_found': 'notFound', 'error': 'errors', 'invalid': 'invalid'}
+    for isbn, (status, book) in results.items():
+        report['results'].append({'isbn': isbn, 'status': status, 'book': book})
+        report[counter[status]] += 1
+    return report
+
+
+def partition_isbns(isbns, cache, negative_cache, catalogue=None):
+    """一括検索の入力を ISBN-13 にそろえ、キャッシュ・ローカルの索引で答えられるものを先に埋める
+
+    (results, pending) を返す。results は ISBN → (状態, 書籍) を入力順に持ち、上流への
+    問い合わせが必要な pending の ISBN だけ値が None のまま。ISBN として正しくないものは
+    問い合わせずに invalid とする。
+    """
+    results = {}
+    pending = []
+    for isbn in isbns:
+        canonical = canonical_isbn(isbn)
+        if canonical is None:
+            results.setdefault(normalize_isbn(isbn) or isbn, ('invalid', None))
+            continue
+        if canonical in results:
+            continue
+        cached = cache.get(canonical)
+        if cached is not None:
+            results[canonical] = ('found', dict(cached))
+            continue
+        local = catalogue.get(canonical) if catalogue is not None else None
+        if local is not None:
+            results[canonical] = ('found', local)
+        elif negative_cache.get(canonical) is not None:
+            results[canonical] = ('not_found', None)
+        else:
+            results[canonical] = None
+            pending.append(canonical)
+    return results, pending
+
+
+def stale_or_error(cache, isbn):
+    """上流に問い合わせられなかった ISBN の結果。期限切れでもキャッシュに残っていればそれを返す"""
+    stale = cache.get_stale(isbn)
+    if stale is not None:
+        return ('found', dict(stale))
+    return ('error', None)
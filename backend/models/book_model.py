@@ -1,7 +1,29 @@
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
+
+
+def as_count(value: Any) -> int:
+    """ページ数・読書時間を 0 以上の整数にそろえる
+
+    検証なしで保存された古いデータには '50' や 12.5 のような値もあるため、
+    数値として読めるものは切り捨て、読めないものは 0 とする。
+    """
+    if type(value) is int:
+        return value if value > 0 else 0
+    try:
+        return max(0, int(float(value)))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+class InvalidBookError(ValueError):
+    """保存できない書籍データ（400 を返す）"""
+
 
 class BookModel:
+    STRING_FIELDS = ('id', 'isbn', 'title', 'author', 'publisher', 'pubdate', 'coverImage')
+    COUNT_FIELDS = ('totalPages', 'currentPage', 'readingTime')
+    
     def __init__(self, data: Dict):
         self.id = data.get('id')
         self.isbn = data.get('isbn', '')
@@ -48,6 +70,29 @@ class BookModel:
         self.reading_time = max(0, reading_time)
         self.updated_at = datetime.now().isoformat()
     
+    @classmethod
+    def validate(cls, data: Dict) -> Optional[str]:
+        """保存できる書籍データかを確認し、問題があればエラーメッセージを返す"""
+        if not isinstance(data, dict):
+            return '書籍データはオブジェクトである必要があります'
+        
+        if not data.get('title') and not data.get('isbn'):
+            return 'title または isbn が必要です'
+        
+        for field in cls.STRING_FIELDS:
+            value = data.get(field)
+            if value is not None and not isinstance(value, str):
+                return f'{field} は文字列である必要があります'
+        
+        for field in cls.COUNT_FIELDS:
+            value = data.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                return f'{field} は0以上の整数である必要があります'
+        
+        return None
+    
     @classmethod
     def from_api_data(cls, api_data: Dict) -> 'BookModel':
         return cls(api_data)
@@ -0,0 +1,99 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def _local_timezone():
+    name = os.getenv('BOOK_TIMEZONE', 'Asia/Tokyo')
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        # tzdata のない環境（Windows など）では日本時間に固定する
+        print(f"Time zone {name} is not available; using UTC+09:00")
+        return timezone(timedelta(hours=9))
+
+
+# 日別・週別の集計とタイムゾーンのない時刻の解釈に使う（BOOK_TIMEZONE、既定は日本時間）
+LOCAL_TIMEZONE = _local_timezone()
+
+class SessionModel:
+    """読書セッション（開始・終了時刻と読み進めたページ）の入力"""
+    
+    PAGE_FIELDS = ('startPage', 'endPage')
+    
+    @classmethod
+    def validate(cls, data: Dict) -> Optional[str]:
+        """記録できるセッションかを確認し、問題があればエラーメッセージを返す"""
+        if not isinstance(data, dict):
+            return 'セッションはオブジェクトである必要があります'
+        
+        for field in ('startedAt', 'endedAt'):
+            value = data.get(field)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                return f'{field} は ISO 8601 形式の文字列である必要があります'
+            try:
+                cls.parse_time(value)
+            except ValueError:
+                return f'{field} は ISO 8601 形式の文字列である必要があります'
+        
+        if data.get('startedAt') is None and data.get('seconds') is None:
+            return 'startedAt または seconds が必要です'
+        
+        for field in ('seconds',) + cls.PAGE_FIELDS:
+            value = data.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                return f'{field} は0以上の整数である必要があります'
+        
+        started_at, ended_at = cls.period(data)
+        if ended_at < started_at:
+            return 'endedAt は startedAt 以降である必要があります'
+        
+        return None
+    
+    @staticmethod
+    def parse_time(value: str) -> datetime:
+        """ISO 8601 の時刻を UTC の aware な datetime にする
+
+        タイムゾーンのない時刻は LOCAL_TIMEZONE の時刻とみなす（オフセット付きと混ざっても比べられるように）。
+        """
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=LOCAL_TIMEZONE)
+        return parsed.astimezone(timezone.utc)
+    
+    @classmethod
+    def local_date(cls, value: str) -> str:
+        """記録した時刻（ISO 8601）の LOCAL_TIMEZONE での日付（YYYY-MM-DD）"""
+        return cls.parse_time(value).astimezone(LOCAL_TIMEZONE).date().isoformat()
+    
+    @classmethod
+    def period(cls, data: Dict):
+        """開始・終了時刻を UTC で返す。省略された側は seconds と現在時刻から補う"""
+        ended_at = cls.parse_time(data['endedAt']) if data.get('endedAt') else None
+        if data.get('startedAt'):
+            started_at = cls.parse_time(data['startedAt'])
+            if ended_at is None:
+                ended_at = started_at + timedelta(seconds=data.get('seconds') or 0)
+        else:
+            ended_at = ended_at or datetime.now(timezone.utc)
+            started_at = ended_at - timedelta(seconds=data['seconds'])
+        return started_at, ended_at
+    
+    @classmethod
+    def to_record(cls, data: Dict) -> Dict:
+        started_at, ended_at = cls.period(data)
+        seconds = data.get('seconds')
+        if seconds is None:
+            seconds = int((ended_at - started_at).total_seconds())
+        return {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'ended_at': ended_at.isoformat(timespec='seconds'),
+            'seconds': seconds,
+            'start_page': data.get('startPage'),
+            'end_page': data.get('endPage'),
+        }
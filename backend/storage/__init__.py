@@ -0,0 +1,125 @@
+# Storage package initialization
+import os
+
+from storage.base import BookStore, DuplicateBookError, MemoryStore
+from storage.catalogue import Catalogue
+from storage.cover_cache import CoverCache
+from storage.journal import JournalStore
+from storage.metadata_cache import MetadataCache
+from storage.sessions import SessionLog
+from storage.sqlite_store import SQLiteStore
+from storage.write_behind import WriteBehindStore
+
+DEFAULT_DATA_FILE = '../data/books.json'
+DEFAULT_SQLITE_FILE = '../data/books.db'
+DEFAULT_SESSION_FILE = '../data/sessions.log'
+DEFAULT_CACHE_FILE = '../data/isbn_cache.db'
+DEFAULT_CATALOGUE_FILE = '../data/catalogue.db'
+DEFAULT_COVER_DIR = '../data/covers'
+
+
+def create_store(backend=None, data_file=None, db_file=None, write_behind=None, **options):
+    """設定（引数または環境変数 BOOK_STORAGE）に応じたストレージを生成する
+
+    - journal: books.json + 追記ログ（既定。BOOK_SNAPSHOT_FORMAT=binary で books.bin）
+    - sqlite: SQLite データベース（BOOK_SQLITE_FILE）
+    - memory: プロセス内のみ
+
+    BOOK_WRITE_BEHIND=1 のときは書き込みをまとめて非同期に永続化する。
+    """
+    store = _create_base_store(backend, data_file, db_file, **options)
+
+    if write_behind is None:
+        write_behind = os.getenv('BOOK_WRITE_BEHIND', '0').lower() in ('1', 'true', 'yes')
+    if write_behind and not isinstance(store, MemoryStore):
+        store = WriteBehindStore(
+            store,
+            flush_interval=float(os.getenv('BOOK_FLUSH_INTERVAL', '1.0')),
+            max_dirty=int(os.getenv('BOOK_FLUSH_MAX_DIRTY', '500')),
+        )
+
+    return store
+
+
+def create_session_log(path=None, backend=None):
+    """読書セッションのログを生成する（memory のときはファイルに保存しない）"""
+    backend = (backend or os.getenv('BOOK_STORAGE', 'journal')).lower()
+    if backend == 'memory':
+        return SessionLog(path)
+    return SessionLog(path or os.getenv('BOOK_SESSION_FILE', DEFAULT_SESSION_FILE))
+
+
+def create_metadata_cache(db_file=None):
+    """ISBN 検索結果のキャッシュを生成する
+
+    BOOK_CACHE_FILE（空文字でメモリのみ）、BOOK_CACHE_TTL（秒）、
+    BOOK_CACHE_MEMORY_SIZE / BOOK_CACHE_DISK_SIZE（件数）、
+    BOOK_CACHE_EVICTION（lru / fifo）で設定する。
+    """
+    if db_file is None:
+        db_file = os.getenv('BOOK_CACHE_FILE', DEFAULT_CACHE_FILE)
+    return MetadataCache(
+        db_file or None,
+        ttl=float(os.getenv('BOOK_CACHE_TTL', str(7 * 24 * 3600))),
+        memory_size=int(os.getenv('BOOK_CACHE_MEMORY_SIZE', '1024')),
+        disk_size=int(os.getenv('BOOK_CACHE_DISK_SIZE', '100000')),
+        eviction=os.getenv('BOOK_CACHE_EVICTION', 'lru').lower(),
+    )
+
+
+def create_negative_cache(db_file=None):
+    """見つからなかった ISBN を覚えておくキャッシュを生成する
+
+    誤読したバーコードや未収録の書籍を繰り返し問い合わせないためのもので、
+    有効期限は BOOK_NEGATIVE_CACHE_TTL（秒、既定 1 時間）と短めにする。
+    """
+    if db_file is None:
+        db_file = os.getenv('BOOK_CACHE_FILE', DEFAULT_CACHE_FILE)
+    return MetadataCache(
+        db_file or None,
+        ttl=float(os.getenv('BOOK_NEGATIVE_CACHE_TTL', '3600')),
+        memory_size=int(os.getenv('BOOK_CACHE_MEMORY_SIZE', '1024')),
+        disk_size=int(os.getenv('BOOK_CACHE_DISK_SIZE', '100000')),
+        eviction=os.getenv('BOOK_CACHE_EVICTION', 'lru').lower(),
+        table='negative',
+    )
+
+
+def create_catalogue(db_file=None):
+    """tools.ingest_catalogue で作ったローカルの書誌索引を読み取り専用で開く
+
+    BOOK_CATALOGUE_FILE で場所を指定する（空文字、またはファイルがなければ使わない）。
+    """
+    if db_file is None:
+        db_file = os.getenv('BOOK_CATALOGUE_FILE', DEFAULT_CATALOGUE_FILE)
+    return Catalogue(db_file or None)
+
+
+def create_cover_cache(directory=None):
+    """カバー画像（原寸と縮小版）のディスクキャッシュを生成する
+
+    COVER_CACHE_DIR で置き場所を、COVER_CACHE_MAX_MB で画像の合計の上限（MB）を指定する。
+    """
+    return CoverCache(
+        directory or os.getenv('COVER_CACHE_DIR', DEFAULT_COVER_DIR),
+        max_bytes=int(float(os.getenv('COVER_CACHE_MAX_MB', '512')) * 1024 * 1024),
+    )
+
+
+def _create_base_store(backend, data_file, db_file, **options):
+    backend = (backend or os.getenv('BOOK_STORAGE', 'journal')).lower()
+
+    if backend == 'journal':
+        data_file = data_file or os.getenv('BOOK_DATA_FILE', DEFAULT_DATA_FILE)
+        options.setdefault(
+            'compact_threshold', int(os.getenv('BOOK_JOURNAL_COMPACT_THRESHOLD', '1000'))
+        )
+        options.setdefault('snapshot_format', os.getenv('BOOK_SNAPSHOT_FORMAT', 'json').lower())
+        return JournalStore(data_file, **options)
+    if backend == 'sqlite':
+        db_file = db_file or os.getenv('BOOK_SQLITE_FILE', DEFAULT_SQLITE_FILE)
+        return SQLiteStore(db_file)
+    if backend == 'memory':
+        return MemoryStore()
+
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,105 @@
+from storage.index import BookIndex
+
+
+class DuplicateBookError(Exception):
+    """同じ ISBN の書籍が既に登録されている"""
+
+    def __init__(self, book):
+        super().__init__(f"ISBN {book.get('isbn')} is already registered")
+        self.book = book
+
+
+class BookStore:
+    """書籍ストレージの共通インターフェース
+
+    書籍は `id` をキーとする dict として保存する。更新は常に書籍全体を
+    `put` で差し替える。`version` は変更のたびに増える単調増加のカウンタで、
+    ETag などライブラリ全体の変更検知に使う。書籍には変更時点の version が
+    `revision` として記録され、削除は revision 付きの tombstone として残る。
+    """
+
+    version = 0
+
+    def next_revision(self, revision=None):
+        # 書き込みをまとめるラッパーが採番済みの revision はそのまま使う
+        return max(self.version + 1, revision or 0)
+
+    def get(self, book_id):
+        raise NotImplementedError
+
+    def all(self):
+        raise NotImplementedError
+
+    def iter_all(self):
+        return iter(self.all())
+
+    def find_by_isbn(self, isbn):
+        raise NotImplementedError
+
+    def put(self, book):
+        raise NotImplementedError
+
+    def put_many(self, books):
+        books = list(books)
+        for book in books:
+            self.put(book)
+        return len(books)
+
+    def delete(self, book_id, revision=None):
+        """書籍を削除する。なければ False
+
+        revision を渡された（書き込みをまとめるラッパーが採番済みの）場合は、書籍がなくても
+        その revision で tombstone を残す。ラッパーが保存前に作って消した書籍も、作成が
+        changes_since で見えていた可能性があるため。
+        """
+        raise NotImplementedError
+
+    def changes_since(self, since):
+        """since より後の変更を (revision, id, 書籍 or None) の revision 昇順で返す
+
+        古い tombstone を破棄していて差分を作れない場合は None を返す。
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class MemoryStore(BookStore):
+    """プロセス内のみで保持するストレージ（永続化なし）"""
+
+    def __init__(self):
+        self.index = BookIndex()
+        self.version = 0
+
+    def get(self, book_id):
+        return self.index.get(book_id)
+
+    def all(self):
+        return list(self.index.values())
+
+    def find_by_isbn(self, isbn):
+        return self.index.find_by_isbn(isbn)
+
+    def put(self, book):
+        book['revision'] = self.version = self.next_revision(book.get('revision'))
+        self.index.add(book)
+        return book
+
+    def delete(self, book_id, revision=None):
+        if book_id not in self.index:
+            if revision is not None:
+                self.version = self.next_revision(revision)
+                self.index.add_tombstone(book_id, self.version)
+            return False
+        self.version = self.next_revision(revision)
+        self.index.remove(book_id, self.version)
+        return True
+
+    def changes_since(self, since):
+        if since < self.index.tombstone_floor:
+            return None
+        return self.index.changes_since(since)
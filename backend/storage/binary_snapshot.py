@@ -0,0 +1,297 @@
+import bisect
+import json
+import mmap
+import struct
+from array import array
+
+from common.isbn import isbn13_to_10, normalize_isbn
+
+# ファイル形式（すべてリトルエンディアン）
+#
+#   ヘッダ        : HEADER（下記）
+#   レコード      : [u32 長さ][フィールド数 u16][(キー u32, 型 u8, 値)...] を件数分
+#   オフセット表  : レコード番号 → ファイル内位置（u64 × 件数）
+#   文字列表      : 開始位置（u32 × (文字列数 + 1)）と UTF-8 の連結データ
+#   id 索引       : (id の文字列番号 u32, レコード番号 u32) を id 順に並べたもの
+#   ISBN 索引     : (正規化 ISBN の文字列番号 u32, レコード番号 u32) を ISBN 順
+#   revision 索引 : (revision u64, レコード番号 u32) を revision 順
+#
+# 出版社・著者・キー名などの文字列は文字列表に1度だけ書き、レコードからは番号で参照する。
+MAGIC = b'BPSNAP01'
+HEADER = struct.Struct('<8sIIIIQQQQQQ')
+RECORD_LENGTH = struct.Struct('<I')
+FIELD_COUNT = struct.Struct('<H')
+FIELD = struct.Struct('<IB')
+U32 = struct.Struct('<I')
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+PAIR = struct.Struct('<II')
+REVISION_PAIR = struct.Struct('<QI')
+
+T_NULL, T_STR, T_INT, T_FLOAT, T_TRUE, T_FALSE, T_JSON = range(7)
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def intern(self, value):
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _encode_record(book, strings):
+    parts = [FIELD_COUNT.pack(len(book))]
+    for key, value in book.items():
+        key_index = strings.intern(key)
+        if value is None:
+            parts.append(FIELD.pack(key_index, T_NULL))
+        elif value is True:
+            parts.append(FIELD.pack(key_index, T_TRUE))
+        elif value is False:
+            parts.append(FIELD.pack(key_index, T_FALSE))
+        elif isinstance(value, str):
+            parts.append(FIELD.pack(key_index, T_STR) + U32.pack(strings.intern(value)))
+        elif isinstance(value, int) and INT64_MIN <= value <= INT64_MAX:
+            parts.append(FIELD.pack(key_index, T_INT) + I64.pack(value))
+        elif isinstance(value, float):
+            parts.append(FIELD.pack(key_index, T_FLOAT) + F64.pack(value))
+        else:
+            raw = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            parts.append(FIELD.pack(key_index, T_JSON) + U32.pack(len(raw)) + raw)
+    payload = b''.join(parts)
+    return RECORD_LENGTH.pack(len(payload)) + payload
+
+
+def write_snapshot(f, books):
+    """書籍を順に書き出す。全件の dict を同時に保持する必要はない"""
+    strings = _StringTable()
+    offsets = array('Q')
+    id_entries = []
+    isbn_entries = []
+    revision_entries = []
+
+    f.write(b'\0' * HEADER.size)
+    position = HEADER.size
+
+    for record_no, book in enumerate(books):
+        data = _encode_record(book, strings)
+        offsets.append(position)
+        f.write(data)
+        position += len(data)
+
+        id_entries.append((str(book['id']), record_no))
+        strings.intern(str(book['id']))
+        isbn = normalize_isbn(book.get('isbn'))
+        if isbn:
+            isbn_entries.append((isbn, record_no))
+            strings.intern(isbn)
+        revision_entries.append((book.get('revision') or 0, record_no))
+
+    offsets_offset = position
+    f.write(offsets.tobytes())
+    position += len(offsets) * 8
+
+    strings_offset = position
+    encoded = [value.encode('utf-8') for value in strings.values]
+    starts = array('I', [0])
+    for raw in encoded:
+        starts.append(starts[-1] + len(raw))
+    f.write(starts.tobytes())
+    f.write(b''.join(encoded))
+    position += len(starts) * 4 + starts[-1]
+
+    def write_pairs(entries, packer):
+        nonlocal position
+        start = position
+        for key, record_no in entries:
+            f.write(packer.pack(key, record_no))
+        position += len(entries) * packer.size
+        return start
+
+    id_entries.sort()
+    id_offset = write_pairs(
+        [(strings.ids[book_id], record_no) for book_id, record_no in id_entries], PAIR
+    )
+    isbn_entries.sort()
+    isbn_offset = write_pairs(
+        [(strings.ids[isbn], record_no) for isbn, record_no in isbn_entries], PAIR
+    )
+    revision_entries.sort()
+    revision_offset = write_pairs(revision_entries, REVISION_PAIR)
+
+    f.seek(0)
+    f.write(HEADER.pack(
+        MAGIC, len(offsets), len(strings.values), len(isbn_entries), 0,
+        offsets_offset, strings_offset, id_offset, isbn_offset, revision_offset, position
+    ))
+    f.seek(position)
+
+
+class BinarySnapshot:
+    """メモリマップしたスナップショット。レコードはアクセスされた時点で復元する
+
+    id・ISBN での取得は索引の二分探索なので、件数によらず起動直後から使える。
+    全件を走査したとき（values・changes_since(0)）は復元したレコードと revision 順の
+    並びを残し、以降の走査と取得ではそれを使い回す（スナップショットは読み取り専用なので古くならない）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic, self.count, string_count, self.isbn_count, _,
+            self._offsets_offset, strings_offset, self._id_offset,
+            self._isbn_offset, self._revision_offset, _,
+        ) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a book snapshot")
+
+        self._string_starts_offset = strings_offset
+        self._string_data_offset = strings_offset + (string_count + 1) * 4
+        self._records = None
+        self._changes = None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._mm.close()
+
+    def _string(self, index):
+        start, end = struct.unpack_from('<II', self._mm, self._string_starts_offset + index * 4)
+        base = self._string_data_offset
+        return self._mm[base + start:base + end].decode('utf-8')
+
+    def _record_offset(self, record_no):
+        return struct.unpack_from('<Q', self._mm, self._offsets_offset + record_no * 8)[0]
+
+    def record(self, record_no):
+        records = self._records
+        if records is not None:
+            return records[record_no]
+        return self._decode(record_no)
+
+    def records(self):
+        """全レコードを復元したリスト（初回だけ復元する）"""
+        records = self._records
+        if records is None:
+            records = self._records = [self._decode(record_no) for record_no in range(self.count)]
+        return records
+
+    def _decode(self, record_no):
+        mm = self._mm
+        position = self._record_offset(record_no) + RECORD_LENGTH.size
+        (field_count,) = FIELD_COUNT.unpack_from(mm, position)
+        position += FIELD_COUNT.size
+
+        book = {}
+        for _ in range(field_count):
+            key_index, kind = FIELD.unpack_from(mm, position)
+            position += FIELD.size
+            if kind == T_STR:
+                value = self._string(U32.unpack_from(mm, position)[0])
+                position += U32.size
+            elif kind == T_INT:
+                value = I64.unpack_from(mm, position)[0]
+                position += I64.size
+            elif kind == T_FLOAT:
+                value = F64.unpack_from(mm, position)[0]
+                position += F64.size
+            elif kind == T_JSON:
+                (length,) = U32.unpack_from(mm, position)
+                position += U32.size
+                value = json.loads(mm[position:position + length].decode('utf-8'))
+                position += length
+            else:
+                value = {T_NULL: None, T_TRUE: True, T_FALSE: False}[kind]
+            book[self._string(key_index)] = value
+        return book
+
+    def _search(self, table_offset, size, key):
+        # 文字列番号で並んだ (文字列, レコード番号) 表を二分探索する
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            string_index, record_no = PAIR.unpack_from(self._mm, table_offset + mid * PAIR.size)
+            value = self._string(string_index)
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                return record_no
+        return None
+
+    def record_no(self, book_id):
+        return self._search(self._id_offset, self.count, book_id)
+
+    def __contains__(self, book_id):
+        return self.record_no(book_id) is not None
+
+    def get(self, book_id):
+        record_no = self.record_no(book_id)
+        return self.record(record_no) if record_no is not None else None
+
+    def find_by_isbn(self, isbn):
+        isbn = normalize_isbn(isbn)
+        if not isbn:
+            return None
+        record_no = self._search(self._isbn_offset, self.isbn_count, isbn)
+        if record_no is None and len(isbn) == 13:
+            # ISBN-10 をキーにしていた頃に書き出したスナップショット
+            legacy = isbn13_to_10(isbn)
+            if legacy:
+                record_no = self._search(self._isbn_offset, self.isbn_count, legacy)
+        return self.record(record_no) if record_no is not None else None
+
+    def values(self):
+        return iter(self.records())
+
+    def changes_since(self, since):
+        """revision が since より大きい (revision, レコード) を revision 昇順で返す"""
+        revisions = _RevisionColumn(self._mm, self._revision_offset, self.count)
+        start = bisect.bisect_right(revisions, since)
+        if start == 0 or self._changes is not None:
+            # 全件が対象、または復元済みなら revision 順のリストを切り出す（なければここで作る）
+            return self._by_revision()[start:]
+        return [
+            (revision, self.record(record_no))
+            for revision, record_no in REVISION_PAIR.iter_unpack(
+                self._mm[self._revision_offset + start * REVISION_PAIR.size:
+                         self._revision_offset + self.count * REVISION_PAIR.size]
+            )
+        ]
+
+    def _by_revision(self):
+        changes = self._changes
+        if changes is None:
+            records = self.records()
+            end = self._revision_offset + self.count * REVISION_PAIR.size
+            changes = self._changes = [
+                (revision, records[record_no])
+                for revision, record_no in REVISION_PAIR.iter_unpack(self._mm[self._revision_offset:end])
+            ]
+        return changes
+
+
+class _RevisionColumn:
+    """bisect 用に revision 索引を列として見せる"""
+
+    def __init__(self, mm, offset, count):
+        self._mm = mm
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return REVISION_PAIR.unpack_from(self._mm, self._offset + i * REVISION_PAIR.size)[0]
@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from common.isbn import canonical_isbn
+
+SCHEMA = (
+    # 主キーの B 木にそのまま書誌を持たせ、1回の探索で読めるようにする
+    """
+    CREATE TABLE IF NOT EXISTS catalogue (
+        isbn TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        source TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        modified TEXT NOT NULL,
+        ingested_at REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sources (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        records INTEGER NOT NULL,
+        ingested_at REAL NOT NULL
+    )
+    """,
+)
+
+SELECT_ENTRY = "SELECT data FROM catalogue WHERE isbn = ?"
+# 優先度の高い出典（OpenBD > NDL）を残し、同じ出典なら更新日時が新しいものだけで置き換える
+UPSERT_ENTRY = """
+    INSERT INTO catalogue (isbn, data, source, priority, modified, ingested_at) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn) DO UPDATE SET
+        data = excluded.data,
+        source = excluded.source,
+        priority = excluded.priority,
+        modified = excluded.modified,
+        ingested_at = excluded.ingested_at
+    WHERE (excluded.priority, excluded.modified) > (catalogue.priority, catalogue.modified)
+        OR ((excluded.priority, excluded.modified) = (catalogue.priority, catalogue.modified)
+            AND excluded.data != catalogue.data)
+"""
+COUNT_ENTRIES = "SELECT COUNT(*) FROM catalogue"
+SELECT_SOURCE = "SELECT size, mtime FROM sources WHERE path = ?"
+UPSERT_SOURCE = """
+    INSERT OR REPLACE INTO sources (path, size, mtime, records, ingested_at) VALUES (?, ?, ?, ?, ?)
+"""
+
+# 出典ごとの優先度。大きいほうを残す
+SOURCE_PRIORITY = {'openbd': 2, 'ndl': 1}
+
+
+class Catalogue:
+    """OpenBD の一括データや NDL の SRU 応答から作る、ISBN-13 をキーとする書誌の索引
+
+    tools.ingest_catalogue で作った SQLite ファイルを、検索時に上流へ問い合わせる前に引く。
+    参照は主キーの探索1回で、ディスク上のまま（ページキャッシュに載っていれば）
+    数十マイクロ秒で返る。db_file が None、またはファイルがなければ何も返さない。
+    readonly のときは読み取り専用で開く（取り込み中でも WAL により参照できる）。
+    """
+
+    def __init__(self, db_file=None, readonly=True):
+        if db_file is not None and readonly and not os.path.exists(db_file):
+            print(f"Catalogue not found, lookups go to upstream: {db_file}")
+            db_file = None
+        self.db_file = db_file
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'errors': 0}
+
+        if db_file is not None and not readonly:
+            directory = os.path.dirname(db_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connection() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+
+    def _connection(self):
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=30,
+                                       cached_statements=64)
+            else:
+                conn = sqlite3.connect(self.db_file, timeout=30, cached_statements=64)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @property
+    def enabled(self):
+        return self.db_file is not None
+
+    def get(self, isbn):
+        """索引にある書誌を返す。なければ None"""
+        if self.db_file is None:
+            return None
+        key = canonical_isbn(isbn)
+        if key is None:
+            return None
+        try:
+            row = self._connection().execute(SELECT_ENTRY, (key,)).fetchone()
+        except sqlite3.Error as e:
+            # 索引の障害で検索自体を失敗させない（上流に問い合わせる）
+            print(f"Catalogue read error: {e}")
+            self._count('errors')
+            return None
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(row[0])
+
+    def put_many(self, entries, source, modified=''):
+        """(ISBN, 書籍, 更新日時) の列を1つのトランザクションで書き込み、件数を返す
+
+        ISBN は ISBN-13 にそろえ、正しくないものは飛ばす。更新日時が空なら modified を使う。
+        """
+        priority = SOURCE_PRIORITY[source]
+        now = time.time()
+        rows = []
+        for isbn, book, entry_modified in entries:
+            key = canonical_isbn(isbn)
+            if key is None:
+                continue
+            book = dict(book, isbn=key)
+            rows.append((
+                key,
+                json.dumps(book, ensure_ascii=False, separators=(',', ':')),
+                source,
+                priority,
+                entry_modified or modified,
+                now,
+            ))
+        with self._connection() as conn:
+            conn.executemany(UPSERT_ENTRY, rows)
+        return len(rows)
+
+    def source_unchanged(self, path):
+        """前回取り込んだときから大きさ・更新日時の変わっていないファイルなら True"""
+        row = self._connection().execute(SELECT_SOURCE, (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(path)
+        return row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def mark_source(self, path, records):
+        stat = os.stat(path)
+        with self._connection() as conn:
+            conn.execute(UPSERT_SOURCE, (os.path.abspath(path), stat.st_size, stat.st_mtime, records, time.time()))
+
+    def count(self):
+        if self.db_file is None:
+            return 0
+        return self._connection().execute(COUNT_ENTRIES).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['file'] = self.db_file
+        return stats
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+SCHEMA = (
+    # (ISBN, 大きさ) → 画像の SHA-256。同じ画像（「画像なし」の代替画像など）は1つのファイルを共有する
+    """
+    CREATE TABLE IF NOT EXISTS covers (
+        isbn TEXT NOT NULL,
+        size TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        content_type TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        stored_at REAL NOT NULL,
+        accessed_at REAL NOT NULL,
+        PRIMARY KEY (isbn, size)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_covers_accessed_at ON covers (accessed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_covers_digest ON covers (digest)",
+)
+
+SELECT_ENTRY = "SELECT digest, content_type, accessed_at FROM covers WHERE isbn = ? AND size = ?"
+SELECT_DIGEST_REFS = "SELECT COUNT(*) FROM covers WHERE digest = ?"
+UPSERT_ENTRY = """
+    INSERT INTO covers (isbn, size, digest, content_type, bytes, stored_at, accessed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn, size) DO UPDATE SET
+        digest = excluded.digest,
+        content_type = excluded.content_type,
+        bytes = excluded.bytes,
+        stored_at = excluded.stored_at,
+        accessed_at = excluded.accessed_at
+"""
+TOUCH_ENTRY = "UPDATE covers SET accessed_at = ? WHERE isbn = ? AND size = ?"
+DELETE_ENTRY = "DELETE FROM covers WHERE isbn = ? AND size = ?"
+SELECT_OLDEST = "SELECT isbn, size, digest FROM covers ORDER BY accessed_at LIMIT ?"
+# 同じ画像を参照する行が複数あっても、ディスク上の大きさは1回だけ数える
+TOTAL_BYTES = "SELECT COALESCE(SUM(bytes), 0) FROM (SELECT DISTINCT digest, bytes FROM covers)"
+COUNT_ENTRIES = "SELECT COUNT(*) FROM covers"
+
+# 参照のたびに accessed_at を書き込まないよう、この秒数以内の再参照は記録しない
+TOUCH_INTERVAL = 60
+EVICT_BATCH = 100
+
+Cover = namedtuple('Cover', ['data', 'content_type', 'digest'])
+
+
+class CoverCache:
+    """カバー画像（原寸と縮小版）の、内容のハッシュで名前を付けるディスクキャッシュ
+
+    画像は directory/objects/<先頭2文字>/<SHA-256> に置き、どの ISBN・大きさが
+    どの画像かは directory/covers.db（SQLite）で引く。画像の合計が max_bytes を
+    超えたら、最後に参照された時刻の古いものから追い出す（ほかから参照されていない
+    画像だけファイルを消す）。ファイルは一時ファイルに書いてから置き換えるので、
+    読み込み中のものが途中で書き換わることはない。
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.db_file = os.path.join(directory, 'covers.db')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        with self._connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._bytes = conn.execute(TOTAL_BYTES).fetchone()[0]
+
+    def _connection(self):
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def get(self, isbn, size):
+        """キャッシュ済みの Cover を返す。なければ None"""
+        try:
+            row = self._connection().execute(SELECT_ENTRY, (isbn, size)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            digest, content_type, accessed_at = row
+            with open(self._path(digest), 'rb') as f:
+                data = f.read()
+            now = time.time()
+            if now - accessed_at > TOUCH_INTERVAL:
+                with self._connection() as conn:
+                    conn.execute(TOUCH_ENTRY, (now, isbn, size))
+        except FileNotFoundError:
+            # 追い出しと行き違った、またはファイルを手で消したもの
+            self._delete(isbn, size)
+            self._count('misses')
+            return None
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cover cache read error: {e}")
+            self._count('errors')
+            return None
+        self._count('hits')
+        return Cover(data, content_type, digest)
+
+    def put(self, isbn, size, data, content_type):
+        """画像を保存して Cover を返す（同じ内容のファイルがあれば書き込まない）"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        now = time.time()
+        try:
+            with self._lock:
+                written = not os.path.exists(path)
+                if written:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+                    self._bytes += len(data)
+                with self._connection() as conn:
+                    previous = conn.execute(SELECT_ENTRY, (isbn, size)).fetchone()
+                    conn.execute(UPSERT_ENTRY, (isbn, size, digest, content_type, len(data), now, now))
+                if previous is not None and previous[0] != digest:
+                    self._release(previous[0])
+                self.counters['stores'] += 1
+                over = self._bytes > self.max_bytes
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cover cache write error: {e}")
+            self._count('errors')
+            return Cover(data, content_type, digest)
+        if over:
+            self._evict()
+        return Cover(data, content_type, digest)
+
+    def _delete(self, isbn, size):
+        with self._lock:
+            with self._connection() as conn:
+                row = conn.execute(SELECT_ENTRY, (isbn, size)).fetchone()
+                conn.execute(DELETE_ENTRY, (isbn, size))
+            if row is not None:
+                self._release(row[0])
+
+    def _release(self, digest):
+        # どの行からも参照されなくなった画像のファイルを消す（self._lock を持って呼ぶ）
+        if self._connection().execute(SELECT_DIGEST_REFS, (digest,)).fetchone()[0]:
+            return
+        path = self._path(digest)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self._bytes -= size
+
+    def _evict(self):
+        try:
+            with self._lock:
+                conn = self._connection()
+                while self._bytes > self.max_bytes:
+                    rows = conn.execute(SELECT_OLDEST, (EVICT_BATCH,)).fetchall()
+                    if not rows:
+                        break
+                    # 上限を下回ったところで止める（まとめて消しすぎない）
+                    for isbn, size, digest in rows:
+                        with conn:
+                            conn.execute(DELETE_ENTRY, (isbn, size))
+                        self._release(digest)
+                        self.counters['evictions'] += 1
+                        if self._bytes <= self.max_bytes:
+                            break
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cover cache eviction error: {e}")
+            self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        stats['entries'] = self._connection().execute(COUNT_ENTRIES).fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,215 @@
+from collections import OrderedDict
+
+from common.isbn import normalize_isbn
+
+# 差分取得用に保持する削除済み id（tombstone）の上限
+MAX_TOMBSTONES = 10000
+
+
+class BookIndex:
+    """id をキーとする主インデックスと、正規化 ISBN による副インデックス
+
+    主インデックスの dict は挿入順を保つため、一覧の並び順もそのまま維持される。
+    加えて、書籍と削除済み id を revision 順に並べた変更履歴を持ち、
+    ある revision 以降の変更を新しい側から辿るだけで取り出せるようにする。
+    """
+
+    def __init__(self, books=()):
+        self.rebuild(books)
+
+    def rebuild(self, books, tombstones=None, tombstone_floor=0):
+        self.by_id = {}
+        self.by_isbn = {}
+        self.changes = OrderedDict()
+        self.tombstones = OrderedDict()
+        # これより古い tombstone は捨てているため、差分では追いつけない
+        self.tombstone_floor = tombstone_floor
+
+        books = [book for book in books if book.get('id') is not None]
+        for book in sorted(books, key=lambda book: book.get('revision') or 0):
+            self.changes[book['id']] = book.get('revision') or 0
+        for book in books:
+            self._link(book)
+        for book_id, revision in sorted((tombstones or {}).items(), key=lambda item: item[1]):
+            self.tombstones[book_id] = revision
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, book_id):
+        return book_id in self.by_id
+
+    def get(self, book_id):
+        return self.by_id.get(book_id)
+
+    def values(self):
+        return self.by_id.values()
+
+    def view(self):
+        """現時点の内容を返すイテレータの生成関数（ロック外で走査してよい）"""
+        books = list(self.by_id.values())
+        return lambda: iter(books)
+
+    def find_by_isbn(self, isbn):
+        book_id = self.by_isbn.get(normalize_isbn(isbn))
+        return self.by_id.get(book_id) if book_id is not None else None
+
+    def add(self, book):
+        book_id = book['id']
+        previous = self.by_id.get(book_id)
+        if previous is not None:
+            self._unlink_isbn(previous)
+        self._link(book)
+
+        self.changes[book_id] = book.get('revision') or 0
+        self.changes.move_to_end(book_id)
+        self.tombstones.pop(book_id, None)
+
+    def _link(self, book):
+        self.by_id[book['id']] = book
+        isbn = normalize_isbn(book.get('isbn'))
+        if isbn:
+            self.by_isbn[isbn] = book['id']
+
+    def remove(self, book_id, revision=0):
+        book = self.by_id.pop(book_id, None)
+        if book is not None:
+            self._unlink_isbn(book)
+            self.changes.pop(book_id, None)
+            self.add_tombstone(book_id, revision)
+        return book
+
+    def add_tombstone(self, book_id, revision):
+        # 変更履歴は revision 順に並べるので、同じ id でも末尾に付け直す
+        self.tombstones.pop(book_id, None)
+        self.tombstones[book_id] = revision
+        while len(self.tombstones) > MAX_TOMBSTONES:
+            _, evicted = self.tombstones.popitem(last=False)
+            self.tombstone_floor = max(self.tombstone_floor, evicted)
+
+    def _unlink_isbn(self, book):
+        isbn = normalize_isbn(book.get('isbn'))
+        if isbn and self.by_isbn.get(isbn) == book['id']:
+            del self.by_isbn[isbn]
+
+    def changes_since(self, since):
+        """since より新しい (revision, id, 書籍 or None) を revision 昇順で返す"""
+        entries = []
+        for book_id in reversed(self.changes):
+            revision = self.changes[book_id]
+            if revision <= since:
+                break
+            entries.append((revision, book_id, self.by_id[book_id]))
+        for book_id in reversed(self.tombstones):
+            revision = self.tombstones[book_id]
+            if revision <= since:
+                break
+            entries.append((revision, book_id, None))
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+
+class SnapshotIndex:
+    """読み取り専用スナップショットの上に、以降の変更を BookIndex として重ねる
+
+    BookIndex と同じ操作を提供する。スナップショット側のレコードは参照された
+    時点で復元するため、読み込み時に全件を dict にする必要がない。
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.overlay = BookIndex()
+        # スナップショットにあり、その後削除された id
+        self.deleted = set()
+        # スナップショットにない（新規追加された）書籍の件数
+        self._added = 0
+
+    @property
+    def tombstones(self):
+        return self.overlay.tombstones
+
+    @property
+    def tombstone_floor(self):
+        return self.overlay.tombstone_floor
+
+    @tombstone_floor.setter
+    def tombstone_floor(self, value):
+        self.overlay.tombstone_floor = value
+
+    def __len__(self):
+        return len(self.snapshot) - len(self.deleted) + self._added
+
+    def __contains__(self, book_id):
+        if book_id in self.overlay:
+            return True
+        return book_id not in self.deleted and book_id in self.snapshot
+
+    def get(self, book_id):
+        book = self.overlay.get(book_id)
+        if book is not None or book_id in self.deleted:
+            return book
+        return self.snapshot.get(book_id)
+
+    def values(self):
+        return self.view()()
+
+    def view(self):
+        """現時点の内容を返すイテレータの生成関数（ロック外で走査してよい）"""
+        snapshot = self.snapshot
+        overlay = dict(self.overlay.by_id)
+        deleted = set(self.deleted)
+
+        def books():
+            for book in snapshot.values():
+                book_id = book['id']
+                if book_id not in deleted:
+                    yield overlay.pop(book_id, book)
+            # 残りはスナップショット以降に追加された書籍
+            yield from overlay.values()
+
+        return books
+
+    def find_by_isbn(self, isbn):
+        book = self.overlay.find_by_isbn(isbn)
+        if book is not None:
+            return book
+        book = self.snapshot.find_by_isbn(isbn)
+        if book is None or book['id'] in self.deleted or book['id'] in self.overlay:
+            # 削除済み、または後の変更で ISBN が変わっている
+            return None
+        return book
+
+    def add(self, book):
+        book_id = book['id']
+        if book_id not in self.overlay:
+            if book_id in self.deleted:
+                self.deleted.discard(book_id)
+            elif book_id not in self.snapshot:
+                self._added += 1
+        self.overlay.add(book)
+
+    def remove(self, book_id, revision=0):
+        book = self.get(book_id)
+        if book is None:
+            return None
+        if book_id in self.overlay:
+            self.overlay.remove(book_id, revision)
+        else:
+            self.overlay.add_tombstone(book_id, revision)
+        if book_id in self.snapshot:
+            self.deleted.add(book_id)
+        else:
+            self._added -= 1
+        return book
+
+    def add_tombstone(self, book_id, revision):
+        self.overlay.add_tombstone(book_id, revision)
+
+    def changes_since(self, since):
+        entries = self.overlay.changes_since(since)
+        for revision, book in self.snapshot.changes_since(since):
+            book_id = book['id']
+            if book_id not in self.overlay and book_id not in self.deleted:
+                entries.append((revision, book_id, book))
+        entries.sort(key=lambda entry: entry[0])
+        return entries
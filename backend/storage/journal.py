@@ -0,0 +1,313 @@
+import json
+import os
+import threading
+
+from storage.base import BookStore
+from storage.binary_snapshot import BinarySnapshot, write_snapshot
+from storage.index import BookIndex, SnapshotIndex
+from storage.locking import FileLock, atomic_write, file_signature
+
+
+class JournalStore(BookStore):
+    """追記型ジャーナルによる書籍ストレージ
+
+    現在の状態はメモリ上に保持し、変更は1件ずつログファイルへ追記する。
+    ログが閾値を超えたらバックグラウンドでスナップショット（books.json）へ
+    圧縮する。起動時はスナップショット + ログを再生して状態を復元する。
+
+    複数プロセス（WSGI ワーカー）から同じファイルを扱えるよう、書き込みは
+    ファイルロック下で行い、他プロセスの変更はログファイルの inode とサイズの
+    比較で検知して、追記分のみ（圧縮でログが差し替わった場合は全体を）読み直す。
+
+    各レコードには通し番号（rev）を付ける。圧縮で新しいログを作るときは先頭に
+    その時点の番号を meta レコードとして書き、version が巻き戻らないようにする。
+
+    snapshot_format='binary' のときは圧縮時に books.bin（binary_snapshot 参照）を
+    書き出す。読み込みはメモリマップするだけなので、件数が多くても起動が速い。
+    books.json と books.bin の両方がある場合は新しい方を使うため、形式を
+    切り替えても次の圧縮までは以前のスナップショットから復元される。
+    """
+
+    def __init__(self, snapshot_file, log_file=None, compact_threshold=1000, fsync=False,
+                 snapshot_format='json'):
+        if snapshot_format not in ('json', 'binary'):
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        self.snapshot_file = snapshot_file
+        self.binary_file = f"{os.path.splitext(snapshot_file)[0]}.bin"
+        self.snapshot_format = snapshot_format
+        self.log_file = log_file or f"{snapshot_file}.log"
+        # 圧縮中に退避したログ（スナップショット書き込みが終わるまで残す）
+        self.compacting_file = f"{self.log_file}.compacting"
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+
+        directory = os.path.dirname(self.log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.index = BookIndex()
+        self._version = 0
+        self._lock = FileLock(f"{self.log_file}.lock")
+        self._compact_lock = FileLock(f"{self.log_file}.compact.lock")
+        self._log = None
+        self._log_records = 0
+        self._log_offset = 0
+        self._log_ino = None
+        self._compactor = None
+
+        self.load()
+
+    def load(self):
+        with self._lock:
+            self._close_log()
+
+            self.index = self._load_snapshot()
+            self._version = 0
+
+            # 圧縮途中でクラッシュした場合は退避ログも再生する
+            self._log_records = self._replay(self.compacting_file)[0]
+            count, self._log_offset = self._replay(self.log_file)
+            self._log_records += count
+
+            self._log = open(self.log_file, 'ab')
+            self._log_ino = os.fstat(self._log.fileno()).st_ino
+
+    def _load_snapshot(self):
+        binary_sig = file_signature(self.binary_file)
+        json_sig = file_signature(self.snapshot_file)
+        if binary_sig is not None and (json_sig is None or binary_sig[2] >= json_sig[2]):
+            # 差し替え前の mmap は参照が残っている間だけ生かし、明示的には閉じない
+            return SnapshotIndex(BinarySnapshot(self.binary_file))
+        return BookIndex(self._read_snapshot())
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _replay(self, path, offset=0):
+        count = 0
+        valid_size = offset
+
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた末尾レコードは捨てる
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    self._apply(record)
+                    valid_size += len(line)
+                    count += 1
+        except FileNotFoundError:
+            return 0, 0
+
+        if os.path.getsize(path) != valid_size:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+
+        return count, valid_size
+
+    def _apply(self, record):
+        revision = record.get('rev', 0)
+        self._version = max(self._version, revision)
+        if record.get('op') == 'put':
+            self.index.add(record['book'])
+        elif record.get('op') == 'delete':
+            if self.index.remove(record['id'], revision) is None:
+                # 保存前に作って消された書籍（BookStore.delete を参照）
+                self.index.add_tombstone(record['id'], revision)
+        elif record.get('op') == 'meta':
+            # 圧縮前の tombstone を引き継ぐ
+            for book_id, deleted_at in record.get('tombstones', {}).items():
+                if book_id not in self.index:
+                    self.index.tombstones[book_id] = deleted_at
+            self.index.tombstone_floor = max(
+                self.index.tombstone_floor, record.get('floor', 0)
+            )
+
+    def _needs_reload(self, log_sig):
+        # 圧縮は必ずログを差し替えるので、スナップショット側は見なくてよい
+        return (
+            log_sig is None
+            or log_sig[0] != self._log_ino
+            or log_sig[1] < self._log_offset
+        )
+
+    def _is_stale(self):
+        log_sig = file_signature(self.log_file)
+        return self._needs_reload(log_sig) or log_sig[1] != self._log_offset
+
+    def _sync(self):
+        """他プロセスの変更を取り込む（ロック取得中に呼ぶこと）"""
+        log_sig = file_signature(self.log_file)
+        if self._needs_reload(log_sig):
+            # 他プロセスが圧縮した（ログが差し替わった）ので全体を読み直す
+            self.load()
+        elif log_sig[1] > self._log_offset:
+            count, self._log_offset = self._replay(self.log_file, self._log_offset)
+            self._log_records += count
+
+    def refresh(self):
+        # 変更がなければ stat の比較だけで済ませる
+        if self._is_stale():
+            with self._lock:
+                self._sync()
+
+    @property
+    def version(self):
+        # 他プロセスの追記を取り込んでから返す（ETag を古い version で計算しないように）
+        self.refresh()
+        return self._version
+
+    def next_revision(self, revision=None):
+        # 書き込み中（ロック取得済み・同期済み）に呼ぶので、取り込み直さない
+        return max(self._version + 1, revision or 0)
+
+    def get(self, book_id):
+        self.refresh()
+        return self.index.get(book_id)
+
+    def all(self):
+        self.refresh()
+        return list(self.index.values())
+
+    def find_by_isbn(self, isbn):
+        self.refresh()
+        return self.index.find_by_isbn(isbn)
+
+    def put(self, book):
+        with self._lock:
+            self._sync()
+            book['revision'] = self.next_revision(book.get('revision'))
+            self._append({'op': 'put', 'book': book, 'rev': book['revision']})
+            self.index.add(book)
+        self._maybe_compact()
+        return book
+
+    def put_many(self, books):
+        books = list(books)
+        with self._lock:
+            self._sync()
+            records = []
+            for book in books:
+                book['revision'] = self._version = self.next_revision(book.get('revision'))
+                records.append({'op': 'put', 'book': book, 'rev': book['revision']})
+            self._append(*records)
+            for book in books:
+                self.index.add(book)
+        self._maybe_compact()
+        return len(books)
+
+    def delete(self, book_id, revision=None):
+        with self._lock:
+            self._sync()
+            existed = book_id in self.index
+            if not existed and revision is None:
+                return False
+            revision = self.next_revision(revision)
+            self._append({'op': 'delete', 'id': book_id, 'rev': revision})
+            self._apply({'op': 'delete', 'id': book_id, 'rev': revision})
+        self._maybe_compact()
+        return existed
+
+    def changes_since(self, since):
+        self.refresh()
+        if since < self.index.tombstone_floor:
+            return None
+        return self.index.changes_since(since)
+
+    def _append(self, *records):
+        data = ''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for record in records
+        ).encode('utf-8')
+        self._log.write(data)
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+        self._log_offset += len(data)
+        self._log_records += len(records)
+        self._version = max(self._version, records[-1].get('rev', 0))
+
+    def _maybe_compact(self):
+        if self._log_records >= self.compact_threshold:
+            self.compact()
+
+    def compact(self, wait=False):
+        with self._lock:
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self._compact, daemon=True)
+                self._compactor.start()
+            compactor = self._compactor
+
+        if wait:
+            compactor.join()
+
+    def _compact(self):
+        # 圧縮は同時に1プロセスのみ。他で実行中ならそちらに任せる
+        if not self._compact_lock.acquire(blocking=False):
+            return
+
+        try:
+            with self._lock:
+                self._sync()
+                self._close_log()
+                # 前回の圧縮が退避ログを残していれば、それに続けて退避する
+                if os.path.exists(self.compacting_file):
+                    with open(self.compacting_file, 'ab') as dst, open(self.log_file, 'rb') as src:
+                        dst.write(src.read())
+                    os.remove(self.log_file)
+                else:
+                    os.replace(self.log_file, self.compacting_file)
+
+                self._log = open(self.log_file, 'ab')
+                self._log_ino = os.fstat(self._log.fileno()).st_ino
+                self._log_offset = 0
+                self._append({
+                    'op': 'meta',
+                    'rev': self._version,
+                    'tombstones': dict(self.index.tombstones),
+                    'floor': self.index.tombstone_floor,
+                })
+                self._log_records = 0
+
+                # 書籍 dict は更新時に差し替えるため、浅いコピーで整合したスナップショットになる
+                books = self.index.view()
+
+            if self.snapshot_format == 'binary':
+                atomic_write(self.binary_file, lambda f: write_snapshot(f, books()), mode='wb')
+            else:
+                atomic_write(
+                    self.snapshot_file,
+                    lambda f: json.dump(list(books()), f, ensure_ascii=False, indent=2)
+                )
+
+            with self._lock:
+                os.remove(self.compacting_file)
+                if self.snapshot_format == 'binary':
+                    # 新しいスナップショットに載せ替える（再生するのは圧縮後のログだけ）
+                    self.load()
+        except Exception as e:
+            print(f"Journal compaction error: {e}")
+        finally:
+            self._compact_lock.release()
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._close_log()
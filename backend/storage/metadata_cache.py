@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from common.isbn import normalize_isbn
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS {table} (
+        isbn TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        stored_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_{table}_stored_at ON {table} (stored_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_accessed_at ON {table} (accessed_at)",
+)
+
+SELECT_ENTRY = "SELECT data, stored_at FROM {table} WHERE isbn = ?"
+# 追加と更新を分けて、件数（_disk_count）を増やすのは新しい行のときだけにする
+INSERT_ENTRY = "INSERT OR IGNORE INTO {table} (isbn, data, stored_at, accessed_at) VALUES (?, ?, ?, ?)"
+UPDATE_ENTRY = "UPDATE {table} SET data = ?, stored_at = ?, accessed_at = ? WHERE isbn = ?"
+TOUCH_ENTRY = "UPDATE {table} SET accessed_at = ? WHERE isbn = ?"
+COUNT_ENTRIES = "SELECT COUNT(*) FROM {table}"
+DELETE_EXPIRED = "DELETE FROM {table} WHERE stored_at < ?"
+# 追い出し方式ごとに「古い」とみなす列
+EVICT_OLDEST = """
+    DELETE FROM {table} WHERE isbn IN (
+        SELECT isbn FROM {table} ORDER BY {column} LIMIT ?
+    )
+"""
+DELETE_ALL = "DELETE FROM {table}"
+
+EVICTION_COLUMNS = {'lru': 'accessed_at', 'fifo': 'stored_at'}
+
+
+class MetadataCache:
+    """正規化 ISBN をキーとする書誌情報の2段キャッシュ
+
+    1段目はプロセス内の LRU（memory_size 件まで）、2段目は SQLite ファイルで、
+    再起動やサーバーレスのコールドスタート後も残る。どちらも ttl 秒で期限切れになる。
+    ディスク側が disk_size 件を超えたら、期限切れを消したうえで eviction
+    （lru: 最後に参照された順 / fifo: 保存された順）に従って古いものから追い出す。
+    db_file が None のときはメモリのみで動作する。
+    """
+
+    def __init__(self, db_file=None, ttl=7 * 24 * 3600, memory_size=1024, disk_size=100000,
+                 eviction='lru', table='metadata'):
+        if eviction not in EVICTION_COLUMNS:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.db_file = db_file
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.eviction = eviction
+        self.table = table
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'disk_errors': 0,
+            'stale_hits': 0,
+        }
+
+        self._disk_count = 0
+        if db_file is not None:
+            directory = os.path.dirname(db_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connection() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement.format(table=table))
+                self._disk_count = conn.execute(self._sql(COUNT_ENTRIES)).fetchone()[0]
+
+    def _sql(self, statement):
+        return statement.format(table=self.table, column=EVICTION_COLUMNS[self.eviction])
+
+    def _connection(self):
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, isbn):
+        """キャッシュ済みの値を返す。なければ（期限切れを含む）None"""
+        key = normalize_isbn(isbn)
+        if not key:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return value
+                # 期限切れでも容量で追い出されるまでは残し、上流の障害時に get_stale で返せるようにする
+                # （ディスクのないサーバーレスでは、ここにしか残っていない）
+                self.counters['expired'] += 1
+
+        entry = self._read_disk(key)
+        if entry is None:
+            self._count('misses')
+            return None
+
+        value, stored_at = entry
+        if now - stored_at > self.ttl:
+            self._count('expired')
+            self._count('misses')
+            return None
+
+        self._count('disk_hits')
+        self._remember(key, value, stored_at)
+        if self.eviction == 'lru':
+            self._write_disk(TOUCH_ENTRY, (now, key))
+        return value
+
+    def get_stale(self, isbn):
+        """期限切れでも残っていれば返す（上流に問い合わせられないときの代わり）"""
+        key = normalize_isbn(isbn)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            entry = self._read_disk(key)
+        if entry is None:
+            return None
+        self._count('stale_hits')
+        return entry[0]
+
+    def set(self, isbn, value):
+        key = normalize_isbn(isbn)
+        if not key:
+            return
+        now = time.time()
+        self._count('stores')
+        self._remember(key, value, now)
+
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        if self._store_disk(key, data, now):
+            with self._lock:
+                self._disk_count += 1
+                over = self._disk_count > self.disk_size
+            if over:
+                self._evict_disk(now)
+
+    def _remember(self, key, value, stored_at):
+        with self._lock:
+            self._memory[key] = (value, stored_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self.counters['memory_evictions'] += 1
+
+    def _read_disk(self, key):
+        if self.db_file is None:
+            return None
+        try:
+            row = self._connection().execute(self._sql(SELECT_ENTRY), (key,)).fetchone()
+        except sqlite3.Error as e:
+            # キャッシュの障害で検索自体を失敗させない
+            print(f"Metadata cache read error: {e}")
+            self._count('disk_errors')
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _write_disk(self, statement, params):
+        if self.db_file is None:
+            return False
+        try:
+            with self._connection() as conn:
+                conn.execute(self._sql(statement), params)
+        except sqlite3.Error as e:
+            print(f"Metadata cache write error: {e}")
+            self._count('disk_errors')
+            return False
+        return True
+
+    def _store_disk(self, key, data, now):
+        """書き込んで、新しい行を追加したら True（既存の行の更新や失敗では False）"""
+        if self.db_file is None:
+            return False
+        try:
+            with self._connection() as conn:
+                if conn.execute(self._sql(INSERT_ENTRY), (key, data, now, now)).rowcount:
+                    return True
+                conn.execute(self._sql(UPDATE_ENTRY), (data, now, now, key))
+        except sqlite3.Error as e:
+            print(f"Metadata cache write error: {e}")
+            self._count('disk_errors')
+        return False
+
+    def _evict_disk(self, now):
+        # 期限切れを先に消し、それでも多ければ 9 割まで古い順に追い出す
+        try:
+            with self._connection() as conn:
+                conn.execute(self._sql(DELETE_EXPIRED), (now - self.ttl,))
+                count = conn.execute(self._sql(COUNT_ENTRIES)).fetchone()[0]
+                target = int(self.disk_size * 0.9)
+                evicted = 0
+                if count > target:
+                    evicted = conn.execute(self._sql(EVICT_OLDEST), (count - target,)).rowcount
+                count -= evicted
+        except sqlite3.Error as e:
+            print(f"Metadata cache eviction error: {e}")
+            self._count('disk_errors')
+            return
+
+        with self._lock:
+            self._disk_count = count
+            self.counters['disk_evictions'] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._disk_count = 0
+        self._write_disk(DELETE_ALL, ())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self._disk_count if self.db_file is not None else 0
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['ttl'] = self.ttl
+        stats['eviction'] = self.eviction
+        return stats
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import uuid
+from datetime import date
+
+from models.session_model import SessionModel
+from storage.locking import FileLock, file_signature
+
+
+def _new_rollup():
+    return {'sessions': 0, 'seconds': 0, 'pages': 0, 'firstAt': None, 'lastAt': None}
+
+
+def _add_to_rollup(rollup, session):
+    rollup['sessions'] += 1
+    rollup['seconds'] += session['seconds']
+    rollup['pages'] += session['pages']
+    if rollup['firstAt'] is None or session['startedAt'] < rollup['firstAt']:
+        rollup['firstAt'] = session['startedAt']
+    if rollup['lastAt'] is None or session['endedAt'] > rollup['lastAt']:
+        rollup['lastAt'] = session['endedAt']
+
+
+def week_of(day):
+    """YYYY-MM-DD を ISO 週（YYYY-Www）に変換する"""
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class SessionLog:
+    """読書セッションの追記専用ログと、その集計（書籍別・日別・週別）
+
+    セッションは1件ずつファイルへ追記し、同時にメモリ上の集計を更新する。
+    日別・週別は開始時刻の LOCAL_TIMEZONE（BOOK_TIMEZONE）での日付で分ける。
+    集計の参照では生のセッションを走査し直さない。起動時のみログ全体を再生する。
+    path が None のときはファイルに保存しない（サーバーレス環境・テスト用）。
+
+    複数プロセスから同じファイルへ書く場合に備え、JournalStore と同様に
+    追記はファイルロック下で行い、他プロセスの追記分はサイズの比較で取り込む。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.by_book = {}
+        self.book_rollups = {}
+        self.daily = {}
+        self.weekly = {}
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._file_lock = None
+
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file_lock = FileLock(f"{path}.lock")
+            with self._file_lock:
+                self._replay()
+
+    def _apply(self, session):
+        book_id = session['bookId']
+        self.by_book.setdefault(book_id, []).append(session)
+        _add_to_rollup(self.book_rollups.setdefault(book_id, _new_rollup()), session)
+
+        # 時刻は UTC で記録しているので、日付は LOCAL_TIMEZONE に直してから取る
+        day = SessionModel.local_date(session['startedAt'])
+        daily = self.daily.get(day)
+        if daily is None:
+            daily = self.daily[day] = {**_new_rollup(), 'books': set()}
+        _add_to_rollup(daily, session)
+        daily['books'].add(book_id)
+
+        week = week_of(day)
+        weekly = self.weekly.get(week)
+        if weekly is None:
+            weekly = self.weekly[week] = {**_new_rollup(), 'books': set()}
+        _add_to_rollup(weekly, session)
+        weekly['books'].add(book_id)
+
+    def _replay(self):
+        """前回読んだ位置以降の追記分を取り込む（ファイルロック取得中に呼ぶこと）"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # 書き込み途中で落ちた末尾レコードは次の追記で上書きする
+                        break
+                    try:
+                        session = json.loads(line)
+                    except ValueError:
+                        break
+                    with self._lock:
+                        self._apply(session)
+                    self._offset += len(line)
+        except FileNotFoundError:
+            self._offset = 0
+            return
+
+        if os.path.getsize(self.path) != self._offset:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._offset)
+
+    def refresh(self):
+        if self.path is None:
+            return
+        sig = file_signature(self.path)
+        if sig is not None and sig[1] != self._offset:
+            with self._file_lock:
+                self._replay()
+
+    def append(self, book_id, started_at, ended_at, seconds, start_page=None, end_page=None):
+        """セッションを1件記録し、集計に反映して返す"""
+        pages = 0
+        if start_page is not None and end_page is not None:
+            pages = max(0, end_page - start_page)
+
+        session = {
+            'id': uuid.uuid4().hex,
+            'bookId': book_id,
+            'startedAt': started_at,
+            'endedAt': ended_at,
+            'seconds': seconds,
+            'pages': pages,
+            'startPage': start_page,
+            'endPage': end_page,
+        }
+
+        if self.path is None:
+            with self._lock:
+                self._apply(session)
+            return session
+
+        line = json.dumps(session, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._file_lock:
+            self._replay()
+            with open(self.path, 'ab') as f:
+                data = line.encode('utf-8')
+                f.write(data)
+            with self._lock:
+                self._apply(session)
+            self._offset += len(data)
+        return session
+
+    def sessions_for(self, book_id, limit=None):
+        self.refresh()
+        with self._lock:
+            sessions = list(self.by_book.get(book_id, ()))
+            rollup = dict(self.book_rollups.get(book_id) or _new_rollup())
+        if limit is not None:
+            sessions = sessions[-limit:]
+        return rollup, sessions
+
+    def daily_stats(self, start=None, end=None):
+        return self._period_stats(self.daily, 'date', start, end)
+
+    def weekly_stats(self, start=None, end=None):
+        return self._period_stats(self.weekly, 'week', start, end)
+
+    def _period_stats(self, rollups, label, start, end):
+        self.refresh()
+        with self._lock:
+            keys = sorted(rollups)
+            if start is not None:
+                keys = [key for key in keys if key >= start]
+            if end is not None:
+                keys = [key for key in keys if key <= end]
+            return [
+                {
+                    label: key,
+                    **{name: value for name, value in rollups[key].items() if name != 'books'},
+                    'books': len(rollups[key]['books']),
+                }
+                for key in keys
+            ]
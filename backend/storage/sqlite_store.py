@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+import threading
+
+from common.isbn import normalize_isbn
+from storage.base import BookStore
+from storage.index import MAX_TOMBSTONES
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS books (
+        id TEXT PRIMARY KEY,
+        isbn TEXT,
+        data TEXT NOT NULL,
+        created_at TEXT,
+        updated_at TEXT,
+        revision INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_books_isbn ON books (isbn)",
+    "CREATE INDEX IF NOT EXISTS idx_books_updated_at ON books (updated_at)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+    # これより古い revision からの差分は、削除の記録を捨てたため返せない
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('tombstone_floor', 0)",
+    "CREATE TABLE IF NOT EXISTS tombstones (id TEXT PRIMARY KEY, revision INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_tombstones_revision ON tombstones (revision)",
+)
+
+# revision 列がなかった頃のデータベースを移行する
+MIGRATIONS = (
+    ('revision', "ALTER TABLE books ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"),
+)
+INDEXES_AFTER_MIGRATION = (
+    "CREATE INDEX IF NOT EXISTS idx_books_revision ON books (revision)",
+)
+
+# SQL は定数にしておき、接続ごとのステートメントキャッシュで使い回す
+SELECT_ALL = "SELECT data FROM books ORDER BY rowid"
+SELECT_BY_ID = "SELECT data FROM books WHERE id = ?"
+SELECT_BY_ISBN = "SELECT data FROM books WHERE isbn = ? ORDER BY rowid DESC LIMIT 1"
+SELECT_LEGACY_ISBNS = "SELECT id, isbn FROM books WHERE length(isbn) = 10"
+UPDATE_ISBN = "UPDATE books SET isbn = ? WHERE id = ?"
+UPSERT = """
+    INSERT INTO books (id, isbn, data, created_at, updated_at, revision)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        isbn = excluded.isbn,
+        data = excluded.data,
+        created_at = excluded.created_at,
+        updated_at = excluded.updated_at,
+        revision = excluded.revision
+"""
+DELETE_BY_ID = "DELETE FROM books WHERE id = ?"
+SELECT_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+# 書き込みトランザクションの最初に実行し、採番とロック取得を兼ねる
+NEXT_VERSION = "UPDATE meta SET value = MAX(value + 1, ?) WHERE key = 'version'"
+INSERT_TOMBSTONE = "INSERT OR REPLACE INTO tombstones (id, revision) VALUES (?, ?)"
+DELETE_TOMBSTONE = "DELETE FROM tombstones WHERE id = ?"
+# 新しいものから数えて上限を超えた削除の記録のうち、最も新しい revision
+SELECT_PRUNE_REVISION = "SELECT revision FROM tombstones ORDER BY revision DESC LIMIT 1 OFFSET ?"
+PRUNE_TOMBSTONES = "DELETE FROM tombstones WHERE revision <= ?"
+RAISE_TOMBSTONE_FLOOR = "UPDATE meta SET value = MAX(value, ?) WHERE key = 'tombstone_floor'"
+SELECT_TOMBSTONE_FLOOR = "SELECT value FROM meta WHERE key = 'tombstone_floor'"
+SELECT_CHANGES = """
+    SELECT revision, id, data FROM books WHERE revision > ?
+    UNION ALL
+    SELECT revision, id, NULL FROM tombstones WHERE revision > ?
+    ORDER BY revision
+"""
+
+
+class SQLiteStore(BookStore):
+    """SQLite（WAL モード）による書籍ストレージ
+
+    削除の記録（tombstones）は新しいものから max_tombstones 件だけ残し、捨てた分より古い
+    revision からの changes_since には None（全件を取り直す）を返す。
+    """
+
+    def __init__(self, db_file, max_tombstones=MAX_TOMBSTONES):
+        self.db_file = db_file
+        self.max_tombstones = max_tombstones
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(books)")}
+            for column, statement in MIGRATIONS:
+                if column not in columns:
+                    conn.execute(statement)
+            for statement in INDEXES_AFTER_MIGRATION:
+                conn.execute(statement)
+            # ISBN-10 のまま索引に入っている行を ISBN-13 のキーにそろえる
+            legacy = conn.execute(SELECT_LEGACY_ISBNS).fetchall()
+            conn.executemany(UPDATE_ISBN, [(normalize_isbn(isbn), book_id) for book_id, isbn in legacy])
+
+    def _connection(self):
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに持つ
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, book):
+        return (
+            book['id'],
+            normalize_isbn(book.get('isbn')) or None,
+            json.dumps(book, ensure_ascii=False, separators=(',', ':')),
+            book.get('created_at'),
+            book.get('updated_at'),
+            book['revision'],
+        )
+
+    def get(self, book_id):
+        row = self._connection().execute(SELECT_BY_ID, (book_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self):
+        return [json.loads(row[0]) for row in self._connection().execute(SELECT_ALL)]
+
+    def iter_all(self):
+        # カーソルから1行ずつ取り出し、全件をメモリに載せない
+        for row in self._connection().execute(SELECT_ALL):
+            yield json.loads(row[0])
+
+    def find_by_isbn(self, isbn):
+        isbn = normalize_isbn(isbn)
+        if not isbn:
+            return None
+        row = self._connection().execute(SELECT_BY_ISBN, (isbn,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @property
+    def version(self):
+        return self._connection().execute(SELECT_VERSION).fetchone()[0]
+
+    def _next_revision(self, conn, revision=None):
+        conn.execute(NEXT_VERSION, (revision or 0,))
+        return conn.execute(SELECT_VERSION).fetchone()[0]
+
+    def _put(self, conn, book):
+        book['revision'] = self._next_revision(conn, book.get('revision'))
+        conn.execute(UPSERT, self._row(book))
+        conn.execute(DELETE_TOMBSTONE, (book['id'],))
+
+    def put(self, book):
+        with self._connection() as conn:
+            self._put(conn, book)
+        return book
+
+    def put_many(self, books):
+        books = list(books)
+        with self._connection() as conn:
+            for book in books:
+                self._put(conn, book)
+        return len(books)
+
+    def delete(self, book_id, revision=None):
+        with self._connection() as conn:
+            existed = conn.execute(DELETE_BY_ID, (book_id,)).rowcount > 0
+            if not existed and revision is None:
+                return False
+            conn.execute(INSERT_TOMBSTONE, (book_id, self._next_revision(conn, revision)))
+            self._prune_tombstones(conn)
+            return existed
+
+    def _prune_tombstones(self, conn):
+        row = conn.execute(SELECT_PRUNE_REVISION, (self.max_tombstones,)).fetchone()
+        if row is not None:
+            conn.execute(PRUNE_TOMBSTONES, (row[0],))
+            conn.execute(RAISE_TOMBSTONE_FLOOR, (row[0],))
+
+    @property
+    def tombstone_floor(self):
+        return self._connection().execute(SELECT_TOMBSTONE_FLOOR).fetchone()[0]
+
+    def changes_since(self, since):
+        # 下限の確認と差分の取得を同じ読み取りトランザクションで行い、間に刈り込まれないようにする
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            if since < conn.execute(SELECT_TOMBSTONE_FLOOR).fetchone()[0]:
+                return None
+            rows = conn.execute(SELECT_CHANGES, (since, since)).fetchall()
+        return [
+            (revision, book_id, json.loads(data) if data is not None else None)
+            for revision, book_id, data in rows
+        ]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
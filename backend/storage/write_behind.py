@@ -0,0 +1,232 @@
+import atexit
+import threading
+import time
+
+from common.isbn import normalize_isbn
+from storage.base import BookStore
+
+class _Deleted:
+    """削除済みを表す目印（dirty に積んでおき、フラッシュ時に delete する）"""
+
+    __slots__ = ('revision',)
+
+    def __init__(self, revision):
+        self.revision = revision
+
+
+class WriteBehindStore(BookStore):
+    """書き込みをメモリ上でまとめ、バックグラウンドで一括永続化するラッパー
+
+    更新は即座にメモリへ反映され、同じ書籍への連続した更新は1件にまとめられる。
+    一定間隔（flush_interval 秒）または未保存件数が max_dirty に達した時点で
+    内側のストアへ put_many / delete をまとめて発行する。終了時には必ずフラッシュする。
+    """
+
+    def __init__(self, inner, flush_interval=1.0, max_dirty=500):
+        self.inner = inner
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+
+        self._pending = {}
+        self._flushing = {}
+        # 内側のストアはまとめて書かれるため、変更回数は自前で数える
+        self._version = inner.version
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+        self.counters = {
+            'flushes': 0,
+            'flushed_records': 0,
+            'coalesced_writes': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'flush_errors': 0,
+        }
+
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _lookup(self, book_id):
+        # 未保存 → フラッシュ中 → 内側のストア の順に参照する
+        with self._lock:
+            for layer in (self._pending, self._flushing):
+                if book_id in layer:
+                    return layer[book_id]
+        return None
+
+    @property
+    def version(self):
+        # 他プロセスが内側のストアに書き込んだ変更も反映する
+        return max(self._version, self.inner.version)
+
+    def get(self, book_id):
+        book = self._lookup(book_id)
+        if isinstance(book, _Deleted):
+            return None
+        if book is not None:
+            return book
+        return self.inner.get(book_id)
+
+    def all(self):
+        with self._lock:
+            overlay = {**self._flushing, **self._pending}
+
+        books = []
+        for book in self.inner.all():
+            book = overlay.pop(book['id'], book)
+            if not isinstance(book, _Deleted):
+                books.append(book)
+        books.extend(book for book in overlay.values() if not isinstance(book, _Deleted))
+        return books
+
+    def find_by_isbn(self, isbn):
+        isbn = normalize_isbn(isbn)
+        if not isbn:
+            return None
+
+        with self._lock:
+            overlay = {**self._flushing, **self._pending}
+
+        for book in overlay.values():
+            if not isinstance(book, _Deleted) and normalize_isbn(book.get('isbn')) == isbn:
+                return book
+
+        book = self.inner.find_by_isbn(isbn)
+        if book is not None and book['id'] in overlay:
+            # 未保存の変更で削除・ISBN 変更されている
+            return None
+        return book
+
+    def put(self, book):
+        self._mark(book['id'], book)
+        return book
+
+    def put_many(self, books):
+        books = list(books)
+        for book in books:
+            self._mark(book['id'], book)
+        return len(books)
+
+    def delete(self, book_id, revision=None):
+        if self.get(book_id) is None:
+            return False
+        self._mark(book_id, _Deleted(revision))
+        return True
+
+    def _mark(self, book_id, value):
+        with self._lock:
+            if book_id in self._pending:
+                self.counters['coalesced_writes'] += 1
+            # 採番はここで行い、フラッシュ時も同じ revision で内側に書き込む
+            self._version = self.next_revision(
+                value.revision if isinstance(value, _Deleted) else value.get('revision')
+            )
+            if isinstance(value, _Deleted):
+                value.revision = self._version
+            else:
+                value['revision'] = self._version
+            self._pending[book_id] = value
+            dirty = len(self._pending)
+
+        if dirty >= self.max_dirty:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush error: {e}")
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                batch = self._flushing
+
+            started = time.perf_counter()
+            try:
+                # revision 順に書き込み、連続する put は put_many にまとめる
+                entries = sorted(batch.items(), key=lambda item: _revision_of(item[1]))
+                puts = []
+                for book_id, value in entries:
+                    if isinstance(value, _Deleted):
+                        if puts:
+                            self.inner.put_many(puts)
+                            puts = []
+                        self.inner.delete(book_id, value.revision)
+                    else:
+                        puts.append(value)
+                if puts:
+                    self.inner.put_many(puts)
+            except Exception:
+                # 失敗したバッチは次回のフラッシュで再送する（新しい変更を優先）
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                    self._flushing = {}
+                    self.counters['flush_errors'] += 1
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._flushing = {}
+                counters = self.counters
+                counters['flushes'] += 1
+                counters['flushed_records'] += len(batch)
+                counters['last_batch_size'] = len(batch)
+                counters['max_batch_size'] = max(counters['max_batch_size'], len(batch))
+                counters['last_flush_ms'] = elapsed_ms
+                counters['max_flush_ms'] = max(counters['max_flush_ms'], elapsed_ms)
+                counters['total_flush_ms'] += elapsed_ms
+
+            return len(batch)
+
+    def changes_since(self, since):
+        with self._lock:
+            overlay = {**self._flushing, **self._pending}
+
+        entries = self.inner.changes_since(since)
+        if entries is None:
+            return None
+        entries = [entry for entry in entries if entry[1] not in overlay]
+        for book_id, value in overlay.items():
+            if _revision_of(value) > since:
+                book = None if isinstance(value, _Deleted) else value
+                entries.append((_revision_of(value), book_id, book))
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['dirty'] = len(self._pending)
+        stats['avg_flush_ms'] = (
+            stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        )
+        stats['avg_batch_size'] = (
+            stats['flushed_records'] / stats['flushes'] if stats['flushes'] else 0.0
+        )
+        return stats
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        self.inner.close()
+
+
+def _revision_of(value):
+    return value.revision if isinstance(value, _Deleted) else value['revision']
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# backend 配下のモジュールを app.py と同じ名前（common.*, storage.*）で読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from common.async_lookup import AsyncLookup
+from common.upstream import UpstreamError
+from storage import MetadataCache
+
+ISBNS = ['9784101010014', '9784101010021', '9784101010038', '9784101010045']
+
+
+class FakeClient:
+    """同時に処理中のリクエスト数の最大を記録し、delay 秒かけて「該当なし」を返す上流の代わり"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    async def get(self, url, params=None):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return Response()
+
+    async def post(self, url, data=None, idempotent=False):
+        raise UpstreamError('openbd', 'unexpected batch request')
+
+    def stats(self):
+        return {}
+
+
+class Response:
+    content = b''
+
+    def json(self):
+        return [None]
+
+
+def make_lookup(client, **kwargs):
+    lookup = AsyncLookup(MetadataCache(None), MetadataCache(None, table='negative'), 'http://openbd.test',
+                         lambda isbn, info: info, batch_size=1, **kwargs)
+    lookup.openbd_client = client
+    return lookup
+
+
+def test_concurrency_limit_is_shared_between_batches():
+    client = FakeClient()
+    lookup = make_lookup(client, concurrency=2)
+
+    async def run():
+        return await asyncio.gather(lookup.lookup_many(ISBNS[:2]), lookup.lookup_many(ISBNS[2:]))
+
+    first, second = asyncio.run(run())
+
+    assert client.peak == 2
+    assert set(first.values()) | set(second.values()) == {('not_found', None)}
+
+
+def test_batch_is_cut_off_at_the_deadline():
+    lookup = make_lookup(FakeClient(delay=5), concurrency=4, deadline=0.1)
+    stale = {'title': '吾輩は猫である'}
+    lookup.cache.ttl = 0
+    lookup.cache.set(ISBNS[0], stale)
+    time.sleep(0.01)
+
+    started = time.monotonic()
+    results = asyncio.run(lookup.lookup_many(ISBNS))
+
+    assert time.monotonic() - started < 2
+    assert results[ISBNS[0]] == ('found', stale)
+    assert all(results[isbn] == ('error', None) for isbn in ISBNS[1:])
+    assert lookup.stats()['deadline_exceeded'] == 1
+    # 打ち切ったものは「該当なし」として記録しない
+    assert all(lookup.negative_cache.get(isbn) is None for isbn in ISBNS)
@@ -0,0 +1,20 @@
+from common.book_query import LibraryQuery, book_status
+from storage import MemoryStore
+
+
+def test_status_and_sort_with_mixed_types():
+    store = MemoryStore()
+    store.put_many([
+        {'id': 'a', 'title': 'A', 'totalPages': '100', 'currentPage': '50'},
+        {'id': 'b', 'title': 7, 'totalPages': 100, 'currentPage': 100},
+        {'id': 'c', 'title': None, 'totalPages': 100, 'currentPage': 0},
+    ])
+    query = LibraryQuery(store)
+
+    assert book_status(store.get('a')) == 'reading'
+    books, _ = query.page(sort='currentPage', order='desc')
+    assert [book['id'] for book in books] == ['b', 'a', 'c']
+    books, _ = query.page(sort='title')
+    assert [book['id'] for book in books] == ['c', 'b', 'a']
+    books, _ = query.page(status='reading')
+    assert [book['id'] for book in books] == ['a']
@@ -0,0 +1,90 @@
+"""common.isbn の性質を、乱数で作った多数の ISBN で確かめる（シードを固定して再現できるようにする）"""
+import random
+
+import pytest
+
+from common.isbn import (
+    InvalidISBNError, canonical_isbn, is_isbn10, is_isbn13, isbn10_check_digit, isbn10_to_13,
+    isbn13_check_digit, isbn13_to_10, parse_isbn,
+)
+
+SAMPLES = 2000
+
+
+def random_isbn10(rng):
+    core = ''.join(rng.choice('0123456789') for _ in range(9))
+    return core + isbn10_check_digit(core)
+
+
+def random_isbn13(rng, prefix=None):
+    core = (prefix or rng.choice(('978', '979'))) + ''.join(rng.choice('0123456789') for _ in range(9))
+    return core + isbn13_check_digit(core)
+
+
+def single_digit_changes(isbn):
+    """1桁だけ別の文字に置き換えたものをすべて返す"""
+    alphabet = '0123456789X' if len(isbn) == 10 else '0123456789'
+    for position, original in enumerate(isbn):
+        for replacement in alphabet:
+            if replacement != original and (replacement != 'X' or position == 9):
+                yield isbn[:position] + replacement + isbn[position + 1:]
+
+
+def decorate(isbn, rng):
+    """区切り（ハイフン・空白）を任意の位置に入れ、前後に空白を付ける"""
+    parts = []
+    for char in isbn:
+        parts.append(char)
+        if rng.random() < 0.3:
+            parts.append(rng.choice(('-', ' ', '\t', '－', '  ')))
+    return rng.choice(('', ' ', '\n')) + ''.join(parts) + rng.choice(('', ' ', '\r\n'))
+
+
+@pytest.fixture
+def rng():
+    return random.Random(20261017)
+
+
+def test_isbn10_round_trip(rng):
+    for _ in range(SAMPLES):
+        isbn10 = random_isbn10(rng)
+        isbn13 = isbn10_to_13(isbn10)
+        assert is_isbn13(isbn13)
+        assert isbn13_to_10(isbn13) == isbn10
+        assert canonical_isbn(isbn10) == isbn13
+
+
+def test_isbn13_978_round_trip(rng):
+    for _ in range(SAMPLES):
+        isbn13 = random_isbn13(rng, '978')
+        isbn10 = isbn13_to_10(isbn13)
+        assert is_isbn10(isbn10)
+        assert isbn10_to_13(isbn10) == isbn13
+        assert canonical_isbn(isbn13) == isbn13
+
+
+def test_any_single_digit_change_is_rejected(rng):
+    for _ in range(SAMPLES // 10):
+        for isbn in (random_isbn10(rng), random_isbn13(rng)):
+            assert canonical_isbn(isbn) is not None
+            for changed in single_digit_changes(isbn):
+                assert canonical_isbn(changed) is None, (isbn, changed)
+                with pytest.raises(InvalidISBNError):
+                    parse_isbn(changed)
+
+
+def test_separators_and_whitespace_are_ignored(rng):
+    for _ in range(SAMPLES):
+        isbn = random_isbn10(rng) if rng.random() < 0.5 else random_isbn13(rng)
+        assert canonical_isbn(decorate(isbn, rng)) == canonical_isbn(isbn)
+        assert parse_isbn(decorate(isbn, rng)) == canonical_isbn(isbn)
+
+
+def test_979_has_no_isbn10(rng):
+    for _ in range(SAMPLES):
+        isbn13 = random_isbn13(rng, '979')
+        assert isbn13_to_10(isbn13) is None
+        # ISBN-13 のまま扱い、ISBN-10 の形に変わることはない
+        assert canonical_isbn(isbn13) == isbn13
+        # ISBN-10 からは 978 の ISBN-13 にしかならない
+        assert not isbn10_to_13(random_isbn10(rng)).startswith('979')
@@ -0,0 +1,40 @@
+from storage import JournalStore
+
+
+def test_version_sees_other_process_writes(tmp_path):
+    path = str(tmp_path / 'books.json')
+    writer = JournalStore(path)
+    reader = JournalStore(path)
+
+    writer.put({'id': 'a', 'title': 'x'})
+    assert reader.version == writer.version == 1
+
+    reader.delete('a')
+    assert writer.version == 2
+    assert writer.get('a') is None
+
+
+def test_binary_snapshot_decodes_records_once(tmp_path, monkeypatch):
+    from storage.binary_snapshot import BinarySnapshot
+
+    path = str(tmp_path / 'books.json')
+    store = JournalStore(path, snapshot_format='binary')
+    store.put_many([{'id': f'b{i}', 'title': f'本{i}', 'tags': ['a']} for i in range(50)])
+    store.compact(wait=True)
+    store.put({'id': 'b3', 'title': '更新'})
+    store.delete('b4')
+
+    decoded = []
+    decode = BinarySnapshot._decode
+    monkeypatch.setattr(BinarySnapshot, '_decode', lambda self, no: decoded.append(no) or decode(self, no))
+
+    books = store.all()
+    assert len(books) == 49
+    assert len(decoded) == 50
+    assert {book['id']: book['title'] for book in books}['b3'] == '更新'
+
+    # 2回目以降の全件取得・差分・取得では復元し直さない
+    assert [book['id'] for book in store.all()] == [book['id'] for book in books]
+    assert len(store.changes_since(0)) == 50  # b4 の tombstone を含む
+    assert store.get('b10')['tags'] == ['a']
+    assert len(decoded) == 50
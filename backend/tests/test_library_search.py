@@ -0,0 +1,89 @@
+from common.library_search import LibrarySearch
+from storage import MemoryStore
+
+
+def make_search(books):
+    store = MemoryStore()
+    store.put_many(books)
+    return store, LibrarySearch(store)
+
+
+def test_rare_word_with_common_single_character():
+    books = [{'id': f'b{i}', 'title': f'本の話 {i}', 'author': '', 'publisher': ''} for i in range(2000)]
+    books.append({'id': 'cat', 'title': '吾輩の猫', 'author': '', 'publisher': ''})
+    _, search = make_search(books)
+
+    found, total, _ = search.search('吾輩 の')
+    assert total == 1
+    assert [book['id'] for book in found] == ['cat']
+
+
+def test_single_character_word_first():
+    books = [{'id': f'b{i}', 'title': f'猫{i}の本', 'author': '夏目', 'publisher': ''} for i in range(50)]
+    books.append({'id': 'x', 'title': '犬の本', 'author': '夏目', 'publisher': ''})
+    _, search = make_search(books)
+
+    found, total, _ = search.search('犬 夏目')
+    assert total == 1
+    assert found[0]['id'] == 'x'
+    assert search.search('猫 夏目 本')[1] == 50
+    assert search.search('猫 犬')[1] == 0
+
+
+def test_picks_up_changes_from_other_workers(tmp_path):
+    from storage import JournalStore
+
+    path = str(tmp_path / 'books.json')
+    mine = JournalStore(path)
+    other = JournalStore(path)
+    mine.put({'id': 'a', 'title': '吾輩は猫である', 'author': '夏目漱石', 'publisher': ''})
+    search = LibrarySearch(mine)
+    assert search.search('吾輩')[1] == 1
+
+    # 別のワーカーが同じファイルに書き込んだ変更
+    other.put({'id': 'b', 'title': '吾輩の日記', 'author': '', 'publisher': ''})
+    other.put({'id': 'a', 'title': 'こころ', 'author': '夏目漱石', 'publisher': ''})
+    found, total, _ = search.search('吾輩')
+    assert total == 1
+    assert found[0]['id'] == 'b'
+
+    other.delete('b')
+    assert search.search('吾輩')[1] == 0
+    assert search.search('こころ')[1] == 1
+
+
+def test_rebuilds_when_history_is_gone():
+    store, search = make_search([{'id': 'a', 'title': '猫', 'author': '', 'publisher': ''}])
+    assert search.search('猫')[1] == 1
+
+    store.put({'id': 'b', 'title': '猫と犬', 'author': '', 'publisher': ''})
+    store.index.tombstone_floor = store.version
+    assert search.search('猫')[1] == 2
+
+
+def test_writes_do_not_wait_for_search():
+    import threading
+
+    from api.book_service import BookService
+
+    store = MemoryStore()
+    service = BookService(store=store, sessions=object())
+    service.save_book({'id': 'a', 'title': '吾輩は猫である'})
+    assert service.search_books('猫')[1] == 1
+
+    # 索引の作成・検索中（ロックを持っている間）でも保存・更新・削除は終わる
+    with service.search._lock:
+        writer = threading.Thread(target=lambda: (
+            service.save_book({'id': 'b', 'title': '猫の事務所'}),
+            service.update_book('a', {'title': '坊っちゃん'}),
+            service.import_books([{'id': 'c', 'title': '猫町'}]),
+        ))
+        writer.start()
+        writer.join(5)
+        assert not writer.is_alive()
+        service.delete_book('c')
+
+    found, total, _ = service.search_books('猫')
+    assert total == 1
+    assert found[0]['id'] == 'b'
+    assert service.search_books('坊っちゃん')[1] == 1
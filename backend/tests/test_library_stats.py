@@ -0,0 +1,82 @@
+import pytest
+
+from common import library_stats
+from common.library_stats import LibraryStats
+from storage import MemoryStore
+
+
+def test_summary_tolerates_untyped_counts():
+    store = MemoryStore()
+    store.put_many([
+        {'id': 'a', 'title': 'A', 'totalPages': '100', 'currentPage': '50', 'readingTime': 12.5},
+        {'id': 'b', 'title': 'B', 'totalPages': 200, 'currentPage': 200, 'readingTime': 3600},
+        {'id': 'c', 'title': 'C', 'totalPages': None, 'currentPage': 'x', 'readingTime': -5},
+    ])
+
+    summary = LibraryStats(store).summary()
+    assert summary['books'] == 3
+    assert summary['readingTime'] == 3612
+    assert summary['pages'] == {'total': 300, 'read': 250, 'remaining': 50}
+    assert (summary['completed'], summary['reading'], summary['unread']) == (1, 1, 1)
+
+
+def books(count):
+    return [
+        {'id': str(i), 'title': f'書籍{i}', 'publisher': f'出版社{i % 3}', 'author': f'著者{i % 7}',
+         'totalPages': 100 + i, 'currentPage': (i * 37) % (101 + i), 'readingTime': i * 60,
+         'created_at': f'2026-0{1 + i % 9}-15T12:00:00'}
+        for i in range(count)
+    ]
+
+
+def without_engine(stats):
+    return {key: value for key, value in stats.items() if key != 'engine'}
+
+
+def test_updates_are_applied_without_rebuilding_columns():
+    store = MemoryStore()
+    store.put_many(books(50))
+    stats = LibraryStats(store)
+    stats.summary()
+    columns = stats._columns
+
+    store.put(dict(store.get('3'), currentPage=103, publisher='新しい出版社'))
+    store.delete('0')
+    store.delete('49')
+    store.put({'id': 'new', 'title': '新刊', 'totalPages': 10, 'currentPage': 5, 'created_at': 'broken'})
+
+    updated = stats.summary()
+    assert stats._columns is columns
+    assert updated == LibraryStats(store).summary()
+    assert updated['books'] == 49
+    assert '0' not in columns.rows and columns.ids[columns.rows['new']] == 'new'
+
+
+def test_rebuilds_when_changes_are_too_old():
+    store = MemoryStore()
+    store.put_many(books(5))
+    stats = LibraryStats(store)
+    stats.summary()
+    columns = stats._columns
+
+    store.delete('1')
+    store.index.tombstone_floor = store.version
+
+    assert stats.summary()['books'] == 4
+    assert stats._columns is not columns
+
+
+def test_array_engine_matches_numpy(monkeypatch):
+    if library_stats.np is None:
+        pytest.skip('NumPy is not installed')
+    store = MemoryStore()
+    store.put_many(books(200))
+    expected = LibraryStats(store).summary(top=5)
+
+    monkeypatch.setattr(library_stats, 'np', None)
+    actual = LibraryStats(store).summary(top=5)
+    assert actual['engine'] == 'array'
+    assert without_engine(actual) == without_engine(expected)
+    # 使われなくなった名前は内訳に出さない
+    store.put_many(dict(book, author='同じ著者') for book in store.all())
+    assert [group['name'] for group in LibraryStats(store).summary()['authors']] == ['同じ著者']
@@ -0,0 +1,40 @@
+import time
+
+from storage import MetadataCache
+
+ISBN = '9784101010014'
+
+
+def test_memory_only_cache_keeps_expired_entries_for_stale_reads():
+    cache = MetadataCache(None, ttl=0.05)
+    cache.set(ISBN, {'title': 'x'})
+    assert cache.get(ISBN) == {'title': 'x'}
+
+    time.sleep(0.1)
+    assert cache.get(ISBN) is None
+    assert cache.get(ISBN) is None
+    assert cache.get_stale(ISBN) == {'title': 'x'}
+
+    cache.set(ISBN, {'title': 'y'})
+    assert cache.get(ISBN) == {'title': 'y'}
+
+
+def test_expired_entries_still_evicted_by_capacity():
+    cache = MetadataCache(None, ttl=0.05, memory_size=2)
+    isbns = ['9784101010014', '9784101010021', '9784101010038']
+    for n, isbn in enumerate(isbns):
+        cache.set(isbn, {'n': n})
+    assert cache.get_stale(isbns[0]) is None
+    assert cache.get_stale(isbns[2]) == {'n': 2}
+
+
+def test_updating_an_entry_does_not_grow_disk_count(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.db'), disk_size=10)
+    for n in range(50):
+        cache.set(ISBN, {'n': n})
+    assert cache.stats()['disk_entries'] == 1
+    assert cache.stats()['disk_evictions'] == 0
+    assert MetadataCache(str(tmp_path / 'cache.db')).get(ISBN) == {'n': 49}
+
+    cache.set('9784101010021', {'n': 0})
+    assert cache.stats()['disk_entries'] == 2
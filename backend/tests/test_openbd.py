@@ -0,0 +1,103 @@
+import json
+import os
+
+from common.openbd import openbd_book, pages_from_text
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'tools', 'fixtures', 'openbd_get.json')
+ISBN = '9784101010014'
+
+
+def onix_only(**onix):
+    return {'summary': {'isbn': ISBN, 'title': '', 'author': '', 'publisher': ''}, 'onix': onix}
+
+
+def test_summary_takes_precedence_over_onix():
+    book = openbd_book(ISBN, {
+        'summary': {'title': ' こころ ', 'author': '夏目漱石', 'extent': '384p'},
+        'onix': {'DescriptiveDetail': {
+            'TitleDetail': {'TitleElement': {'TitleText': {'content': '別の題名'}}},
+            'Extent': [{'ExtentType': '00', 'ExtentValue': '100'}],
+        }},
+    })
+    assert book['title'] == 'こころ'
+    assert book['author'] == '夏目漱石'
+    assert book['totalPages'] == 384
+
+
+def test_onix_fallbacks():
+    book = openbd_book(ISBN, onix_only(
+        DescriptiveDetail={
+            'TitleDetail': {'TitleElement': {'TitleText': {'collationkey': 'ノルウェイノモリ', 'content': 'ノルウェイの森'}}},
+            'Contributor': [
+                {'ContributorRole': ['B01'], 'PersonName': {'content': '編集部'}},
+                {'ContributorRole': ['A01'], 'PersonName': {'content': '村上春樹'}},
+            ],
+            # 本文のページ数（00）がなければ総ページ数（11）
+            'Extent': [{'ExtentType': '11', 'ExtentValue': '302'}],
+        },
+        # Publisher は配列ではなくオブジェクト
+        PublishingDetail={
+            'Publisher': {'PublisherName': '講談社'},
+            'PublishingDate': [{'PublishingDateRole': '02', 'Date': '20040101'},
+                               {'PublishingDateRole': '01', 'Date': '20041115'}],
+        },
+        # ResourceLink は文字列のまま
+        CollateralDetail={'SupportingResource': [
+            {'ResourceContentType': '04', 'ResourceVersion': [{'ResourceLink': 'https://example.com/other.jpg'}]},
+            {'ResourceContentType': '01', 'ResourceVersion': [{'ResourceLink': 'https://cover.openbd.jp/x.jpg'}]},
+        ]},
+    ))
+    assert book == {
+        'isbn': ISBN,
+        'title': 'ノルウェイの森',
+        'author': '村上春樹',
+        'publisher': '講談社',
+        'pubdate': '20041115',
+        'totalPages': 302,
+        'coverImage': 'https://cover.openbd.jp/x.jpg',
+        'currentPage': 0,
+        'readingTime': 0,
+    }
+
+
+def test_extent_00_preferred_and_imprint_used_without_publisher():
+    book = openbd_book(ISBN, onix_only(
+        DescriptiveDetail={'Extent': [{'ExtentType': '11', 'ExtentValue': '320'},
+                                      {'ExtentType': '00', 'ExtentValue': '302'}]},
+        PublishingDetail={'Imprint': {'ImprintName': '講談社文庫'}},
+    ))
+    assert book['totalPages'] == 302
+    assert book['publisher'] == '講談社文庫'
+
+
+def test_first_contributor_when_no_author_role():
+    book = openbd_book(ISBN, onix_only(DescriptiveDetail={'Contributor': [
+        {'ContributorRole': 'B01', 'PersonName': ''},
+        {'ContributorRole': 'B06', 'PersonName': '翻訳者'},
+    ]}))
+    assert book['author'] == '翻訳者'
+
+
+def test_unexpected_shapes_give_empty_values():
+    for book_info in ({}, {'summary': None, 'onix': []},
+                      onix_only(DescriptiveDetail=[], PublishingDetail={'Publisher': [{'PublisherName': 'x'}]})):
+        book = openbd_book(ISBN, book_info)
+        assert (book['title'], book['author'], book['publisher'], book['totalPages'], book['coverImage']) == \
+            ('', '', '', 0, '')
+
+
+def test_pages_from_text():
+    assert pages_from_text('384p') == 384
+    assert pages_from_text('xii, 250 pages') == 250
+    assert pages_from_text('302ページ ; 15cm') == 302
+    assert pages_from_text({'content': '120'}) == 120
+    assert pages_from_text(None) == 0
+
+
+def test_fixture_records_are_complete():
+    with open(FIXTURE, encoding='utf-8') as f:
+        records = json.load(f)
+    for record in records:
+        book = openbd_book(record['summary']['isbn'], record)
+        assert book['title'] and book['author'] and book['totalPages'] > 0
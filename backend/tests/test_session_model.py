@@ -0,0 +1,31 @@
+from models.session_model import SessionModel
+
+
+def test_mixed_aware_and_naive_times_are_compared_in_utc():
+    # タイムゾーンのない時刻は日本時間（BOOK_TIMEZONE の既定）とみなす
+    data = {'startedAt': '2026-10-17T00:00:00+00:00', 'endedAt': '2026-10-17T09:30:00'}
+
+    assert SessionModel.validate(data) is None
+    record = SessionModel.to_record(data)
+    assert record['started_at'] == '2026-10-17T00:00:00+00:00'
+    assert record['ended_at'] == '2026-10-17T00:30:00+00:00'
+    assert record['seconds'] == 1800
+
+
+def test_end_before_start_across_time_zones_is_rejected():
+    data = {'startedAt': '2026-10-17T09:30:00', 'endedAt': '2026-10-17T00:00:00+00:00'}
+
+    assert SessionModel.validate(data) == 'endedAt は startedAt 以降である必要があります'
+
+
+def test_seconds_only_session_ends_now_in_utc():
+    record = SessionModel.to_record({'seconds': 60})
+
+    assert record['ended_at'].endswith('+00:00')
+    assert record['seconds'] == 60
+
+
+def test_local_date_near_midnight():
+    assert SessionModel.local_date('2026-10-18T08:30:00') == '2026-10-18'
+    assert SessionModel.local_date('2026-10-17T23:30:00+00:00') == '2026-10-18'
+    assert SessionModel.local_date('2026-10-17T14:59:59+00:00') == '2026-10-17'
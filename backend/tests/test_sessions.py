@@ -0,0 +1,18 @@
+from models.session_model import SessionModel
+from storage.sessions import SessionLog
+
+
+def test_rollups_use_local_dates_near_midnight():
+    log = SessionLog()
+    # 日本時間 2026-10-19（月）00:30 と 08:30。UTC ではどちらも前日（日曜）
+    for data in (
+        {'startedAt': '2026-10-19T00:30:00+09:00', 'seconds': 600},
+        {'startedAt': '2026-10-19T08:30:00', 'seconds': 300},
+        {'startedAt': '2026-10-18T23:50:00+09:00', 'seconds': 60},
+    ):
+        log.append('a', **SessionModel.to_record(data))
+
+    daily = {row['date']: row['seconds'] for row in log.daily_stats()}
+    assert daily == {'2026-10-18': 60, '2026-10-19': 900}
+    weekly = {row['week']: row['seconds'] for row in log.weekly_stats()}
+    assert weekly == {'2026-W42': 60, '2026-W43': 900}
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from api.ndl_api import NDLApi
+from common.singleflight import SingleFlight
+from common.upstream import UpstreamError
+from storage import Catalogue, MetadataCache
+
+ISBN = '9784101010014'
+THREADS = 16
+
+
+def run_concurrently(fn, count=THREADS):
+    """count 個のスレッドで同時に fn を呼び、(結果, 例外) のリストを返す"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+class SlowUpstream:
+    """呼ばれた回数を数え、delay 秒かけて応答する上流の代わり"""
+
+    def __init__(self, result=None, error=None, delay=0.2):
+        self.result = result
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, isbn):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return dict(self.result, isbn=isbn) if self.result is not None else None
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv('LOOKUP_MODE', 'sequential')
+    api = NDLApi(MetadataCache(None), MetadataCache(None, table='negative'), Catalogue(None))
+    monkeypatch.setattr(api, 'get_from_ndl', SlowUpstream(delay=0))
+    return api
+
+
+def test_singleflight_runs_once_and_shares_result():
+    flight = SingleFlight()
+    upstream = SlowUpstream(result={'title': 'x'})
+
+    results, errors = run_concurrently(lambda: flight.do(ISBN, upstream, ISBN))
+
+    assert upstream.calls == 1
+    assert errors == [None] * THREADS
+    assert all(result == {'title': 'x', 'isbn': ISBN} for result in results)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_concurrent_lookups_call_upstream_once(api, monkeypatch):
+    upstream = SlowUpstream(result={'title': '吾輩は猫である'})
+    monkeypatch.setattr(api, 'get_from_openbd', upstream)
+
+    results, errors = run_concurrently(lambda: api.get_book_by_isbn(ISBN))
+
+    assert upstream.calls == 1
+    assert errors == [None] * THREADS
+    assert all(result == {'title': '吾輩は猫である', 'isbn': ISBN} for result in results)
+    # 呼び出し元ごとに別の dict を返す
+    assert len({id(result) for result in results}) == THREADS
+
+
+def test_upstream_error_reaches_every_waiter_and_is_not_cached(api, monkeypatch):
+    failing = SlowUpstream(error=UpstreamError('openbd', 'HTTP 503'))
+    monkeypatch.setattr(api, 'get_from_openbd', failing)
+
+    results, errors = run_concurrently(lambda: api.get_book_by_isbn(ISBN))
+
+    assert failing.calls == 1
+    assert results == [None] * THREADS
+    assert all(isinstance(error, UpstreamError) for error in errors)
+    assert api.cache.get(ISBN) is None
+    assert api.negative_cache.get(ISBN) is None
+
+    # 失敗は記録されないので、次の検索は上流に問い合わせ直す
+    upstream = SlowUpstream(result={'title': '吾輩は猫である'}, delay=0)
+    monkeypatch.setattr(api, 'get_from_openbd', upstream)
+    assert api.get_book_by_isbn(ISBN)['title'] == '吾輩は猫である'
+    assert upstream.calls == 1
+
+
+def test_hedged_lookup_reports_non_upstream_errors(monkeypatch):
+    monkeypatch.setenv('LOOKUP_MODE', 'parallel')
+    api = NDLApi(MetadataCache(None), MetadataCache(None, table='negative'), Catalogue(None))
+    monkeypatch.setattr(api, 'get_from_openbd', SlowUpstream(error=ValueError('broken record'), delay=0))
+    monkeypatch.setattr(api, 'get_from_ndl', SlowUpstream(delay=0))
+
+    with pytest.raises(ValueError, match='broken record'):
+        api.get_book_by_isbn(ISBN)
@@ -0,0 +1,35 @@
+from storage.sqlite_store import SQLiteStore
+
+
+def make_store(tmp_path, **kwargs):
+    return SQLiteStore(str(tmp_path / 'books.db'), **kwargs)
+
+
+def test_changes_since_includes_deletions(tmp_path):
+    store = make_store(tmp_path)
+    store.put({'id': 'a', 'title': 'A'})
+    store.put({'id': 'b', 'title': 'B'})
+    version = store.version
+    store.delete('a')
+
+    assert [(book_id, book) for _, book_id, book in store.changes_since(version)] == [('a', None)]
+
+
+def test_old_tombstones_are_pruned_and_old_clients_resync(tmp_path):
+    store = make_store(tmp_path, max_tombstones=2)
+    store.put_many({'id': str(i), 'title': str(i)} for i in range(5))
+    before = store.version
+    for i in range(5):
+        store.delete(str(i))
+
+    conn = store._connection()
+    assert conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0] == 2
+    # 削除の記録を捨てた revision より前からの差分は返せないので、全件を取り直させる
+    assert store.changes_since(before) is None
+    assert store.changes_since(0) is None
+
+    floor = store.tombstone_floor
+    assert [book_id for _, book_id, _ in store.changes_since(floor)] == ['3', '4']
+
+    # 別のプロセス（新しい接続）から見ても同じ下限になる
+    assert make_store(tmp_path, max_tombstones=2).changes_since(before) is None
@@ -0,0 +1,46 @@
+import pytest
+
+from storage import JournalStore, MemoryStore
+from storage.sqlite_store import SQLiteStore
+from storage.write_behind import WriteBehindStore
+
+
+@pytest.fixture(params=['memory', 'journal', 'sqlite'])
+def inner(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStore()
+    if request.param == 'journal':
+        return JournalStore(str(tmp_path / 'books.json'))
+    return SQLiteStore(str(tmp_path / 'books.db'))
+
+
+def test_delete_before_flush_reaches_changes_feed(inner):
+    store = WriteBehindStore(inner, flush_interval=3600)
+    try:
+        store.put({'id': 'keep', 'title': '残る本'})
+        store.flush()
+        since = store.version
+
+        store.put({'id': 'a', 'title': '一時的な本'})
+        # 利用者はフラッシュ前に作成を見る
+        seen = store.changes_since(since)
+        assert [(book_id, book is not None) for _, book_id, book in seen] == [('a', True)]
+        since = seen[-1][0]
+
+        assert store.delete('a')
+        store.flush()
+
+        changes = store.changes_since(since)
+        assert [(book_id, book) for _, book_id, book in changes] == [('a', None)]
+        assert inner.changes_since(since) == changes
+        assert store.version == inner.version == changes[-1][0]
+        assert inner.get('a') is None
+    finally:
+        store.close()
+
+
+def test_plain_delete_of_missing_book_is_not_recorded(inner):
+    version = inner.version
+    assert inner.delete('missing') is False
+    assert inner.version == version
+    assert inner.changes_since(version) == []
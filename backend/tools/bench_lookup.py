@@ -0,0 +1,172 @@
+"""ISBN の一括検索を、ローカルに立てた OpenBD・NDL の代わりのサーバーで計測する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.bench_lookup --isbns 10000
+
+次の3通りで同じ ISBN を検索し、1秒あたりの件数を比べる。
+    sequential: 1件ずつ NDLApi.get_book_by_isbn（LOOKUP_MODE=sequential）を呼ぶ従来の方法
+                （遅いため --sequential-sample 件だけ計測する）
+    batch:      NDLApi.get_books_by_isbns（OpenBD・NDL とも複数の ISBN をまとめて問い合わせる）
+    async:      AsyncLookup.lookup_many（OpenBD・NDL への問い合わせを並行に送る）
+代わりのサーバーは --miss-ratio の割合の ISBN を OpenBD では見つからないものとして
+返し、NDL への問い合わせを発生させる。各応答には --latency-ms の遅延を入れる。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from common.async_lookup import AsyncLookup
+from storage.metadata_cache import MetadataCache
+
+NDL_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<searchRetrieveResponse xmlns="http://www.loc.gov/zing/srw/">
+  <numberOfRecords>{count}</numberOfRecords>
+  <records>{records}</records>{next_position}
+</searchRetrieveResponse>
+"""
+NDL_RECORD = """<record><recordData>
+    <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+             xmlns:dc="http://purl.org/dc/elements/1.1/"
+             xmlns:dcterms="http://purl.org/dc/terms/"
+             xmlns:dcndl="http://ndl.go.jp/dcndl/terms/">
+      <dcndl:BibResource>
+        <dcterms:identifier rdf:datatype="http://ndl.go.jp/dcndl/terms/ISBN">{isbn}</dcterms:identifier>
+        <dcterms:title>国会図書館の書籍 {isbn}</dcterms:title>
+        <dc:creator>著者 {isbn}</dc:creator>
+        <dc:publisher>出版社</dc:publisher>
+        <dcterms:date>2020</dcterms:date>
+        <dcterms:extent>320p ; 19cm</dcterms:extent>
+      </dcndl:BibResource>
+    </rdf:RDF>
+  </recordData></record>"""
+
+
+def make_handler(miss_ratio, latency):
+    def in_openbd(isbn):
+        return random.Random(isbn).random() >= miss_ratio
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # ヘッダーと本文を1回で送り、Nagle と遅延 ACK による待ちを避ける
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, content_type, body):
+            time.sleep(latency)
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _openbd(self, isbns):
+            data = [
+                {'summary': {'isbn': isbn, 'title': f'書籍 {isbn}', 'author': '著者', 'publisher': '出版社',
+                             'pubdate': '2020-01', 'extent': '256p', 'cover': ''}}
+                if in_openbd(isbn) else None
+                for isbn in isbns
+            ]
+            self._send('application/json', json.dumps(data, ensure_ascii=False))
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            if parts.path == '/openbd':
+                self._openbd(query['isbn'][0].split(','))
+            else:
+                # isbn="..." OR isbn="..." の各 ISBN に1件ずつレコードを返す（ページ分割あり）
+                isbns = query['query'][0].split('"')[1::2]
+                start = int(query.get('startRecord', ['1'])[0])
+                size = int(query.get('maximumRecords', ['1'])[0])
+                page = isbns[start - 1:start - 1 + size]
+                next_position = start + size
+                self._send('application/xml', NDL_RESPONSE.format(
+                    count=len(isbns),
+                    records=''.join(NDL_RECORD.format(isbn=isbn) for isbn in page),
+                    next_position=(f'<nextRecordPosition>{next_position}</nextRecordPosition>'
+                                   if next_position <= len(isbns) else '')
+                ))
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            form = parse_qs(self.rfile.read(length).decode('ascii'))
+            self._openbd(form['isbn'][0].split(','))
+
+    return StandInHandler
+
+
+def start_server(miss_ratio, latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(miss_ratio, latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_api(base_url, batch_size):
+    os.environ['LOOKUP_MODE'] = 'sequential'
+    os.environ['OPENBD_BATCH_SIZE'] = str(batch_size)
+    from api.ndl_api import NDLApi
+    api = NDLApi(cache=MetadataCache(), negative_cache=MetadataCache(table='negative'))
+    api.openbd_url = f"{base_url}/openbd"
+    api.base_url = f"{base_url}/ndl"
+    return api
+
+
+def report(label, count, seconds, found):
+    print(f"{label:<10} {count:>6} 件  {seconds:8.2f} s  {count / seconds:9.1f} 件/s  （見つかった {found} 件）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ISBN 一括検索のスループットを計測します')
+    parser.add_argument('--isbns', type=int, default=10000)
+    parser.add_argument('--sequential-sample', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--miss-ratio', type=float, default=0.3)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--per-host', type=int, default=8)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.miss_ratio, args.latency_ms / 1000)
+    isbns = [f"978{i:010d}" for i in range(args.isbns)]
+    print(f"ISBN {args.isbns} 件 / OpenBD になし {args.miss_ratio:.0%} / 応答遅延 {args.latency_ms:.0f} ms")
+
+    api = make_api(base_url, args.batch_size)
+    sample = isbns[:args.sequential_sample]
+    started = time.perf_counter()
+    found = sum(1 for isbn in sample if api.get_book_by_isbn(isbn))
+    report('sequential', len(sample), time.perf_counter() - started, found)
+
+    api = make_api(base_url, args.batch_size)
+    started = time.perf_counter()
+    results = api.get_books_by_isbns(isbns)
+    report('batch', len(isbns), time.perf_counter() - started,
+           sum(1 for status, _ in results.values() if status == 'found'))
+
+    api = make_api(base_url, args.batch_size)
+    lookup = AsyncLookup(
+        api.cache, api.negative_cache, api.openbd_url, api.parse_openbd, batch_size=args.batch_size,
+        ndl_url=api.base_url, ndl_params=api.ndl_params, parse_ndl=api.parse_ndl,
+        concurrency=args.concurrency, limit_per_host=args.per_host
+    )
+    started = time.perf_counter()
+    results = asyncio.run(lookup.lookup_many(isbns))
+    report('async', len(isbns), time.perf_counter() - started,
+           sum(1 for status, _ in results.values() if status == 'found'))
+    print(f"接続数: {lookup.stats()}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""OpenBD の応答から書籍情報を取り出す処理を、記録済みの応答（tools/fixtures）で計測する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.bench_openbd --records 5000
+
+フィクスチャの各件を --records 件になるまで繰り返し、従来の方法（項目ごとに summary と
+ONIX を isinstance と try/except で掘る）と openbd_book（項目ごとに summary を
+先に見て、空のときだけ ONIX をたどる）の1件あたりの時間を比べる。両者の結果が食い違う件数も表示する。
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from common.openbd import openbd_book
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'openbd_get.json')
+
+
+def load_records(count):
+    with open(FIXTURE, encoding='utf-8') as f:
+        fixture = json.load(f)
+    # 同じ dict を使い回さないよう、件ごとに読み直したものを作る
+    encoded = [json.dumps(record, ensure_ascii=False) for record in fixture]
+    return [json.loads(encoded[i % len(encoded)]) for i in range(count)]
+
+
+def legacy_book(isbn, book_info):
+    # 変更前の api/index.py の OpenBDApi.build_book と同じ方法で取り出す
+    summary = book_info.get('summary', {})
+    onix = book_info.get('onix', {})
+    return {
+        'isbn': isbn,
+        'title': legacy_title(onix, summary),
+        'author': legacy_author(onix, summary),
+        'publisher': legacy_publisher(onix, summary),
+        'pubdate': legacy_pubdate(onix, summary),
+        'totalPages': legacy_pages(onix, summary),
+        'coverImage': legacy_cover_image(onix, summary),
+        'currentPage': 0,
+        'readingTime': 0
+    }
+
+
+def legacy_title(onix, summary):
+    title = summary.get('title', '')
+    if title:
+        return title
+    try:
+        title_detail = onix.get('DescriptiveDetail', {}).get('TitleDetail', {})
+        if isinstance(title_detail, dict):
+            title_element = title_detail.get('TitleElement', {})
+            if isinstance(title_element, dict):
+                title_text = title_element.get('TitleText', {})
+                if isinstance(title_text, dict):
+                    return title_text.get('content', '')
+    except Exception:
+        pass
+    return ''
+
+
+def legacy_publisher(onix, summary):
+    publisher = summary.get('publisher', '')
+    if publisher:
+        return publisher
+    try:
+        publishing_detail = onix.get('PublishingDetail', {})
+        if isinstance(publishing_detail, dict):
+            publishers = publishing_detail.get('Publisher', [])
+            if isinstance(publishers, list) and len(publishers) > 0:
+                publisher_name = publishers[0].get('PublisherName', '')
+                if publisher_name:
+                    return publisher_name
+    except Exception:
+        pass
+    return ''
+
+
+def legacy_author(onix, summary):
+    author = summary.get('author', '')
+    if author:
+        return author
+    try:
+        contributors = onix.get('DescriptiveDetail', {}).get('Contributor', [])
+        if isinstance(contributors, list) and len(contributors) > 0:
+            for contributor in contributors:
+                contributor_roles = contributor.get('ContributorRole', [])
+                if isinstance(contributor_roles, list):
+                    if 'A01' in contributor_roles:
+                        person_name = contributor.get('PersonName', {})
+                        if isinstance(person_name, dict):
+                            return person_name.get('content', '')
+                        elif isinstance(person_name, str):
+                            return person_name
+                elif contributor_roles == 'A01':
+                    person_name = contributor.get('PersonName', {})
+                    if isinstance(person_name, dict):
+                        return person_name.get('content', '')
+                    elif isinstance(person_name, str):
+                        return person_name
+            person_name = contributors[0].get('PersonName', {})
+            if isinstance(person_name, dict):
+                return person_name.get('content', '')
+            elif isinstance(person_name, str):
+                return person_name
+    except Exception:
+        pass
+    return ''
+
+
+def legacy_pages(onix, summary):
+    extent = summary.get('extent', '')
+    if extent:
+        pages = legacy_pages_from_text(extent)
+        if pages > 0:
+            return pages
+    try:
+        extents = onix.get('DescriptiveDetail', {}).get('Extent', [])
+        if isinstance(extents, list):
+            for extent in extents:
+                if extent.get('ExtentType') == '00':
+                    extent_value = extent.get('ExtentValue', '')
+                    if extent_value and extent_value.isdigit():
+                        return int(extent_value)
+    except Exception:
+        pass
+    return 0
+
+
+def legacy_pubdate(onix, summary):
+    pubdate = summary.get('pubdate', '')
+    if pubdate:
+        return pubdate
+    try:
+        pub_dates = onix.get('PublishingDetail', {}).get('PublishingDate', [])
+        if isinstance(pub_dates, list):
+            for pub_date in pub_dates:
+                if pub_date.get('PublishingDateRole') == '01':
+                    date_value = pub_date.get('Date', '')
+                    if date_value:
+                        return date_value
+    except Exception:
+        pass
+    return ''
+
+
+def legacy_cover_image(onix, summary):
+    cover = summary.get('cover', '')
+    if cover:
+        return cover
+    try:
+        collateral_detail = onix.get('CollateralDetail', {})
+        supporting_resources = collateral_detail.get('SupportingResource', [])
+        if isinstance(supporting_resources, list):
+            for resource in supporting_resources:
+                if resource.get('ResourceContentType') == '01':
+                    versions = resource.get('ResourceVersion', [])
+                    if isinstance(versions, list):
+                        for version in versions:
+                            links = version.get('ResourceLink', [])
+                            if isinstance(links, list) and len(links) > 0:
+                                return links[0]
+    except Exception:
+        pass
+    return ''
+
+
+def legacy_pages_from_text(text):
+    for pattern in [r'(\d+)p\b', r'(\d+)ページ', r'(\d+)頁', r'(\d+)\s*p\b', r'(\d+)\s*pages?']:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return int(match.group(1))
+    numbers = re.findall(r'\d+', text)
+    return int(numbers[0]) if numbers else 0
+
+
+def measure(build, records, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        books = [build(record['summary']['isbn'], record) for record in records]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return books, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenBD の応答からの書籍情報の取り出しを計測します')
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    records = load_records(args.records)
+    print(f"{len(records)} 件（フィクスチャ {FIXTURE}）")
+    results = {}
+    for label, build in (('legacy', legacy_book), ('table', openbd_book)):
+        books, best = measure(build, records, args.repeat)
+        results[label] = books
+        print(f"{label:<7} {best * 1e6 / len(records):8.2f} µs/件")
+
+    differing = [
+        (old, new) for old, new in zip(results['legacy'], results['table']) if old != new
+    ]
+    print(f"結果の異なる件数: {len(differing)}")
+    seen = set()
+    for old, new in differing:
+        if old['isbn'] in seen:
+            continue
+        seen.add(old['isbn'])
+        fields = [key for key in old if old[key] != new[key]]
+        print(f"  {old['isbn']}: " + ', '.join(f"{key} {old[key]!r} -> {new[key]!r}" for key in fields))
+
+
+if __name__ == '__main__':
+    main()
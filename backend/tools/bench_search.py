@@ -0,0 +1,116 @@
+"""蔵書の全文検索（LibrarySearch）を、合成した大量のタイトルで計測する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.bench_search --books 1000000
+
+語の一覧を組み合わせてタイトル・著者・出版社を作り、メモリ上のストレージに登録したうえで
+索引の作成時間とメモリ、検索の応答時間（中央値・p95）、1件ずつの追加・更新・削除の時間を測る。
+比較として、全件を正規化して部分文字列で探す方法（クライアント側での絞り込みに相当）の時間も表示する。
+"""
+import argparse
+import random
+import resource
+import statistics
+import time
+
+from common.library_search import LibrarySearch, normalize_text
+from storage import MemoryStore
+
+WORDS = [
+    '吾輩', '猫', '森', '海', '夜', '星', '東京', '京都', '物語', '歴史', '入門', '旅', '殺人', '事件',
+    '少年', '少女', '魔法', '戦争', '平和', '経済', '哲学', '科学', '宇宙', '料理', '庭', '花', '風', '雪',
+    'こころ', 'ひかり', 'あした', 'むかし', 'ことば', 'ノルウェイ', 'コーヒー', 'プログラミング',
+    'データ', 'ネットワーク', 'ミステリー', 'ファンタジー', 'Python', 'Web', 'AI', '統計', '心理', '文学',
+]
+PARTICLES = ['の', 'と', 'は', 'を', 'へ', '']
+SURNAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '夏目', '村上']
+GIVEN_NAMES = ['太郎', '花子', '一郎', '美咲', '健', '陽子', '漱石', '春樹', '翔', '愛']
+PUBLISHERS = ['新潮社', '岩波書店', '講談社', '文藝春秋', 'KADOKAWA', '集英社', '筑摩書房', 'オーム社', '技術評論社']
+QUERIES = ['猫', '吾輩', '東京 物語', 'ノルウェイの森', 'のるうぇい', 'python', 'ＰＹＴＨＯＮ 入門',
+           '夏目', '村上春樹', '新潮', '殺人事件', '宇宙の歴史', 'コーヒーと哲学', 'みすてりー']
+
+
+def make_books(count, seed=1):
+    rng = random.Random(seed)
+    books = []
+    for i in range(count):
+        words = [rng.choice(WORDS) + rng.choice(PARTICLES) for _ in range(rng.randint(1, 4))]
+        books.append({
+            'id': f'b{i}',
+            'title': ''.join(words) + (f' {rng.randint(1, 20)}' if rng.random() < 0.2 else ''),
+            'author': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+            'publisher': rng.choice(PUBLISHERS),
+            'isbn': '',
+        })
+    return books
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='蔵書の全文検索を計測します')
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--updates', type=int, default=2000)
+    args = parser.parse_args()
+
+    books = make_books(args.books)
+    store = MemoryStore()
+    store.put_many(books)
+    before = rss_mb()
+
+    search = LibrarySearch(store)
+    started = time.perf_counter()
+    search.search('猫', limit=1)
+    built = time.perf_counter() - started
+    stats = search.stats()
+    print(f"{args.books} 冊: 索引の作成 {built:.1f} 秒、語 {stats['terms']}、出現 {stats['postings']}、"
+          f"メモリ +{rss_mb() - before:.0f} MB")
+
+    print(f"{'検索語':<16} {'件数':>8} {'中央値':>9} {'p95':>9} {'全件走査':>9}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            _, total, _ = search.search(query, limit=20)
+            timings.append(time.perf_counter() - started)
+
+        # 比較: 全件を正規化して部分文字列で探す（語はすべて含むもの）
+        words = normalize_text(query).split()
+        started = time.perf_counter()
+        for book in store.iter_all():
+            text = normalize_text(f"{book['title']} {book['author']} {book['publisher']}")
+            all(word in text for word in words)
+        scan = time.perf_counter() - started
+        print(f"{query:<16} {total:>8} {statistics.median(timings) * 1000:7.2f}ms "
+              f"{percentile(timings, 0.95) * 1000:7.2f}ms {scan * 1000:7.0f}ms")
+
+    rng = random.Random(2)
+    new_books = make_books(args.updates, seed=3)
+    for phase in ('add', 'update', 'remove'):
+        started = time.perf_counter()
+        for i, book in enumerate(new_books):
+            if phase == 'add':
+                search.add(dict(book, id=f'new{i}'))
+            elif phase == 'update':
+                target = f'b{rng.randrange(args.books)}'
+                search.add(dict(store.get(target), title=book['title']))
+            else:
+                search.remove(f'new{i}')
+        elapsed = time.perf_counter() - started
+        print(f"{phase:<7} {elapsed / args.updates * 1e6:8.1f} µs/冊")
+
+    started = time.perf_counter()
+    search._compact()
+    print(f"欠番の詰め直し {time.perf_counter() - started:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
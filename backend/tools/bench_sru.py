@@ -0,0 +1,88 @@
+"""NDL サーチの SRU 応答の解析を、記録済みの応答（tools/fixtures）で計測する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.bench_sru --records 2000
+
+フィクスチャのレコードを --records 件になるまで繰り返した応答を作り、
+従来の方法（ET.fromstring で木全体を作り、項目ごとに .// で探す）と
+SRUResponse（64KB ずつ XMLParser に渡し、木を作らずに1回の走査で項目だけを拾う）の
+1レコードあたりの時間と、解析中のメモリ使用量のピークを比べる。
+"""
+import argparse
+import os
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from common.sru import SRUResponse
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ndl_sru_dcndl.xml')
+CHUNK_SIZE = 64 * 1024
+
+NS = {
+    'srw': 'http://www.loc.gov/zing/srw/',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'dcndl': 'http://ndl.go.jp/dcndl/terms/',
+}
+
+
+def build_response(count):
+    with open(FIXTURE, 'rb') as f:
+        fixture = f.read()
+    head, rest = fixture.split(b'<records>', 1)
+    body, tail = rest.split(b'</records>', 1)
+    records = [f'<record>{part}'.encode('utf-8') for part in body.decode('utf-8').split('<record>')[1:]]
+    repeated = b''.join(records[i % len(records)].rstrip() for i in range(count))
+    return head + b'<records>' + repeated + b'</records>' + tail
+
+
+def parse_tree(content):
+    # 変更前の NDLApi.get_from_ndl と同じ方法で、すべてのレコードを取り出す
+    root = ET.fromstring(content)
+    books = []
+    for record in root.findall('.//srw:record', NS):
+        fields = {}
+        for name, path in (('title', './/dc:title'), ('creator', './/dc:creator'),
+                           ('publisher', './/dc:publisher'), ('date', './/dc:date'),
+                           ('extent', './/dcndl:extent')):
+            elem = record.find(path, NS)
+            fields[name] = elem.text if elem is not None else ''
+        books.append(fields)
+    return len(books)
+
+
+def parse_stream(content):
+    chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+    return sum(1 for _ in SRUResponse(chunks))
+
+
+def measure(parse, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = parse(content)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SRU 応答の解析時間とメモリを計測します')
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    content = build_response(args.records)
+    print(f"応答 {len(content) / 1024:.0f} KB / {args.records} レコード")
+    for label, parse in (('tree', parse_tree), ('stream', parse_stream)):
+        count, best, peak = measure(parse, content, args.repeat)
+        print(f"{label:<7} {count:>6} 件  {best * 1e6 / count:8.1f} µs/レコード  ピーク {peak / 1024:9.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
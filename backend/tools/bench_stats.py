@@ -0,0 +1,83 @@
+"""GET /api/stats の集計処理を大量の書籍で計測する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.bench_stats --books 1000000
+
+LibraryStats を MemoryStore の上で動かし、次の3つを計測する。
+- 初回: 全件からの列配列の作成と集計（起動後、または変更履歴から差分を取れないときだけ）
+- 保存後: 1冊を保存してから GET /api/stats と同じ summary を呼ぶ（変更分だけ列配列を更新して集計）
+- 集計のみ: 変更のない列配列からの集計（top を変えて結果のキャッシュを外す）
+保存後と集計のみの最良値が --budget-ms を超えたら、また NumPy がなければ、終了コード 1 を返す。
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import library_stats
+from common.library_stats import LibraryStats, compute_stats
+from storage import MemoryStore
+
+
+def generate_books(count, seed=0):
+    rng = random.Random(seed)
+    now = datetime.now()
+    publishers = [f'出版社{i}' for i in range(2000)]
+    authors = [f'著者{i}' for i in range(50000)]
+    for i in range(count):
+        total = rng.randint(100, 800)
+        yield {
+            'id': str(i),
+            'title': f'書籍{i}',
+            'publisher': rng.choice(publishers),
+            'author': rng.choice(authors),
+            'totalPages': total,
+            'currentPage': rng.choice((0, total, rng.randint(1, total))),
+            'readingTime': rng.randint(0, 36000),
+            'created_at': (now - timedelta(days=rng.randint(0, 1000))).isoformat(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='蔵書統計の計算時間を計測します')
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    store = MemoryStore()
+    store.put_many(generate_books(args.books))
+    stats = LibraryStats(store)
+
+    started = time.perf_counter()
+    summary = stats.summary()
+    build_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(1)
+    saves = []
+    for _ in range(args.repeat):
+        book = dict(store.get(str(rng.randrange(args.books))))
+        book['currentPage'] = min(book['currentPage'] + 10, book['totalPages'])
+        store.put(book)
+        started = time.perf_counter()
+        stats.summary()
+        saves.append((time.perf_counter() - started) * 1000)
+
+    timings = []
+    for top in range(args.repeat):
+        started = time.perf_counter()
+        compute_stats(stats._columns, library_stats.DEFAULT_TOP + top)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(f"engine: {summary['engine']}  books: {summary['books']}")
+    print(f"初回（列配列の作成と集計）: {build_ms:.1f} ms")
+    print(f"保存後: best {min(saves):.1f} ms / avg {sum(saves) / len(saves):.1f} ms（目標 {args.budget_ms:.0f} ms）")
+    print(f"集計のみ: best {min(timings):.1f} ms / avg {sum(timings) / len(timings):.1f} ms（目標 {args.budget_ms:.0f} ms）")
+    if library_stats.np is None:
+        print("NumPy がインストールされていません（pip install -r requirements.txt）。目標は NumPy での値です")
+        sys.exit(1)
+    sys.exit(0 if max(min(saves), min(timings)) <= args.budget_ms else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""OpenBD の一括データ・NDL サーチの SRU 応答から、ローカルの書誌索引（Catalogue）を作る
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.ingest_catalogue --db ../data/catalogue.db --openbd openbd_dump.json.gz
+    python -m tools.ingest_catalogue --db ../data/catalogue.db --ndl tools/fixtures/*.xml
+
+--openbd は /v1/get の応答と同じ形の JSON 配列、または1行1件の NDJSON（.gz も可）。
+--ndl は recordPacking=xml の SRU 応答の XML ファイル。
+どちらもファイルを少しずつ読み、--batch-size 件ごとに書き込むので、メモリはファイルの
+大きさによらない。前回から変わっていないファイルは読み飛ばし（--force で読み直す）、
+同じ ISBN は OpenBD を NDL より優先し、同じ出典なら更新日時の新しいものだけで置き換える。
+"""
+import argparse
+import gzip
+import os
+import resource
+import time
+from itertools import islice
+
+from common.isbn import canonical_isbn
+from common.ndjson import iter_json_values
+from common.openbd import openbd_book
+from common.sru import SRUResponse, sru_book
+from storage.catalogue import Catalogue
+
+CHUNK_SIZE = 64 * 1024
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def openbd_entries(path, counters):
+    with open_text(path) as f:
+        for record in iter_json_values(f, CHUNK_SIZE):
+            counters['records'] += 1
+            if not isinstance(record, dict):
+                # /v1/get の応答では見つからない ISBN は null
+                continue
+            summary = record.get('summary') or {}
+            isbn = summary.get('isbn')
+            if not isbn:
+                product = (record.get('onix') or {}).get('ProductIdentifier') or {}
+                isbn = product.get('IDValue')
+            isbn = canonical_isbn(isbn)
+            if isbn is None:
+                counters['invalid'] += 1
+                continue
+            modified = (record.get('hanmoto') or {}).get('datemodified', '')
+            yield isbn, openbd_book(isbn, record), modified
+
+
+def ndl_entries(path, counters):
+    with open(path, 'rb') as f:
+        chunks = iter(lambda: f.read(CHUNK_SIZE), b'')
+        for record in SRUResponse(chunks):
+            counters['records'] += 1
+            isbns = {canonical_isbn(identifier) for identifier in record['isbns']}
+            isbns.discard(None)
+            if not isbns:
+                counters['invalid'] += 1
+            for isbn in sorted(isbns):
+                yield isbn, sru_book(isbn, record), ''
+
+
+def ingest(catalogue, path, source, batch_size, force=False):
+    """1つのファイルを取り込み、件数をまとめた dict を返す（変わっていなければ None）"""
+    if not force and catalogue.source_unchanged(path):
+        return None
+    counters = {'records': 0, 'invalid': 0, 'written': 0}
+    entries = (openbd_entries if source == 'openbd' else ndl_entries)(path, counters)
+    # 更新日時を持たない SRU 応答は、ファイルの更新日時で新旧を比べる
+    modified = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.stat(path).st_mtime))
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            break
+        counters['written'] += catalogue.put_many(batch, source, modified)
+    catalogue.mark_source(path, counters['records'])
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ローカルの書誌索引を作成・更新します')
+    parser.add_argument('--db', default=os.getenv('BOOK_CATALOGUE_FILE', '../data/catalogue.db'))
+    parser.add_argument('--openbd', nargs='*', default=[], help='OpenBD 形式の JSON / NDJSON（.gz 可）')
+    parser.add_argument('--ndl', nargs='*', default=[], help='NDL サーチの SRU 応答（XML）')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--force', action='store_true', help='変わっていないファイルも読み直す')
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.db, readonly=False)
+    started = time.perf_counter()
+    total = 0
+    for source, paths in (('openbd', args.openbd), ('ndl', args.ndl)):
+        for path in paths:
+            file_started = time.perf_counter()
+            counters = ingest(catalogue, path, source, args.batch_size, args.force)
+            if counters is None:
+                print(f"{path}: 前回から変更なし")
+                continue
+            total += counters['records']
+            elapsed = time.perf_counter() - file_started
+            print(f"{path}: {counters['records']} 件（書き込み {counters['written']}、ISBN なし・不正 "
+                  f"{counters['invalid']}）{elapsed:.1f} 秒")
+
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"合計 {total} 件 {elapsed:.1f} 秒（{total / elapsed if elapsed else 0:.0f} 件/秒）、"
+          f"索引 {catalogue.count()} 件、最大メモリ {peak:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
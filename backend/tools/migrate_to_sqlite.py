@@ -0,0 +1,39 @@
+"""books.json（＋追記ログ）の内容を SQLite データベースへ移行する
+
+使い方（backend ディレクトリで実行）:
+    python -m tools.migrate_to_sqlite --source ../data/books.json --db ../data/books.db
+"""
+import argparse
+
+from storage import DEFAULT_DATA_FILE, DEFAULT_SQLITE_FILE
+from storage.journal import JournalStore
+from storage.sqlite_store import SQLiteStore
+
+
+def migrate(source, db_file, batch_size=1000):
+    # JournalStore で読むことで、圧縮前のログに残っている変更も取り込める
+    journal = JournalStore(source)
+    books = journal.all()
+    journal.close()
+
+    store = SQLiteStore(db_file)
+    for start in range(0, len(books), batch_size):
+        store.put_many(books[start:start + batch_size])
+    store.close()
+
+    return len(books)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='books.json を SQLite に移行します')
+    parser.add_argument('--source', default=DEFAULT_DATA_FILE, help='移行元の books.json')
+    parser.add_argument('--db', default=DEFAULT_SQLITE_FILE, help='移行先の SQLite ファイル')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    count = migrate(args.source, args.db, args.batch_size)
+    print(f"{count} 件の書籍を {args.db} に移行しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -32,9 +32,17 @@ class Book {
         return `${hours.toString().padStart(2, '0')}:${minutes.toString().padStart(2, '0')}:${secs.toString().padStart(2, '0')}`;
     }
 
+    getCoverImageSrc() {
+        if (!this.coverImage) return '';
+        if (!this.isbn) return this.coverImage;
+        // 縮小版を API のキャッシュから返す（第三者のサーバーから原寸を毎回取得しない）
+        const path = `/api/cover/${encodeURIComponent(this.isbn)}?size=small`;
+        return window.location.hostname === 'localhost' ? `http://localhost:5000${path}` : path;
+    }
+
     render() {
         const progress = this.getProgress();
-        const coverImageSrc = this.coverImage || '';
+        const coverImageSrc = this.getCoverImageSrc();
         
         return `
             <div class="book-item" data-book-id="${this.id}">